@@ -17,9 +17,21 @@ import time
 import threading
 import sqlite3
 import hashlib
+import queue
+import mmap
+import heapq
+import itertools
+import collections
+import struct
 import json
 import csv
+import re
+import fnmatch
 import datetime
+import zipfile
+import tarfile
+import zlib
+import io
 
 from concurrent.futures import ThreadPoolExecutor
 
@@ -29,8 +41,9 @@ from PyQt5.QtCore import (QCoreApplication, QThread, pyqtSignal, Qt, QWaitCondit
 from PyQt5.QtGui import QIcon, QFont, QPixmap, QColor, QIntValidator
 from PyQt5.QtWidgets import (QStyle, QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel,
                              QLineEdit, QPushButton, QFileDialog, QListWidget, QListWidgetItem, QComboBox, QMessageBox, QProgressBar,
-                             QDialog, QTableWidget, QTableWidgetItem, QHeaderView, QInputDialog,
-                             QGraphicsDropShadowEffect, QGroupBox, QTabWidget, QTextEdit, QSplitter, QScrollBar)
+                             QDialog, QTableWidget, QTableWidgetItem, QHeaderView, QInputDialog, QTreeWidget, QTreeWidgetItem,
+                             QGraphicsDropShadowEffect, QGroupBox, QTabWidget, QTextEdit, QSplitter, QScrollBar,
+                             QCheckBox)
 # For optional media sound effect in splash (if desired)
 from PyQt5.QtMultimedia import QSoundEffect
 
@@ -50,6 +63,11 @@ try:
     import openpyxl
 except ImportError:
     openpyxl = None
+# FIEMAP (physical file offsets) needs fcntl.ioctl, which only exists on POSIX
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # ---------------- Helper: Internal Icon Provider ----------------
 def get_icon(name, widget):
@@ -352,8 +370,27 @@ class ContemporaryChartWidget(QWidget):
         self.log_area.setPlainText(new_text)
 # ---------------- Database Manager ----------------
 class DatabaseManager:
-    def __init__(self):
-        self.conn = sqlite3.connect('file_search.db', check_same_thread=False)
+    # One content index (schema v5): path -> digest for every hashed file, stored as a directories.id
+    # plus basename with an interned extension and a 32-byte BLOB digest. status marks rows that
+    # matched a searched hash (History); search_sessions/search_hits record what each search found.
+    STATUS_INDEXED = 0
+    STATUS_MATCHED = 1
+    def __init__(self, db_path='file_search.db', digest_index=None):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._local = threading.local()
+        self._dir_ids = {}
+        self._ext_ids = {}
+        # Optional mmap'd digest index for smart lookups: True builds it on first use,
+        # None uses it only once some instance has built it, False never touches it
+        self.digests = DigestIndex(db_path + '.digests')
+        self.digest_index = digest_index
+        self._digest_lock = threading.Lock()
+        # Only takes effect for a new file; existing ones are switched by the first compact()
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL lets the search threads append while the GUI reads, with far fewer fsyncs per commit
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
         self._init_db()
     def _init_db(self):
         tables = {
@@ -376,52 +413,2034 @@ class DatabaseManager:
                 )
             '''
         }
-        with self.conn:
-            for schema in tables.values():
-                self.conn.execute(schema)
-    def save_record(self, table_name, file_path, file_hash, extension):
-        try:
+        # The pre-v1 layout is only created for new files; the migrations build the current one from it
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] == 0:
             with self.conn:
-                self.conn.execute(
-                    f'''INSERT OR IGNORE INTO {table_name}
-                    (file_path, file_hash, extension)
-                    VALUES (?, ?, ?)''',
-                    (file_path, file_hash, extension)
+                for schema in tables.values():
+                    self.conn.execute(schema)
+        self._migrate()
+    def _migrate(self):
+        # Upgrade existing file_search.db files in place, one version at a time
+        migrations = [self._migrate_v1, self._migrate_v2, self._migrate_v3, self._migrate_v4, self._migrate_v5,
+                      self._migrate_v6, self._migrate_v7, self._migrate_v8,
+                      self._migrate_v9, self._migrate_v10, self._migrate_v11, self._migrate_v12,
+                      self._migrate_v13, self._migrate_v14, self._migrate_v15, self._migrate_v16,
+                      self._migrate_v17]
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in enumerate(migrations[version:], start=version + 1):
+            try:
+                self.conn.execute("BEGIN")
+                migration()
+                self.conn.execute(f"PRAGMA user_version = {target}")
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                self._forget_ids()
+                raise Exception(f"Database migration error (v{target}): {str(e)}")
+        if 0 < version < 4 <= len(migrations):
+            # The text-layout pages freed by v4 are returned to the file system once
+            self.conn.execute("VACUUM")
+    def _migrate_v1(self):
+        # Indexes for hash lookups (SmartCheckThread) and history listing/filtering
+        for table in ('search_history', 'non_matching_hashes'):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_file_hash ON {table}(file_hash)")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_extension ON {table}(extension)")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_search_date ON {table}(search_date)")
+    def _migrate_v2(self):
+        # File fingerprint (st_size, st_mtime_ns, st_ino, st_dev) recorded next to each hash
+        for table in ('search_history', 'non_matching_hashes'):
+            for column in ('file_size', 'mtime_ns', 'inode', 'device'):
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+    def _migrate_v3(self):
+        # Rows replaced because the file's content changed are kept here for auditing
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS hash_audit (
+                id INTEGER PRIMARY KEY,
+                source_table TEXT,
+                file_path TEXT,
+                file_hash TEXT,
+                extension TEXT,
+                file_size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                device INTEGER,
+                search_date TIMESTAMP,
+                superseded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_hash_audit_file_hash ON hash_audit(file_hash)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_hash_audit_file_path ON hash_audit(file_path)")
+    def _migrate_v4(self):
+        # Compact layout: BLOB digests, interned directories and extensions
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS directories (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS extensions (
+                id INTEGER PRIMARY KEY,
+                extension TEXT NOT NULL UNIQUE
+            )
+        ''')
+        for table in ('search_history', 'non_matching_hashes'):
+            self.conn.execute(f'''
+                CREATE TABLE {table}_v4 (
+                    id INTEGER PRIMARY KEY,
+                    dir_id INTEGER NOT NULL REFERENCES directories(id),
+                    name TEXT NOT NULL,
+                    ext_id INTEGER REFERENCES extensions(id),
+                    file_hash BLOB,
+                    file_size INTEGER,
+                    mtime_ns INTEGER,
+                    inode INTEGER,
+                    device INTEGER,
+                    search_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (dir_id, name)
                 )
+            ''')
+            cursor = self.conn.execute(f'''
+                SELECT file_path, file_hash, extension, file_size, mtime_ns, inode, device, search_date
+                FROM {table} ORDER BY id
+            ''')
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                self.conn.executemany(f'''
+                    INSERT OR IGNORE INTO {table}_v4
+                    (dir_id, name, ext_id, file_hash, file_size, mtime_ns, inode, device, search_date)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [self._compact_row(row[:7]) + (row[7],) for row in rows])
+            self.conn.execute(f"DROP TABLE {table}")
+            self.conn.execute(f"ALTER TABLE {table}_v4 RENAME TO {table}")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_file_hash ON {table}(file_hash)")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ext_id ON {table}(ext_id)")
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_search_date ON {table}(search_date)")
+            self._create_audit_trigger(table)
+        audit = self.conn.execute("SELECT id, file_hash FROM hash_audit").fetchall()
+        self.conn.executemany("UPDATE hash_audit SET file_hash = ? WHERE id = ?",
+                              [(self._to_blob(digest), row_id) for row_id, digest in audit])
+    def _migrate_v5(self):
+        # search_history and non_matching_hashes are merged into one content index; a row's table
+        # only said whether it matched the hash searched at the time, which is now status
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS file_index (
+                id INTEGER PRIMARY KEY,
+                dir_id INTEGER NOT NULL REFERENCES directories(id),
+                name TEXT NOT NULL,
+                ext_id INTEGER REFERENCES extensions(id),
+                file_hash BLOB,
+                file_size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                device INTEGER,
+                search_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                status INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (dir_id, name)
+            )
+        ''')
+        self._create_audit_trigger('file_index')
+        # Oldest first, so a path found in both tables keeps its most recent digest
+        self.conn.execute(f'''
+            INSERT INTO file_index
+            (dir_id, name, ext_id, file_hash, file_size, mtime_ns, inode, device, search_date, status)
+            SELECT dir_id, name, ext_id, file_hash, file_size, mtime_ns, inode, device, search_date, status FROM (
+                SELECT *, {self.STATUS_INDEXED} AS status FROM non_matching_hashes
+                UNION ALL
+                SELECT *, {self.STATUS_MATCHED} AS status FROM search_history
+            ) WHERE true
+            ORDER BY search_date, status
+            ON CONFLICT(dir_id, name) DO UPDATE SET
+                ext_id = excluded.ext_id, file_hash = excluded.file_hash,
+                file_size = excluded.file_size, mtime_ns = excluded.mtime_ns,
+                inode = excluded.inode, device = excluded.device, search_date = excluded.search_date,
+                status = CASE WHEN file_hash IS excluded.file_hash THEN max(status, excluded.status)
+                              ELSE excluded.status END
+        ''')
+        self.conn.execute("DROP TABLE search_history")
+        self.conn.execute("DROP TABLE non_matching_hashes")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_file_index_file_hash ON file_index(file_hash)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_file_index_ext_id ON file_index(ext_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_file_index_status ON file_index(status, search_date)")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS search_sessions (
+                id INTEGER PRIMARY KEY,
+                target_hash BLOB,
+                paths TEXT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP,
+                files_scanned INTEGER,
+                hits INTEGER
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS search_hits (
+                session_id INTEGER NOT NULL REFERENCES search_sessions(id),
+                file_id INTEGER NOT NULL REFERENCES file_index(id),
+                found_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (session_id, file_id)
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_search_hits_file_id ON search_hits(file_id)")
+    def _migrate_v6(self):
+        # file_index rows changed since the digest side file was last refreshed
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS digest_changes (
+                seq INTEGER PRIMARY KEY,
+                file_id INTEGER NOT NULL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_file_index_digest_insert AFTER INSERT ON file_index
+            BEGIN
+                INSERT INTO digest_changes (file_id) VALUES (NEW.id);
+            END
+        ''')
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_file_index_digest_update AFTER UPDATE OF file_hash ON file_index
+            WHEN OLD.file_hash IS NOT NEW.file_hash
+            BEGIN
+                INSERT INTO digest_changes (file_id) VALUES (NEW.id);
+            END
+        ''')
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_file_index_digest_delete AFTER DELETE ON file_index
+            BEGIN
+                INSERT INTO digest_changes (file_id) VALUES (OLD.id);
+            END
+        ''')
+    def _migrate_v7(self):
+        # Every digest a session searched for; search_sessions.target_hash stays set for single-hash searches
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS session_targets (
+                session_id INTEGER NOT NULL REFERENCES search_sessions(id),
+                target_hash BLOB NOT NULL,
+                PRIMARY KEY (session_id, target_hash)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute('''
+            INSERT OR IGNORE INTO session_targets (session_id, target_hash)
+            SELECT id, target_hash FROM search_sessions WHERE target_hash IS NOT NULL
+        ''')
+    def _migrate_v8(self):
+        # One row per maintenance run, for scheduling and reporting
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS maintenance_runs (
+                id INTEGER PRIMARY KEY,
+                finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                seconds REAL,
+                rows_checked INTEGER,
+                rows_pruned INTEGER,
+                bytes_before INTEGER,
+                bytes_after INTEGER
+            )
+        ''')
+    def _migrate_v9(self):
+        # Exclusion rules kept between sessions, in the order the user entered them
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS exclusion_rules (
+                position INTEGER PRIMARY KEY,
+                rule TEXT NOT NULL
+            )
+        ''')
+    def _migrate_v10(self):
+        # Hash concurrency the last scan settled on for each mount point, used as the next starting point
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS device_tuning (
+                mount TEXT PRIMARY KEY,
+                workers INTEGER NOT NULL,
+                rate REAL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    def _migrate_v11(self):
+        # Walk checkpoint of an unfinished session: every directory it has reached, done = 1 once the
+        # directory is listed and all of its files are hashed and committed. Cleared when the scan completes.
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS scan_frontier (
+                session_id INTEGER NOT NULL REFERENCES search_sessions(id),
+                path TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (session_id, path)
+            ) WITHOUT ROWID
+        ''')
+    def _migrate_v12(self):
+        # Member digests of archives searched inside, valid while the container's fingerprint is unchanged
+        # and for the same nesting depth; complete = 1 once every member has been stored
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS archives (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                file_size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                device INTEGER,
+                depth INTEGER NOT NULL,
+                complete INTEGER NOT NULL DEFAULT 0,
+                scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive_members (
+                archive_id INTEGER NOT NULL REFERENCES archives(id),
+                member TEXT NOT NULL,
+                member_size INTEGER,
+                file_hash BLOB NOT NULL,
+                PRIMARY KEY (archive_id, member)
+            ) WITHOUT ROWID
+        ''')
+    def _migrate_v13(self):
+        # Digests other than SHA-256 (MD5, SHA-1, BLAKE2b) computed in the same read; they belong to the
+        # content that file_hash describes, so they go when it changes or the row is deleted
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS file_digests (
+                file_id INTEGER NOT NULL REFERENCES file_index(id),
+                algorithm TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                PRIMARY KEY (file_id, algorithm)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_file_digests_digest ON file_digests(digest)")
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_file_digests_stale AFTER UPDATE OF file_hash ON file_index
+            WHEN OLD.file_hash IS NOT NEW.file_hash
+            BEGIN
+                DELETE FROM file_digests WHERE file_id = NEW.id;
+            END
+        ''')
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_file_digests_delete AFTER DELETE ON file_index
+            BEGIN
+                DELETE FROM file_digests WHERE file_id = OLD.id;
+            END
+        ''')
+    def _migrate_v14(self):
+        # LSH buckets of the similarity hashes (file_digests algorithm 'ctph'): a file is a candidate for a
+        # query when they share a bucket, so finding similar files never compares against the whole index
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS fuzzy_index (
+                bucket INTEGER NOT NULL,
+                file_id INTEGER NOT NULL REFERENCES file_index(id),
+                PRIMARY KEY (bucket, file_id)
+            ) WITHOUT ROWID
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_fuzzy_index_file_id ON fuzzy_index(file_id)")
+        self.conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_fuzzy_index_stale AFTER DELETE ON file_digests
+            WHEN OLD.algorithm = 'ctph'
+            BEGIN
+                DELETE FROM fuzzy_index WHERE file_id = OLD.file_id;
+            END
+        ''')
+    def _migrate_v15(self):
+        # Files counted in each finished frontier directory, so that a resumed scan counts every file once
+        self.conn.execute("ALTER TABLE scan_frontier ADD COLUMN files INTEGER NOT NULL DEFAULT 0")
+    def _migrate_v16(self):
+        # Members in the other selected algorithms, so that an MD5 or SHA-1 target also matches a cached
+        # member; algorithms lists the ones every member of the archive was hashed with
+        self.conn.execute("ALTER TABLE archives ADD COLUMN algorithms TEXT NOT NULL DEFAULT 'sha256'")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS archive_member_digests (
+                archive_id INTEGER NOT NULL REFERENCES archives(id),
+                member TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                PRIMARY KEY (archive_id, member, algorithm)
+            ) WITHOUT ROWID
+        ''')
+    def _migrate_v17(self):
+        # Hash of the filters a scan ran with: a stopped scan is only resumed with the same ones
+        self.conn.execute("ALTER TABLE search_sessions ADD COLUMN scan_key TEXT")
+    def _create_audit_trigger(self, table):
+        # A hash replaced in place by the upsert is archived without an extra lookup per row
+        self.conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_audit
+            AFTER UPDATE OF file_hash ON {table}
+            WHEN OLD.file_hash IS NOT NEW.file_hash
+            BEGIN
+                INSERT INTO hash_audit (source_table, file_path, file_hash, extension,
+                                        file_size, mtime_ns, inode, device, search_date)
+                VALUES ('{table}',
+                        (SELECT CASE WHEN path = '' THEN OLD.name
+                                     WHEN substr(path, -1) IN ('/', '\\') THEN path || OLD.name
+                                     ELSE path || '{os.sep}' || OLD.name END
+                         FROM directories WHERE id = OLD.dir_id),
+                        OLD.file_hash,
+                        (SELECT extension FROM extensions WHERE id = OLD.ext_id),
+                        OLD.file_size, OLD.mtime_ns, OLD.inode, OLD.device, OLD.search_date);
+            END
+        ''')
+    @staticmethod
+    def _to_blob(file_hash):
+        # Hex digests are stored as raw bytes; anything that is not hex is kept as text
+        try:
+            return bytes.fromhex(file_hash)
+        except (TypeError, ValueError):
+            return file_hash
+    @staticmethod
+    def _to_hex(value):
+        return value.hex() if isinstance(value, bytes) else value
+    def _dir_id(self, path):
+        dir_id = self._dir_ids.get(path)
+        if dir_id is None:
+            self.conn.execute("INSERT OR IGNORE INTO directories (path) VALUES (?)", (path,))
+            dir_id = self.conn.execute("SELECT id FROM directories WHERE path = ?", (path,)).fetchone()[0]
+            if len(self._dir_ids) > 200000:
+                self._dir_ids.clear()
+            self._dir_ids[path] = dir_id
+        return dir_id
+    def _ext_id(self, extension):
+        if not extension:
+            return None
+        ext_id = self._ext_ids.get(extension)
+        if ext_id is None:
+            self.conn.execute("INSERT OR IGNORE INTO extensions (extension) VALUES (?)", (extension,))
+            ext_id = self.conn.execute("SELECT id FROM extensions WHERE extension = ?", (extension,)).fetchone()[0]
+            self._ext_ids[extension] = ext_id
+        return ext_id
+    def _forget_ids(self):
+        # Interned ids created inside a rolled-back transaction no longer exist
+        self._dir_ids.clear()
+        self._ext_ids.clear()
+    def _compact_row(self, row):
+        # (file_path, file_hash, extension, size, mtime_ns, inode, device[, digests, member]) -> stored column
+        # values; an archive member is stored next to its container as "container!member"
+        directory, name = os.path.split(row[0])
+        if len(row) > 8 and row[8]:
+            name += ArchiveReader.SEPARATOR + row[8]
+        return (self._dir_id(directory), name, self._ext_id(row[2]), self._to_blob(row[1])) + tuple(row[3:7])
+    def _reader(self):
+        # One read connection per worker thread; with WAL they never wait on the writer
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+    # A row with a new fingerprint replaces the stored hash and metadata; rows saved without a
+    # fingerprint (e.g. "Move to History") never overwrite what a scan recorded. status is kept
+    # while the digest is unchanged and reset when the content changed.
+    UPSERT_SQL = '''INSERT INTO file_index
+                     (dir_id, name, ext_id, file_hash, file_size, mtime_ns, inode, device, status)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                     ON CONFLICT(dir_id, name) DO UPDATE SET
+                         file_hash = excluded.file_hash, ext_id = excluded.ext_id,
+                         file_size = excluded.file_size, mtime_ns = excluded.mtime_ns,
+                         inode = excluded.inode, device = excluded.device,
+                         search_date = CASE WHEN file_hash IS NOT excluded.file_hash
+                                            THEN CURRENT_TIMESTAMP ELSE search_date END,
+                         status = CASE WHEN file_hash IS NOT excluded.file_hash
+                                       THEN excluded.status ELSE status END
+                     WHERE excluded.file_size IS NOT NULL
+                       AND (file_hash IS NOT excluded.file_hash OR file_size IS NOT excluded.file_size
+                            OR mtime_ns IS NOT excluded.mtime_ns OR inode IS NOT excluded.inode
+                            OR device IS NOT excluded.device)'''
+    def save_record(self, file_path, file_hash, extension, fingerprint=None, session_id=None, matched=False):
+        self.save_records([(file_path, file_hash, extension) + tuple(fingerprint or (None, None, None, None))],
+                          session_id, matched)
+    def save_records(self, records, session_id=None, matched=False):
+        # records: list of (file_path, file_hash, extension, file_size, mtime_ns, inode, device[, digests]),
+        # committed as one transaction; digests is {algorithm: hex} of the other algorithms. Matched rows
+        # are flagged for History and, when a session is given, recorded as hits of that search.
+        status = self.STATUS_MATCHED if matched else self.STATUS_INDEXED
+        try:
+            with self.conn:
+                rows = [self._compact_row(record) for record in records]
+                self.conn.executemany(self.UPSERT_SQL, [row + (status,) for row in rows])
+                extra = [(algorithm, self._to_blob(value)) + row[:2]
+                         for record, row in zip(records, rows) if len(record) > 7 and record[7]
+                         for algorithm, value in record[7].items() if algorithm != "sha256"]
+                if extra:
+                    self.conn.executemany('''
+                        INSERT OR REPLACE INTO file_digests (file_id, algorithm, digest)
+                        SELECT id, ?, ? FROM file_index WHERE dir_id = ? AND name = ?
+                    ''', extra)
+                    fuzzy = [(value, *key) for algorithm, value, *key in extra if algorithm == "ctph"]
+                    if fuzzy:
+                        self._index_fuzzy(fuzzy)
+                if matched:
+                    self.conn.executemany(f'''
+                        UPDATE file_index SET status = {self.STATUS_MATCHED}
+                        WHERE dir_id = ? AND name = ? AND file_hash = ? AND status != {self.STATUS_MATCHED}
+                    ''', [row[:2] + (row[3],) for row in rows])
+                if session_id is not None:
+                    self.conn.executemany('''
+                        INSERT OR IGNORE INTO search_hits (session_id, file_id)
+                        SELECT ?, id FROM file_index WHERE dir_id = ? AND name = ?
+                    ''', [(session_id,) + row[:2] for row in rows])
         except sqlite3.Error as e:
+            self._forget_ids()
             raise Exception(f"Database error: {str(e)}")
-    def search_hash(self, target_hash):
+    def _index_fuzzy(self, rows):
+        # rows: (ctph hash, dir_id, name); the buckets of the file's previous hash are replaced
+        self.conn.executemany('''
+            DELETE FROM fuzzy_index WHERE file_id = (SELECT id FROM file_index WHERE dir_id = ? AND name = ?)
+        ''', [key for _, *key in rows])
+        self.conn.executemany('''
+            INSERT OR IGNORE INTO fuzzy_index (bucket, file_id)
+            SELECT ?, id FROM file_index WHERE dir_id = ? AND name = ?
+        ''', [(bucket, *key) for value, *key in rows for bucket in FuzzyHash.buckets(value)])
+    def start_session(self, target_hashes, paths, scan_key=None):
+        # target_hashes: one hex digest or a collection of them (an IOC list)
+        if isinstance(target_hashes, str):
+            target_hashes = [target_hashes]
+        digests = {self._to_blob(target_hash) for target_hash in target_hashes}
         try:
             with self.conn:
-                cursor = self.conn.execute('''
-                    SELECT file_path, file_hash FROM search_history
-                    WHERE file_hash = ?
-                    UNION ALL
-                    SELECT file_path, file_hash FROM non_matching_hashes
-                    WHERE file_hash = ?
-                ''', (target_hash, target_hash))
-                return cursor.fetchall()
+                cursor = self.conn.execute("INSERT INTO search_sessions (target_hash, paths, scan_key) VALUES (?, ?, ?)",
+                                           (next(iter(digests)) if len(digests) == 1 else None, "\n".join(paths),
+                                            scan_key))
+                self.conn.executemany("INSERT INTO session_targets (session_id, target_hash) VALUES (?, ?)",
+                                      [(cursor.lastrowid, digest) for digest in digests])
+            return cursor.lastrowid
         except sqlite3.Error as e:
             raise Exception(f"Database error: {str(e)}")
-    def search_non_matching(self, target_hash):
+    def finish_session(self, session_id, files_scanned, hits):
         try:
             with self.conn:
-                cursor = self.conn.execute('''
-                    SELECT file_path, file_hash FROM non_matching_hashes
-                    WHERE file_hash = ?
-                ''', (target_hash,))
-                return cursor.fetchall()
+                self.conn.execute('''
+                    UPDATE search_sessions SET finished_at = CURRENT_TIMESTAMP, files_scanned = ?, hits = ?
+                    WHERE id = ?
+                ''', (files_scanned, hits, session_id))
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def resumable_session(self, target_hashes, paths, scan_key=None):
+        # (session_id, files counted in its finished directories) of the latest stopped scan of the same
+        # paths for the same targets with the same filters (scan_key); the files of its pending
+        # directories are walked and counted again
+        if isinstance(target_hashes, str):
+            target_hashes = [target_hashes]
+        digests = {self._to_blob(target_hash) for target_hash in target_hashes}
+        try:
+            conn = self._reader()
+            cursor = conn.execute('''
+                SELECT id, (SELECT SUM(files) FROM scan_frontier f WHERE f.session_id = s.id AND f.done = 1)
+                FROM search_sessions s
+                WHERE paths = ? AND scan_key IS ?
+                AND EXISTS (SELECT 1 FROM scan_frontier f WHERE f.session_id = s.id AND f.done = 0)
+                ORDER BY id DESC
+            ''', ("\n".join(paths), scan_key))
+            for session_id, files_scanned in cursor.fetchall():
+                targets = {row[0] for row in conn.execute(
+                    "SELECT target_hash FROM session_targets WHERE session_id = ?", (session_id,))}
+                if targets == digests:
+                    return session_id, files_scanned or 0
+            return None
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def load_frontier(self, session_id):
+        # (directories still to finish, every directory the session has reached)
+        try:
+            rows = self._reader().execute("SELECT path, done FROM scan_frontier WHERE session_id = ?", (session_id,))
+            pending = []
+            known = set()
+            for path, done in rows:
+                known.add(path)
+                if not done:
+                    pending.append(path)
+            return pending, known
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def save_frontier(self, session_id, reached, done):
+        # reached: directory paths; done: (path, files counted in it)
+        try:
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO scan_frontier (session_id, path) VALUES (?, ?)",
+                                      [(session_id, path) for path in reached])
+                self.conn.executemany('''
+                    INSERT OR REPLACE INTO scan_frontier (session_id, path, done, files) VALUES (?, ?, 1, ?)
+                ''', [(session_id, path, files) for path, files in done])
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def discard_frontier(self, session_id):
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM scan_frontier WHERE session_id = ?", (session_id,))
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def cached_archive(self, path, fingerprint, depth, algorithms=("sha256",)):
+        # [(member, size, {algorithm: hex})] of an archive read to the end with this fingerprint and depth
+        # and hashed in all of the algorithms, else None
+        try:
+            conn = self._reader()
+            row = conn.execute('''
+                SELECT id, algorithms FROM archives WHERE path = ? AND complete = 1 AND depth = ?
+                AND file_size = ? AND mtime_ns = ? AND inode = ? AND device = ?
+            ''', (path, depth, *fingerprint)).fetchone()
+            if row is None or not set(algorithms) <= set(row[1].split(",")):
+                return None
+            members = {}
+            cursor = conn.execute("SELECT member, member_size, file_hash FROM archive_members WHERE archive_id = ?",
+                                  (row[0],))
+            for member, size, digest in cursor:
+                members[member] = (member, size, {"sha256": self._to_hex(digest)})
+            cursor = conn.execute("SELECT member, algorithm, digest FROM archive_member_digests WHERE archive_id = ?",
+                                  (row[0],))
+            for member, algorithm, digest in cursor:
+                if member in members:
+                    members[member][2][algorithm] = self._to_hex(digest)
+            return list(members.values())
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def save_archive(self, path, fingerprint, depth, members, first=False, complete=False, algorithms=("sha256",)):
+        # Called once per batch of (member, size, {algorithm: hex}); first replaces whatever was stored for the path
+        try:
+            with self.conn:
+                if first:
+                    for table in ("archive_members", "archive_member_digests"):
+                        self.conn.execute(f'''
+                            DELETE FROM {table} WHERE archive_id IN (SELECT id FROM archives WHERE path = ?)
+                        ''', (path,))
+                    self.conn.execute("DELETE FROM archives WHERE path = ?", (path,))
+                    self.conn.execute('''
+                        INSERT INTO archives (path, file_size, mtime_ns, inode, device, depth, algorithms)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (path, *fingerprint, depth, ",".join(algorithms)))
+                row = self.conn.execute("SELECT id FROM archives WHERE path = ?", (path,)).fetchone()
+                if row is None:
+                    return
+                self.conn.executemany('''
+                    INSERT OR REPLACE INTO archive_members (archive_id, member, member_size, file_hash)
+                    VALUES (?, ?, ?, ?)
+                ''', [(row[0], member, size, self._to_blob(digests["sha256"])) for member, size, digests in members])
+                self.conn.executemany('''
+                    INSERT OR REPLACE INTO archive_member_digests (archive_id, member, algorithm, digest)
+                    VALUES (?, ?, ?, ?)
+                ''', [(row[0], member, algorithm, self._to_blob(value)) for member, _, digests in members
+                      for algorithm, value in digests.items() if algorithm != "sha256"])
+                if complete:
+                    self.conn.execute("UPDATE archives SET complete = 1, scanned_at = CURRENT_TIMESTAMP WHERE id = ?",
+                                      (row[0],))
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def session_hits(self, session_id):
+        try:
+            cursor = self._reader().execute('''
+                SELECT d.path, t.name, t.file_hash, t.file_size, t.mtime_ns
+                FROM search_hits h JOIN file_index t ON t.id = h.file_id JOIN directories d ON d.id = t.dir_id
+                WHERE h.session_id = ?
+            ''', (session_id,))
+            return self._hit_rows(cursor, False)
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def target_sizes(self, target_hashes):
+        # {hash: size} for the targets that are indexed; a digest always belongs to one size
+        return {hash_val: size for _, hash_val, size, _ in self.search_hashes(target_hashes, fingerprint=True)
+                if size is not None}
+    def search_superseded(self, target_hash):
+        # Paths that held target_hash before their content changed
+        try:
+            cursor = self._reader().execute('''
+                SELECT file_path, file_hash, superseded_at FROM hash_audit
+                WHERE file_hash = ?
+                ORDER BY superseded_at DESC
+            ''', (self._to_blob(target_hash),))
+            return [(path, self._to_hex(digest), when) for path, digest, when in cursor]
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def cached_hash(self, file_path, fingerprint):
+        # Stored digest for file_path, only if (size, mtime_ns, inode, device) still match
+        directory, name = os.path.split(file_path)
+        try:
+            cursor = self._reader().execute('''
+                SELECT t.file_hash FROM file_index t JOIN directories d ON d.id = t.dir_id
+                WHERE d.path = ? AND t.name = ? AND t.file_size = ? AND t.mtime_ns = ? AND t.inode = ? AND t.device = ?
+            ''', (directory, name, *fingerprint))
+            row = cursor.fetchone()
+            return self._to_hex(row[0]) if row else None
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def cached_digests(self, file_path, fingerprint, algorithms):
+        # {algorithm: hex} for file_path, only if the fingerprint still matches and every one is stored
+        directory, name = os.path.split(file_path)
+        try:
+            conn = self._reader()
+            row = conn.execute('''
+                SELECT t.id, t.file_hash FROM file_index t JOIN directories d ON d.id = t.dir_id
+                WHERE d.path = ? AND t.name = ? AND t.file_size = ? AND t.mtime_ns = ? AND t.inode = ? AND t.device = ?
+            ''', (directory, name, *fingerprint)).fetchone()
+            if row is None:
+                return None
+            digests = {"sha256": self._to_hex(row[1])}
+            for algorithm, value in conn.execute("SELECT algorithm, digest FROM file_digests WHERE file_id = ?",
+                                                 (row[0],)):
+                digests[algorithm] = self._to_hex(value)
+            return digests if all(algorithm in digests for algorithm in algorithms) else None
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def _hit_rows(self, cursor, fingerprint):
+        # (path, hex digest) per hit, plus the stored (file_size, mtime_ns) when fingerprint is set
+        if fingerprint:
+            return [(os.path.join(path, name), self._to_hex(digest), size, mtime_ns)
+                    for path, name, digest, size, mtime_ns in cursor]
+        return [(os.path.join(path, name), self._to_hex(digest)) for path, name, digest, _, _ in cursor]
+    def search_hash(self, target_hash, fingerprint=False):
+        # Every indexed file with this digest, whichever search hashed it
+        digest = self._to_blob(target_hash)
+        try:
+            if isinstance(digest, bytes) and len(digest) != 32:
+                # MD5 / SHA-1 / BLAKE2b: the digest stored next to the file's SHA-256
+                cursor = self._reader().execute('''
+                    SELECT d.path, t.name, g.digest, t.file_size, t.mtime_ns
+                    FROM file_digests g JOIN file_index t ON t.id = g.file_id JOIN directories d ON d.id = t.dir_id
+                    WHERE g.digest = ?
+                ''', (digest,))
+                return self._hit_rows(cursor, fingerprint)
+            file_ids = self._digest_lookup(digest)
+            if file_ids is None:
+                cursor = self._reader().execute('''
+                    SELECT d.path, t.name, t.file_hash, t.file_size, t.mtime_ns
+                    FROM file_index t JOIN directories d ON d.id = t.dir_id
+                    WHERE t.file_hash = ?
+                ''', (digest,))
+            elif not file_ids:
+                return []
+            else:
+                # The side file may list rows changed since it was written, so the digest is checked again
+                cursor = self._reader().execute(f'''
+                    SELECT d.path, t.name, t.file_hash, t.file_size, t.mtime_ns
+                    FROM file_index t JOIN directories d ON d.id = t.dir_id
+                    WHERE t.id IN ({", ".join("?" * len(file_ids))}) AND t.file_hash = ?
+                ''', (*file_ids, digest))
+            return self._hit_rows(cursor, fingerprint)
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+        except OSError as e:
+            raise Exception(f"Digest index error: {str(e)}")
+    FUZZY_CANDIDATES = 2000
+    def similar_files(self, fuzzy_hash, min_score=1, limit=200):
+        # [(path, sha256 hex, ctph hash, score)] best first. Candidates are the files sharing an LSH bucket
+        # with fuzzy_hash (at most FUZZY_CANDIDATES of them); only those are scored.
+        buckets = FuzzyHash.buckets(fuzzy_hash)
+        if not buckets:
+            return []
+        try:
+            rows = self._reader().execute(f'''
+                SELECT d.path, t.name, t.file_hash, g.digest
+                FROM (SELECT DISTINCT file_id FROM fuzzy_index WHERE bucket IN ({", ".join("?" * len(buckets))})
+                      LIMIT ?) c
+                JOIN file_digests g ON g.file_id = c.file_id AND g.algorithm = 'ctph'
+                JOIN file_index t ON t.id = c.file_id JOIN directories d ON d.id = t.dir_id
+            ''', (*buckets, self.FUZZY_CANDIDATES)).fetchall()
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+        scored = [(os.path.join(path, name), self._to_hex(digest), value, FuzzyHash.compare(fuzzy_hash, value))
+                  for path, name, digest, value in rows]
+        scored = [row for row in scored if row[3] >= min_score]
+        scored.sort(key=lambda row: -row[3])
+        return scored[:limit]
+    def search_hashes(self, target_hashes, fingerprint=False):
+        # Every indexed file whose digest is in target_hashes, resolved with one join against the
+        # hash index; the digest in each result is the IOC it matched
+        digests = {self._to_blob(target_hash) for target_hash in target_hashes}
+        try:
+            reader = self._reader()
+            reader.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_targets (digest BLOB PRIMARY KEY)")
+            with reader:
+                reader.execute("DELETE FROM lookup_targets")
+                reader.executemany("INSERT INTO lookup_targets (digest) VALUES (?)", [(d,) for d in digests])
+            query = '''
+                SELECT d.path, t.name, t.file_hash, t.file_size, t.mtime_ns FROM lookup_targets g
+                CROSS JOIN file_index t ON t.file_hash = g.digest
+                JOIN directories d ON d.id = t.dir_id
+            '''
+            if any(len(digest) != 32 for digest in digests if isinstance(digest, bytes)):
+                query += '''
+                UNION ALL
+                SELECT d.path, t.name, x.digest, t.file_size, t.mtime_ns FROM lookup_targets g
+                CROSS JOIN file_digests x ON x.digest = g.digest
+                JOIN file_index t ON t.id = x.file_id
+                JOIN directories d ON d.id = t.dir_id
+                '''
+            cursor = reader.execute(query)
+            return self._hit_rows(cursor, fingerprint)
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def _digests_enabled(self):
+        return self.digest_index or (self.digest_index is None and os.path.exists(self.digests.path))
+    def _digest_lookup(self, digest):
+        # file_index ids for digest from the side file, or None when the SQL index has to answer
+        if not isinstance(digest, bytes) or len(digest) != 32 or not self._digests_enabled():
+            return None
+        if not self.digests.is_open() and not self.digests.open():
+            self.refresh_digest_index()
+            if not self.digests.is_open():
+                return None
+        reader = self._reader()
+        # data_version only moves when another connection commits, so the pending check is usually skipped
+        version = reader.execute("PRAGMA data_version").fetchone()[0]
+        if version != getattr(self._local, 'digest_version', None):
+            self._local.digest_pending = reader.execute("SELECT EXISTS (SELECT 1 FROM digest_changes)").fetchone()[0]
+            self._local.digest_version = version
+            if not self.digests.is_current():
+                self.digests.open()
+        if self._local.digest_pending:
+            # Rows changed since the last refresh are not in the side file yet
+            return None
+        return self.digests.lookup(digest)
+    def refresh_digest_index(self):
+        # Merges the changes logged in digest_changes into the side file (a full build the first time)
+        with self._digest_lock:
+            try:
+                last = self.conn.execute("SELECT max(seq) FROM digest_changes").fetchone()[0]
+                if not self._digests_enabled():
+                    # Nobody reads the log without a side file; a first build starts from file_index anyway
+                    if last is not None:
+                        with self.conn:
+                            self.conn.execute("DELETE FROM digest_changes WHERE seq <= ?", (last,))
+                    return
+                # Reopened first so a file written meanwhile by another instance is merged, not overwritten
+                if not self.digests.open():
+                    count = self.conn.execute("SELECT count(*) FROM file_index").fetchone()[0]
+                    cursor = self.conn.execute('''
+                        SELECT file_hash, id FROM file_index
+                        WHERE typeof(file_hash) = 'blob' AND length(file_hash) = 32
+                        ORDER BY file_hash, id
+                    ''')
+                    self.digests.write(cursor, count)
+                elif last is not None:
+                    rows = self.conn.execute('''
+                        SELECT c.file_id, t.file_hash FROM digest_changes c
+                        LEFT JOIN file_index t ON t.id = c.file_id
+                        WHERE c.seq <= ?
+                    ''', (last,)).fetchall()
+                    changed = {file_id for file_id, _ in rows}
+                    added = sorted({(digest, file_id) for file_id, digest in rows
+                                    if isinstance(digest, bytes) and len(digest) == 32})
+                    kept = (entry for entry in self.digests.entries() if entry[1] not in changed)
+                    self.digests.write(heapq.merge(kept, added), self.digests.count + len(added))
+                else:
+                    return
+                if last is not None:
+                    with self.conn:
+                        self.conn.execute("DELETE FROM digest_changes WHERE seq <= ?", (last,))
+            except sqlite3.Error as e:
+                raise Exception(f"Database error: {str(e)}")
+            except OSError as e:
+                # e.g. another process still maps the old file on Windows; the changes stay logged
+                raise Exception(f"Digest index error: {str(e)}")
+    def fetch_records(self, status):
+        # (search_date, extension, file_hash, file_path) rows with the given status, newest first
+        try:
+            cursor = self._reader().execute('''
+                SELECT t.search_date, e.extension, t.file_hash, d.path, t.name
+                FROM file_index t
+                JOIN directories d ON d.id = t.dir_id
+                LEFT JOIN extensions e ON e.id = t.ext_id
+                WHERE t.status = ?
+                ORDER BY t.search_date DESC
+            ''', (status,))
+            return [(date, ext or "", self._to_hex(digest), os.path.join(path, name))
+                    for date, ext, digest, path, name in cursor]
         except sqlite3.Error as e:
             raise Exception(f"Database error: {str(e)}")
     def delete_record(self, file_path, file_hash):
+        directory, name = os.path.split(file_path)
         try:
             with self.conn:
-                self.conn.execute("DELETE FROM search_history WHERE file_path=? AND file_hash=?",
-                                  (file_path, file_hash))
-                self.conn.execute("DELETE FROM non_matching_hashes WHERE file_path=? AND file_hash=?",
-                                  (file_path, file_hash))
+                key = (directory, name, self._to_blob(file_hash))
+                self.conn.execute('''
+                    DELETE FROM search_hits WHERE file_id IN (
+                        SELECT id FROM file_index
+                        WHERE dir_id = (SELECT id FROM directories WHERE path = ?) AND name = ? AND file_hash = ?)
+                ''', key)
+                self.conn.execute('''
+                    DELETE FROM file_index
+                    WHERE dir_id = (SELECT id FROM directories WHERE path = ?) AND name = ? AND file_hash = ?
+                ''', key)
         except sqlite3.Error as e:
             raise Exception(f"Database delete error: {str(e)}")
+    def iter_directories(self):
+        # (directory, [(file_id, name, device), ...]) for every indexed directory, read on a snapshot
+        try:
+            cursor = self._reader().execute('''
+                SELECT d.path, t.id, t.name, t.device FROM file_index t JOIN directories d ON d.id = t.dir_id
+                ORDER BY t.dir_id
+            ''')
+            for directory, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+                yield directory, [(file_id, name, device) for _, file_id, name, device in rows]
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def prune_files(self, file_ids, archive=True):
+        # Drops index rows (and their search hits) in one transaction; archived rows stay
+        # searchable through search_superseded
+        rows = [(file_id,) for file_id in file_ids]
+        try:
+            with self.conn:
+                if archive:
+                    self.conn.executemany(f'''
+                        INSERT INTO hash_audit (source_table, file_path, file_hash, extension,
+                                                file_size, mtime_ns, inode, device, search_date)
+                        SELECT 'file_index',
+                               CASE WHEN d.path = '' THEN t.name
+                                    WHEN substr(d.path, -1) IN ('/', '\\') THEN d.path || t.name
+                                    ELSE d.path || '{os.sep}' || t.name END,
+                               t.file_hash, e.extension, t.file_size, t.mtime_ns, t.inode, t.device, t.search_date
+                        FROM file_index t
+                        JOIN directories d ON d.id = t.dir_id
+                        LEFT JOIN extensions e ON e.id = t.ext_id
+                        WHERE t.id = ?
+                    ''', rows)
+                self.conn.executemany("DELETE FROM search_hits WHERE file_id = ?", rows)
+                self.conn.executemany("DELETE FROM file_index WHERE id = ?", rows)
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def analyze(self):
+        try:
+            self.conn.execute("ANALYZE")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def compact(self, step=2000):
+        # Returns the number of pages given back to the file system. Free pages are released
+        # step at a time so scans can commit in between; a file created before incremental
+        # auto-vacuum existed is converted by one full VACUUM.
+        try:
+            freed = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                self.conn.execute("VACUUM")
+                return freed
+            while self.conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                self.conn.execute(f"PRAGMA incremental_vacuum({step})").fetchall()
+            return freed
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def file_size(self):
+        # Size on disk once the WAL has been folded back into the main file
+        try:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+        return sum(os.path.getsize(p) for p in (self.db_path, self.db_path + '-wal') if os.path.exists(p))
+    def record_maintenance(self, report):
+        try:
+            with self.conn:
+                self.conn.execute('''
+                    INSERT INTO maintenance_runs (seconds, rows_checked, rows_pruned, bytes_before, bytes_after)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (report["seconds"], report["checked"], report["pruned"],
+                      report["bytes_before"], report["bytes_after"]))
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def load_exclusions(self):
+        try:
+            return [row[0] for row in self._reader().execute("SELECT rule FROM exclusion_rules ORDER BY position")]
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def save_exclusions(self, rules):
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM exclusion_rules")
+                self.conn.executemany("INSERT INTO exclusion_rules (rule) VALUES (?)", [(rule,) for rule in rules])
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def load_device_tuning(self):
+        try:
+            return {mount: workers for mount, workers in
+                    self._reader().execute("SELECT mount, workers FROM device_tuning")}
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def save_device_tuning(self, tuning):
+        # tuning: {mount: (workers, bytes_per_sec)}
+        try:
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT INTO device_tuning (mount, workers, rate) VALUES (?, ?, ?)
+                    ON CONFLICT(mount) DO UPDATE SET workers = excluded.workers, rate = excluded.rate,
+                                                     updated_at = CURRENT_TIMESTAMP
+                ''', [(mount, workers, rate) for mount, (workers, rate) in tuning.items()])
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+    def maintenance_due(self, interval_days):
+        try:
+            row = self._reader().execute(
+                "SELECT julianday('now') - julianday(max(finished_at)) FROM maintenance_runs").fetchone()
+            return row[0] is None or row[0] >= interval_days
+        except sqlite3.Error as e:
+            raise Exception(f"Database error: {str(e)}")
+
+# ---------------- Digest Index (sorted, memory-mapped) ----------------
+class DigestIndex:
+    # Side file next to the DB: a header, a 2-byte-prefix fan-out table, a blocked Bloom filter and
+    # (digest, file_index.id) records sorted by digest. It is mapped read-only, so every process shares
+    # the same page-cache pages, and a cold lookup touches about three of them: one Bloom block, one
+    # fan-out entry and the records of one prefix. The file is only ever replaced, never modified.
+    MAGIC = b'FSDIGX02'
+    HEADER = struct.Struct('<8sQQQI')  # magic, record count, Bloom blocks, records offset, Bloom hashes
+    FANOUT = struct.Struct('<65536I')  # records with a digest prefix <= p, per 2-byte prefix p
+    FANOUT_OFFSET = 64
+    RECORD = struct.Struct('<32sq')
+    # SHA-256 output is uniform, so 4-byte slices of the digest serve as the Bloom hash functions:
+    # the first picks a 512-bit block, the other seven pick bits inside it (~1% false positives)
+    BLOOM_SLICES = struct.Struct('<8I')
+    BLOOM_BLOCK_BYTES = 64
+    BLOOM_BITS_PER_ENTRY = 10
+    def __init__(self, path, bloom=True):
+        self.path = path
+        self.bloom = bloom
+        # (mmap, stat, record count, records offset, Bloom blocks, Bloom hashes) of the mapped file, replaced
+        # as one reference: a lookup keeps the mapping it started with while another thread maps a new
+        # file, and a mapping that was replaced is unmapped when its last reader drops it
+        self._view = None
+    @property
+    def count(self):
+        view = self._view
+        return view[2] if view else 0
+    def is_open(self):
+        return self._view is not None
+    def is_current(self):
+        # False once another instance has replaced the file we have mapped
+        view = self._view
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return view is None
+        return view is not None and view[1] == (st.st_ino, st.st_size, st.st_mtime_ns)
+    def open(self):
+        # The current mapping serves lookups until the new one is complete; none is left on failure
+        self._view = self._map()
+        return self._view is not None
+    def _map(self):
+        try:
+            with open(self.path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if st.st_size < self.FANOUT_OFFSET + self.FANOUT.size:
+                    return None
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_RANDOM'):
+            # Probes touch a few scattered pages; read-ahead around each would only add I/O
+            mm.madvise(mmap.MADV_RANDOM)
+        magic, count, bloom_blocks, records, bloom_hashes = self.HEADER.unpack_from(mm, 0)
+        if magic != self.MAGIC or records + count * self.RECORD.size > len(mm):
+            mm.close()
+            return None
+        return (mm, (st.st_ino, st.st_size, st.st_mtime_ns), count, records, bloom_blocks, bloom_hashes)
+    def close(self):
+        # Not mm.close(): a lookup on another thread may still be reading it
+        self._view = None
+    def lookup(self, digest):
+        view = self._view
+        if view is None:
+            return []
+        mm, _, count, records, bloom_blocks, bloom_hashes = view
+        if bloom_blocks:
+            slices = self.BLOOM_SLICES.unpack_from(digest)
+            block = self.FANOUT_OFFSET + self.FANOUT.size + (slices[0] % bloom_blocks) * self.BLOOM_BLOCK_BYTES
+            for value in slices[1:1 + bloom_hashes]:
+                bit = value & 511
+                if not mm[block + (bit >> 3)] & (1 << (bit & 7)):
+                    return []
+        prefix = (digest[0] << 8) | digest[1]
+        lo = struct.unpack_from('<I', mm, self.FANOUT_OFFSET + 4 * (prefix - 1))[0] if prefix else 0
+        hi = struct.unpack_from('<I', mm, self.FANOUT_OFFSET + 4 * prefix)[0]
+        size = self.RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = records + mid * size
+            if mm[pos:pos + 32] < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        file_ids = []
+        pos = records + lo * size
+        while lo < count and mm[pos:pos + 32] == digest:
+            file_ids.append(self.RECORD.unpack_from(mm, pos)[1])
+            lo += 1
+            pos += size
+        return file_ids
+    def entries(self):
+        mm, _, count, records = self._view[:4]
+        for pos in range(records, records + count * self.RECORD.size, self.RECORD.size):
+            yield self.RECORD.unpack_from(mm, pos)
+    def write(self, entries, capacity):
+        # entries: (digest, file_id) pairs in digest order; capacity sizes the Bloom filter
+        bloom_blocks = -(-max(capacity, 1) * self.BLOOM_BITS_PER_ENTRY // 512) if self.bloom else 0
+        bloom = bytearray(bloom_blocks * self.BLOOM_BLOCK_BYTES)
+        bloom_offset = self.FANOUT_OFFSET + self.FANOUT.size
+        records = bloom_offset + len(bloom)
+        fanout = [0] * 65536
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        count = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.seek(records)
+                chunk = []
+                pack, slices = self.RECORD.pack, self.BLOOM_SLICES.unpack_from
+                for digest, file_id in entries:
+                    chunk.append(pack(digest, file_id))
+                    fanout[(digest[0] << 8) | digest[1]] += 1
+                    if bloom_blocks:
+                        values = slices(digest)
+                        block = (values[0] % bloom_blocks) * self.BLOOM_BLOCK_BYTES
+                        for value in values[1:]:
+                            bit = value & 511
+                            bloom[block + (bit >> 3)] |= 1 << (bit & 7)
+                    if len(chunk) >= 8192:
+                        f.write(b''.join(chunk))
+                        count += len(chunk)
+                        chunk = []
+                f.write(b''.join(chunk))
+                count += len(chunk)
+                for prefix in range(1, 65536):
+                    fanout[prefix] += fanout[prefix - 1]
+                f.seek(0)
+                f.write(self.HEADER.pack(self.MAGIC, count, bloom_blocks, records, self.BLOOM_SLICES.size // 4 - 1))
+                f.seek(self.FANOUT_OFFSET)
+                f.write(self.FANOUT.pack(*fanout))
+                f.write(bloom)
+            if os.name == 'nt':
+                # Windows cannot replace a file that is still mapped (a lookup in flight fails the
+                # refresh, and the changes stay logged for the next one)
+                self.close()
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.open()
+
+# ---------------- Similarity Hashing (CTPH) ----------------
+class FuzzyHash:
+    # Context-triggered piecewise hash in the spirit of ssdeep (not compatible with its output). Every byte
+    # is mapped to one bit through a fixed table; a piece ends where a run of `level` one-bits ends the
+    # context window, which happens every ~2**(level + 1) bytes and depends only on the bytes around it, so
+    # an insertion or a patch changes the pieces next to it and the rest re-synchronise. Each piece adds
+    # one base64 character (CRC32 & 63): "block_size:pieces:pieces at twice the block size". Used like a
+    # hashlib object (update/hexdigest), so FileHasher feeds it from the same chunks as SHA-256.
+    TABLE = bytes(hashlib.sha256(bytes([i])).digest()[0] & 1 for i in range(256))
+    B64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    LENGTH = 64
+    MIN_LEVEL = 3
+    # Two signatures are only compared when they share GRAM consecutive pieces; the LSH index keeps
+    # BANDS min-hashes of those grams per signature (one bucket each), so a query reads BANDS * 2 buckets
+    GRAM = 7
+    BANDS = 8
+    PRIME = (1 << 61) - 1
+    PERMUTATIONS = [(int.from_bytes(seed[:8], 'little') | 1, int.from_bytes(seed[8:16], 'little'))
+                    for seed in (hashlib.sha256(b'ctph%d' % band).digest() for band in range(BANDS))]
+    def __init__(self, size):
+        # The block size is chosen from the file size so the first signature has at most LENGTH pieces
+        level = self.MIN_LEVEL
+        while (2 << level) * self.LENGTH < size:
+            level += 1
+        self.level = level
+        self.ones = b'\x01' * level
+        self.run = 0  # one-bits at the end of the data seen so far
+        self.pieces = ([], [])
+        self.crcs = [0, 0]
+        self.pending = [False, False]  # bytes fed since the last piece ended
+    def update(self, data):
+        bits = bytes(data).translate(self.TABLE)
+        k = self.level
+        ends = ([], [])
+        pos = 0
+        if self.run:
+            # A run carried over from the previous chunk
+            lead = bits.find(b'\x00')
+            lead = len(bits) if lead < 0 else lead
+            for i, length in enumerate((k, k + 1)):
+                if self.run < length <= self.run + lead:
+                    ends[i].append(length - self.run - 1)
+            pos = lead
+        while True:
+            start = bits.find(self.ones, pos)
+            if start < 0:
+                break
+            end = bits.find(b'\x00', start + k)
+            end = len(bits) if end < 0 else end
+            ends[0].append(start + k - 1)
+            if end - start > k:
+                ends[1].append(start + k)
+            pos = end
+        tail = len(bits) - 1 - bits.rfind(b'\x00')
+        self.run = self.run + tail if tail == len(bits) else tail
+        with memoryview(data) as view:
+            for i in (0, 1):
+                crc, last, pieces = self.crcs[i], 0, self.pieces[i]
+                limit = self.LENGTH >> i
+                for end in ends[i]:
+                    if len(pieces) < limit - 1:
+                        # The last character covers everything after LENGTH - 1 pieces
+                        pieces.append(self.B64[zlib.crc32(view[last:end + 1], crc) & 63])
+                        crc, last = 0, end + 1
+                        self.pending[i] = False
+                if last < len(view):
+                    crc = zlib.crc32(view[last:], crc)
+                    self.pending[i] = True
+                self.crcs[i] = crc
+    def hexdigest(self):
+        signatures = ["".join(pieces) + (self.B64[crc & 63] if pending else "")
+                      for pieces, crc, pending in zip(self.pieces, self.crcs, self.pending)]
+        return f"{2 << self.level}:{signatures[0]}:{signatures[1]}"
+    @classmethod
+    def parse(cls, value):
+        # (block size, signature, signature at twice the block size); runs of more than three identical
+        # pieces (zero-filled or repetitive regions) are cut to three so they do not dominate the score
+        block_size, first, second = value.split(":", 2)
+        return int(block_size), re.sub(r'(.)\1{3,}', r'\1\1\1', first), re.sub(r'(.)\1{3,}', r'\1\1\1', second)
+    @classmethod
+    def _grams(cls, signature):
+        return {signature[i:i + cls.GRAM] for i in range(len(signature) - cls.GRAM + 1)}
+    @classmethod
+    def buckets(cls, value):
+        # LSH keys of a hash: per signature, the minimum of each permutation over its grams, tagged
+        # with the block size so that only signatures of the same block size meet in a bucket
+        block_size, first, second = cls.parse(value)
+        keys = set()
+        for size, signature in ((block_size, first), (block_size * 2, second)):
+            grams = [int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'little')
+                     for gram in cls._grams(signature)]
+            if not grams:
+                continue
+            for band, (a, b) in enumerate(cls.PERMUTATIONS):
+                low = min((a * gram + b) % cls.PRIME for gram in grams)
+                key = hashlib.blake2b(struct.pack('<QBQ', size, band, low), digest_size=8).digest()
+                keys.add(int.from_bytes(key, 'little', signed=True))
+        return keys
+    @classmethod
+    def _score(cls, first, second):
+        if not first or not second:
+            return 0
+        if first == second:
+            return 100
+        if not cls._grams(first) & cls._grams(second):
+            return 0
+        # 2 * longest common subsequence / total length: 100 for equal, 0 for nothing in common
+        previous = [0] * (len(second) + 1)
+        for char in first:
+            current = [0]
+            for j, other in enumerate(second):
+                current.append(previous[j] + 1 if char == other else max(previous[j + 1], current[j]))
+            previous = current
+        return 200 * previous[-1] // (len(first) + len(second))
+    @classmethod
+    def compare(cls, left, right):
+        # 0..100; hashes are comparable when their block sizes are equal or one is twice the other
+        size_a, first_a, second_a = cls.parse(left)
+        size_b, first_b, second_b = cls.parse(right)
+        if size_a == size_b:
+            return max(cls._score(first_a, first_b), cls._score(second_a, second_b))
+        if size_a * 2 == size_b:
+            return cls._score(second_a, first_b)
+        if size_b * 2 == size_a:
+            return cls._score(first_a, second_b)
+        return 0
+
+# ---------------- File Hashing ----------------
+class FileHasher:
+    # SHA-256 of a file with a selectable read strategy:
+    #   read         f.read() per chunk (a new bytes object per chunk)
+    #   readinto     readinto() a per-thread preallocated buffer, hashed through a memoryview
+    #   mmap         the file is mapped and hashed in one call
+    #   file_digest  hashlib.file_digest (Python 3.11+)
+    #   auto         readinto below mmap_threshold, mmap above it (the fastest pair in "benchmark.py hashing")
+    # cache_friendly hints sequential access before a file is read and drops its pages from the
+    # page cache afterwards (POSIX only), so a scan does not evict a server's hot data. An optional
+    # RateLimiter paces every read. allocations counts the buffers the loop itself created.
+    # With more than one algorithm every chunk is fed to each hash object, so the file is still read
+    # once; hash_digests() returns {algorithm: hex}, hash_file() the SHA-256 alone.
+    # cancel(nbytes), when given, is called after every chunk; a true result abandons the file with
+    # InterruptedError (a search that ended early does not finish reading a large file).
+    STRATEGIES = ("read", "readinto", "mmap", "file_digest", "auto")
+    CHUNK = 1 << 20
+    def __init__(self, strategy="auto", chunk_size=None, mmap_threshold=8 << 20, cache_friendly=False,
+                 limiter=None, algorithms=("sha256",), cancel=None):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown hashing strategy: {strategy}")
+        if strategy == "file_digest" and (not hasattr(hashlib, "file_digest") or limiter or cancel or len(algorithms) > 1):
+            strategy = "readinto"
+        self.algorithms = ("sha256",) + tuple(a for a in dict.fromkeys(algorithms) if a != "sha256")
+        self.strategy = strategy
+        self.chunk_size = chunk_size or self.CHUNK
+        self.mmap_threshold = mmap_threshold
+        self.cache_friendly = cache_friendly and hasattr(os, 'posix_fadvise')
+        self.limiter = limiter
+        self.cancel = cancel
+        self.allocations = 0
+        self._local = threading.local()
+    @classmethod
+    def default(cls):
+        # One shared instance; its buffers are per thread, so every hash worker reuses its own
+        if not hasattr(cls, '_default'):
+            cls._default = cls()
+        return cls._default
+    def _buffer(self):
+        view = getattr(self._local, 'view', None)
+        if view is None:
+            view = self._local.view = memoryview(bytearray(self.chunk_size))
+            self.allocations += 1
+        return view
+    def _read(self, f, hashers):
+        while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+                return
+            self.allocations += 1
+            if self.limiter:
+                self.limiter.acquire(len(chunk))
+            if self.cancel and self.cancel(len(chunk)):
+                raise InterruptedError("Hashing cancelled")
+            for hasher in hashers:
+                hasher.update(chunk)
+    def _readinto(self, f, hashers):
+        view = self._buffer()
+        while True:
+            n = f.readinto(view)
+            if not n:
+                return
+            if self.limiter:
+                self.limiter.acquire(n)
+            if self.cancel and self.cancel(n):
+                raise InterruptedError("Hashing cancelled")
+            chunk = view[:n]
+            for hasher in hashers:
+                hasher.update(chunk)
+    def _mmap(self, f, hashers):
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            self.allocations += 1
+            if not self.limiter and not self.cancel and len(hashers) == 1:
+                hashers[0].update(mapped)
+                return
+            # Several digests are fed chunk by chunk, while each chunk is still in the CPU cache
+            with memoryview(mapped) as view:
+                for offset in range(0, len(view), self.chunk_size):
+                    chunk = view[offset:offset + self.chunk_size]
+                    if self.limiter:
+                        self.limiter.acquire(len(chunk))
+                    if self.cancel and self.cancel(len(chunk)):
+                        chunk.release()
+                        raise InterruptedError("Hashing cancelled")
+                    for hasher in hashers:
+                        hasher.update(chunk)
+                    chunk.release()
+    def hash_file(self, path, size=None):
+        return self.hash_digests(path, size)["sha256"]
+    def hash_digests(self, path, size=None):
+        with open(path, 'rb', buffering=0) as f:
+            if not self.cache_friendly:
+                return self._hash_open(f, size)
+            fd = f.fileno()
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            try:
+                return self._hash_open(f, size)
+            finally:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    def hash_edges(self, path, size, edge):
+        # SHA-256 object over the first and last `edge` bytes (the whole file when it is that small)
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            if self.limiter:
+                self.limiter.acquire(min(size, 2 * edge), ops=1 if size <= 2 * edge else 2)
+            if size <= 2 * edge:
+                hasher.update(f.read())
+            else:
+                hasher.update(f.read(edge))
+                f.seek(-edge, os.SEEK_END)
+                hasher.update(f.read(edge))
+            if self.cache_friendly:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        return hasher
+    def new_hashers(self, size=None):
+        # One hash object per algorithm; "ctph" is the similarity hash (FuzzyHash), fed from the same chunks
+        return [FuzzyHash(size) if algorithm == "ctph" else hashlib.new(algorithm) for algorithm in self.algorithms]
+    def charge(self, nbytes):
+        # A read made outside the hashing loops (HashingReader): paced and cancelled like theirs
+        if self.limiter:
+            self.limiter.acquire(nbytes)
+        if self.cancel and self.cancel(nbytes):
+            raise InterruptedError("Hashing cancelled")
+    def _hash_open(self, f, size):
+        strategy = self.strategy
+        if size is None and (strategy in ("auto", "mmap") or "ctph" in self.algorithms):
+            size = os.fstat(f.fileno()).st_size
+        if strategy in ("auto", "mmap"):
+            # mmap cannot map an empty file; in auto mode small files are cheaper through the buffer
+            threshold = self.mmap_threshold if strategy == "auto" else 1
+            strategy = "mmap" if size and size >= threshold else "readinto"
+        if strategy == "file_digest":
+            self.allocations += 1
+            return {"sha256": hashlib.file_digest(f, "sha256").hexdigest()}
+        hashers = self.new_hashers(size)
+        {"read": self._read, "readinto": self._readinto, "mmap": self._mmap}[strategy](f, hashers)
+        return {algorithm: hasher.hexdigest() for algorithm, hasher in zip(self.algorithms, hashers)}
+
+FS_IOC_FIEMAP = 0xC020660B
+def file_physical_offset(path):
+    # Physical byte offset of the file's first extent (Linux FIEMAP), or None when unavailable
+    if fcntl is None or not sys.platform.startswith('linux'):
+        return None
+    # struct fiemap with room for one struct fiemap_extent (56 bytes)
+    request = bytearray(struct.pack('=QQIIII', 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(56))
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, request)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    if not struct.unpack_from('=I', request, 20)[0]:
+        return None
+    return struct.unpack_from('=Q', request, 40)[0]
+
+class RateLimiter:
+    # Paces reads to at most bytes_per_sec and iops (one op per read call) across all the threads
+    # sharing it: each acquire() books the next free slot on one schedule and sleeps until it starts.
+    # Up to `burst` seconds of unused budget can be spent at once.
+    def __init__(self, bytes_per_sec=None, iops=None, burst=0.1):
+        self.bytes_per_sec = bytes_per_sec
+        self.iops = iops
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+    def acquire(self, nbytes, ops=1):
+        cost = max(nbytes / self.bytes_per_sec if self.bytes_per_sec else 0.0,
+                   ops / self.iops if self.iops else 0.0)
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next, now - self.burst)
+            self._next = start + cost
+        if start > now:
+            time.sleep(start - now)
+
+# ---------------- Archive Members (zip / tar) ----------------
+class HashingReader(io.RawIOBase):
+    # Seekable view of a stream (positioned at its start) that an archive parser reads at will while
+    # every byte of the stream is fed once, in order, to each of the hasher's algorithms: a read that
+    # continues the hashed prefix extends it, a short gap before a read (a zip data descriptor) is read
+    # through first, bytes read again behind the prefix are not hashed twice, and finish() reads what the
+    # parser skipped. With charge the reads count against the hasher's limiter and cancel (the container
+    # on disk; members are inflated from it).
+    GAP = 1 << 16
+    def __init__(self, raw, hasher, size, charge=False):
+        super().__init__()
+        self.raw = raw
+        self.hasher = hasher
+        self.size = size
+        self.charge = charge
+        self.hashers = hasher.new_hashers(size)
+        self.hashed = 0
+        self.pos = 0
+        self._raw_pos = 0
+        self._uncharged = 0
+        self._view = None
+    def readable(self):
+        return True
+    def seekable(self):
+        return self.raw.seekable()
+    def tell(self):
+        return self.pos
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.pos = offset
+        return offset
+    def readinto(self, b):
+        if self.hashed < self.pos <= self.hashed + self.GAP:
+            self._hash_to(self.pos)
+        self._seek_raw(self.pos)
+        n = self.raw.readinto(b)
+        if not n:
+            return 0
+        self._raw_pos += n
+        self._account(n)
+        if self.pos <= self.hashed < self.pos + n:
+            with memoryview(b) as view, view.cast("B") as data:
+                self._update(data[self.hashed - self.pos:n])
+            self.hashed = self.pos + n
+        self.pos += n
+        return n
+    def finish(self):
+        # {algorithm: hex} of the whole stream
+        self._hash_to(None)
+        if self.charge and self._uncharged:
+            self.hasher.charge(self._uncharged)
+            self._uncharged = 0
+        return {algorithm: hasher.hexdigest() for algorithm, hasher in zip(self.hasher.algorithms, self.hashers)}
+    def _hash_to(self, end):
+        # Reads [hashed, end) in order, or up to the end of the stream when end is None
+        if self._view is None:
+            self._view = memoryview(bytearray(self.GAP))
+        self._seek_raw(self.hashed)
+        while end is None or self.hashed < end:
+            n = self.raw.readinto(self._view if end is None else self._view[:min(self.GAP, end - self.hashed)])
+            if not n:
+                break
+            self._raw_pos += n
+            self._account(n)
+            self._update(self._view[:n])
+            self.hashed += n
+    def _update(self, chunk):
+        for hasher in self.hashers:
+            hasher.update(chunk)
+    def _seek_raw(self, offset):
+        # A member stream seeks by inflating again, so it is only moved when the position changed
+        if offset != self._raw_pos:
+            self.raw.seek(offset)
+            self._raw_pos = offset
+    def _account(self, nbytes):
+        # Charged per hasher chunk: the parser's many small reads of one region are one read of the disk
+        if self.charge:
+            self._uncharged += nbytes
+            if self._uncharged >= self.hasher.chunk_size:
+                self.hasher.charge(self._uncharged)
+                self._uncharged = 0
+class ArchiveReader:
+    # Streams the members of zip and tar containers (plain, gzip, bzip2, xz) without extracting them,
+    # in one read of the container: it is parsed through a HashingReader, which also yields its own
+    # digests, and each member is hashed in the hasher's algorithms while a nested archive in it is
+    # parsed from the same member stream (member streams are seekable), as long as its level is below
+    # max_depth; the outer archive is level 1. members() yields ("dir/inner.tar!file", size,
+    # {algorithm: hex}) for every regular member, "!" separating the levels.
+    SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+    SEPARATOR = "!"
+    # Damaged, truncated or encrypted members end that archive (or skip that member), not the scan
+    ERRORS = (OSError, EOFError, RuntimeError, ValueError, zlib.error, zipfile.BadZipFile, tarfile.TarError)
+    def __init__(self, hasher, max_depth=1):
+        self.hasher = hasher
+        self.max_depth = max(1, max_depth)
+    @classmethod
+    def is_archive(cls, name):
+        return name.lower().endswith(cls.SUFFIXES)
+    @classmethod
+    def container(cls, path):
+        # The archive file of a "container!member" path, None when the path names no member
+        index = path.find(cls.SEPARATOR)
+        while index != -1:
+            if cls.is_archive(path[:index]):
+                return path[:index]
+            index = path.find(cls.SEPARATOR, index + 1)
+        return None
+    def members(self, path, digests=None):
+        # digests, when given, receives the container's own {algorithm: hex} once its members are read
+        with open(path, 'rb') as f:
+            fd = f.fileno()
+            if self.hasher.cache_friendly:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            try:
+                stream = HashingReader(f, self.hasher, os.fstat(fd).st_size, charge=True)
+                try:
+                    yield from self._members(stream, path, 1, "")
+                except InterruptedError:
+                    raise
+                except self.ERRORS:
+                    # A damaged container ends its member list; its own digests are still computed
+                    pass
+                if digests is not None:
+                    digests.update(stream.finish())
+            finally:
+                if self.hasher.cache_friendly:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    def _members(self, f, name, level, prefix):
+        if name.lower().endswith(".zip"):
+            with zipfile.ZipFile(f) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+                    try:
+                        member = archive.open(info)
+                    except self.ERRORS:
+                        continue
+                    with member:
+                        yield from self._member(member, prefix + info.filename, info.file_size, level)
+        else:
+            with tarfile.open(fileobj=f, mode="r:*") as archive:
+                while True:
+                    info = archive.next()
+                    if info is None:
+                        break
+                    # TarFile keeps every header it has read; dropped so that huge tars stay bounded
+                    archive.members = []
+                    if not info.isfile():
+                        continue
+                    with archive.extractfile(info) as member:
+                        yield from self._member(member, prefix + info.name, info.size, level)
+    def _member(self, stream, name, size, level):
+        reader = HashingReader(stream, self.hasher, size)
+        if level < self.max_depth and self.is_archive(name) and stream.seekable():
+            try:
+                yield from self._members(reader, name, level + 1, name + self.SEPARATOR)
+            except InterruptedError:
+                raise
+            except self.ERRORS:
+                pass
+        yield name, size, reader.finish()
+
+# ---------------- IOC Lists ----------------
+# The algorithm of a hex digest is told by its length
+DIGEST_ALGORITHMS = {32: "md5", 40: "sha1", 64: "sha256", 128: "blake2b"}
+HASH_HEX = re.compile(r'(?<![0-9A-Fa-f])(?:[0-9A-Fa-f]{128}|[0-9A-Fa-f]{64}|[0-9A-Fa-f]{40}|[0-9A-Fa-f]{32})(?![0-9A-Fa-f])')
+def digest_algorithm(value):
+    return DIGEST_ALGORITHMS.get(len(value))
+def parse_iocs(text):
+    # {hex digest: label} from pasted text or a TXT/CSV export (MD5, SHA-1, SHA-256 or BLAKE2b); the
+    # label is the first other field on the hash's line (e.g. "hash,malware name"), lines without a
+    # hash (headers) are skipped
+    iocs = {}
+    for line in text.splitlines():
+        hashes = HASH_HEX.findall(line)
+        if not hashes:
+            continue
+        fields = [f.strip().strip('"\'') for f in re.split(r'[,;\t]', HASH_HEX.sub('', line))]
+        label = next((f for f in fields if f), "")
+        for value in hashes:
+            iocs.setdefault(value.lower(), label)
+    return iocs
+def load_ioc_file(path):
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        return parse_iocs(f.read())
+
+# ---------------- Exclusion Rules ----------------
+class ExclusionMatcher:
+    # Rules are compiled once per search:
+    #   /abs/path       excludes the path and everything below it (path-component trie)
+    #   node_modules    a bare name excludes anything with that name and everything inside it
+    #   **/node_modules same as a bare name
+    #   *.tmp           a name suffix (set lookup); other globs without a separator match the name
+    #   build/**/out    globs with a separator match the whole path, at any depth unless absolute
+    #   re:<regex>      a regular expression searched in the whole path
+    # A rule prefixed with "+" is an include: it wins over every exclusion, and the directories
+    # leading to an included path are still walked.
+    # With the walk roots given, names and relative globs only match below the root that holds a path:
+    # "build" does not exclude a whole scan whose root lies inside a build directory.
+    _EXCLUDE, _INCLUDE, _INCLUDE_BELOW = 'exclude', 'include', 'include_below'
+    def __init__(self, rules=(), roots=()):
+        self.rules = [r.strip() for r in rules if r and r.strip()]
+        self._trie = {}
+        self._names = {False: set(), True: set()}
+        self._suffixes = {False: set(), True: set()}
+        # Longest first, so a path is placed under the innermost root that holds it
+        self._roots = sorted({tuple(self._split(os.path.normcase(os.path.abspath(root)).replace(os.sep, '/')))
+                              for root in roots}, key=len, reverse=True)
+        name_patterns = {False: [], True: []}
+        path_patterns = {False: [], True: []}
+        relative_patterns = {False: [], True: []}
+        for rule in self.rules:
+            include = rule.startswith('+')
+            body = rule[1:].strip() if include else rule
+            if body.startswith('re:'):
+                path_patterns[include].append(body[3:])
+                continue
+            absolute = os.path.isabs(body)
+            body = os.path.normcase(body).replace(os.sep, '/')
+            literal = not any(c in body for c in '*?[')
+            if literal and absolute:
+                self._add_path(body, include)
+            elif literal and '/' not in body.strip('/'):
+                self._names[include].add(body.strip('/'))
+            elif body.startswith('**/') and '/' not in body[3:] and not any(c in body[3:] for c in '*?['):
+                self._names[include].add(body[3:])
+            elif '/' not in body:
+                if body.startswith('*.') and not any(c in body[1:] for c in '*?['):
+                    self._suffixes[include].add(body[1:])
+                else:
+                    name_patterns[include].append(fnmatch.translate(body))
+            else:
+                (path_patterns if absolute else relative_patterns)[include].append(self._glob_regex(body))
+        # One combined expression per kind, so a path is matched once however many globs there are
+        self._name_re = {k: re.compile('|'.join(v)) if v else None for k, v in name_patterns.items()}
+        self._path_re = {k: re.compile('|'.join(f'(?:{p})' for p in v)) if v else None
+                         for k, v in path_patterns.items()}
+        self._relative_re = {k: re.compile('|'.join(f'(?:{p})' for p in v)) if v else None
+                             for k, v in relative_patterns.items()}
+    @staticmethod
+    def _glob_regex(pattern):
+        out = [] if pattern.startswith('/') else ['(?:^|/)']
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith('**/', i):
+                out.append('(?:.*/)?')
+                i += 3
+            elif pattern.startswith('**', i):
+                out.append('.*')
+                i += 2
+            elif pattern[i] == '*':
+                out.append('[^/]*')
+                i += 1
+            elif pattern[i] == '?':
+                out.append('[^/]')
+                i += 1
+            elif pattern[i] == '[' and ']' in pattern[i + 1:]:
+                end = pattern.index(']', i + 1)
+                out.append('[' + pattern[i + 1:end].replace('!', '^', 1) + ']')
+                i = end + 1
+            else:
+                out.append(re.escape(pattern[i]))
+                i += 1
+        return ''.join(out) + '$'
+    def _add_path(self, path, include):
+        node = self._trie
+        for part in self._split(path):
+            if include:
+                node[self._INCLUDE_BELOW] = True
+            node = node.setdefault(part, {})
+        node[self._INCLUDE if include else self._EXCLUDE] = True
+    @staticmethod
+    def _split(path):
+        return [part for part in path.split('/') if part]
+    def _below_root(self, parts):
+        for root in self._roots:
+            if len(root) <= len(parts) and tuple(parts[:len(root)]) == root:
+                return parts[len(root):]
+        return parts
+    def _pattern_match(self, include, path, below):
+        # below: the components of path under its walk root (all of them without roots)
+        if below:
+            if self._names[include] and not self._names[include].isdisjoint(below):
+                return True
+            if self._name_match(include, below[-1]):
+                return True
+            if self._relative_re[include] and self._relative_re[include].search('/'.join(below)):
+                return True
+        elif not self._roots and self._name_match(include, path):
+            return True
+        return bool(self._path_re[include] and self._path_re[include].search(path))
+    def _name_match(self, include, name):
+        if self._suffixes[include]:
+            dot = name.find('.', 1)
+            while dot != -1:
+                if name[dot:] in self._suffixes[include]:
+                    return True
+                dot = name.find('.', dot + 1)
+        return bool(self._name_re[include] and self._name_re[include].match(name))
+    def excluded(self, path, is_dir=True):
+        # Cost grows with the depth of the path, not with the number of rules
+        if self._roots and not os.path.isabs(path):
+            path = os.path.abspath(path)
+        path = os.path.normcase(path).replace(os.sep, '/')
+        parts = self._split(path)
+        node = self._trie
+        # A rule for the root itself ("/") lands on the trie root and covers every path
+        trie_excluded = self._EXCLUDE in node
+        trie_included = self._INCLUDE in node
+        leads_to_include = False
+        for part in parts:
+            node = node.get(part)
+            if node is None:
+                break
+            trie_excluded = trie_excluded or self._EXCLUDE in node
+            trie_included = trie_included or self._INCLUDE in node
+        else:
+            leads_to_include = is_dir and self._INCLUDE_BELOW in node
+        if trie_included or leads_to_include:
+            return False
+        below = self._below_root(parts)
+        if not trie_excluded and not self._pattern_match(False, path, below):
+            return False
+        return not self._pattern_match(True, path, below)
+
+# ---------------- Parallel Directory Walker ----------------
+class DirectoryWalker:
+    # N threads list directories concurrently; each keeps its own deque of pending directories
+    # (depth-first, popped from the right) and steals from the left of the others when it runs dry.
+    # walk() yields the accepted os.DirEntry files through a bounded queue. The set of files is the
+    # same for any thread count; only the order differs. threads=1 is deterministic: directories in
+    # depth-first scandir order, the files of each one before those of its subdirectories.
+    # on_listed(directory, subdirs, files) is called once a directory has been listed to the end.
+    _DONE = object()
+    def __init__(self, roots, want_dir, want_file, threads=8, max_pending=4096, on_listed=None):
+        self.roots = list(roots)
+        self.want_dir = want_dir
+        self.want_file = want_file
+        self.on_listed = on_listed
+        self.threads = max(1, threads)
+        self.output = queue.Queue(maxsize=max_pending)
+        self.dirs = 0
+        self.entries = 0
+        self.elapsed = 0.0
+        self._deques = [collections.deque() for _ in range(self.threads)]
+        self._cond = threading.Condition()
+        self._outstanding = 0
+        self._stopped = False
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+    def _next_dir(self, index):
+        with self._cond:
+            while not self._stopped:
+                own = self._deques[index]
+                if own:
+                    return own.pop()
+                for other in range(index + 1, index + self.threads):
+                    victim = self._deques[other % self.threads]
+                    if victim:
+                        return victim.popleft()
+                if self._outstanding == 0:
+                    return None
+                self._cond.wait()
+            return None
+    def _emit(self, item):
+        while not self._stopped:
+            try:
+                self.output.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    def _worker(self, index):
+        while True:
+            directory = self._next_dir(index)
+            if directory is None:
+                return
+            subdirs = []
+            listed = 0
+            emitted = 0
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if self._stopped:
+                            break
+                        listed += 1
+                        try:
+                            if entry.is_dir():
+                                if self.want_dir(entry):
+                                    subdirs.append(entry.path)
+                                continue
+                            if not self.want_file(entry):
+                                continue
+                        except OSError:
+                            continue
+                        self._emit(entry)
+                        emitted += 1
+            except OSError:
+                pass
+            if self.on_listed and not self._stopped:
+                self.on_listed(directory, subdirs, emitted)
+            with self._cond:
+                # Reversed so that pop() visits subdirectories in listing order, as the serial walk does
+                self._deques[index].extend(reversed(subdirs))
+                self._outstanding += len(subdirs) - 1
+                self.dirs += 1
+                self.entries += listed
+                self._cond.notify_all()
+    def _run(self, workers):
+        for worker in workers:
+            worker.join()
+        self.output.put(self._DONE)
+    def walk(self):
+        started = time.monotonic()
+        self._deques[0].extend(reversed(self.roots))
+        self._outstanding = len(self.roots)
+        workers = [threading.Thread(target=self._worker, args=(i,), daemon=True) for i in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        threading.Thread(target=self._run, args=(workers,), daemon=True).start()
+        item = None
+        try:
+            while True:
+                item = self.output.get()
+                if item is self._DONE:
+                    break
+                yield item
+        finally:
+            if item is not self._DONE:
+                # Abandoned early: unblock the workers and wait for them to wind down
+                self.stop()
+                while self.output.get() is not self._DONE:
+                    pass
+            self.elapsed = time.monotonic() - started
+
+# ---------------- Adaptive Concurrency (per device) ----------------
+def mount_point(path):
+    # Stable name for the device a path lives on (st_dev numbers change across mounts and reboots)
+    path = os.path.abspath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+def parse_device_workers(text):
+    # "4" pins every device to 4 concurrent reads; "/mnt/evidence=2; D:\\=8" pins only those mount
+    # points and lets the others tune. Empty or 0 = auto.
+    text = text.strip()
+    if text.isdigit() or not text:
+        return int(text or 0) or None
+    pinned = {}
+    for item in text.split(";"):
+        mount, _, workers = item.rpartition("=")
+        if mount.strip() and workers.strip().isdigit() and int(workers):
+            pinned[mount.strip()] = min(int(workers), 256)
+    return pinned or None
+
+def format_device_workers(workers):
+    if isinstance(workers, dict):
+        return "; ".join(f"{mount}={n}" for mount, n in workers.items())
+    return str(workers or 0)
+
+class DeviceGate:
+    # Limits concurrent reads on one device. With tuning enabled it hill-climbs the limit: every
+    # `window` seconds the read throughput is compared with the previous window; the limit keeps
+    # moving in the same direction while throughput improves, turns around when it drops and holds
+    # on a plateau, so it settles at the knee. best is the (limit, bytes/s) of the fastest window.
+    def __init__(self, name, limit, low=1, high=32, tune=True, window=2.0, tolerance=0.05):
+        self.name = name
+        self.limit = max(low, min(high, limit))
+        self.low = low
+        self.high = high
+        self.tune = tune
+        self.window = window
+        self.tolerance = tolerance
+        self.active = 0
+        self.best = (self.limit, 0.0)
+        self.history = []
+        self._cond = threading.Condition()
+        self._bytes = 0
+        self._window_start = self.started = time.monotonic()
+        self.total_bytes = 0
+        self._last_rate = None
+        self._direction = 1
+    def __enter__(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+        return self
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+    def rate(self):
+        return self.total_bytes / max(time.monotonic() - self.started, 0.001)
+    def record(self, nbytes):
+        with self._cond:
+            self.total_bytes += nbytes
+            if not self.tune:
+                return
+            self._bytes += nbytes
+            elapsed = time.monotonic() - self._window_start
+            if elapsed < self.window:
+                return
+            rate = self._bytes / elapsed
+            self._bytes = 0
+            self._window_start = time.monotonic()
+            if not rate:
+                return  # only cached digests in this window: nothing was read
+            if rate > self.best[1]:
+                self.best = (self.limit, rate)
+            if self._last_rate is not None:
+                if rate < self._last_rate * (1 - self.tolerance):
+                    self._direction = -self._direction
+                elif rate <= self._last_rate * (1 + self.tolerance):
+                    self._last_rate = rate
+                    return
+            self._last_rate = rate
+            new_limit = max(self.low, min(self.high, self.limit + self._direction))
+            if new_limit != self.limit:
+                self.history.append((round(rate), self.limit, new_limit))
+                self.limit = new_limit
+                self._cond.notify_all()
+
+# ---------------- Batched Record Writer (write-behind) ----------------
+class RecordWriter(threading.Thread):
+    # Hash workers put() rows into a bounded queue; this thread commits them with executemany
+    # once batch_size rows are pending or flush_interval seconds have passed.
+    _FRONTIER = object()
+    _ARCHIVE = object()
+    def __init__(self, db, batch_size=2000, flush_interval=1.0, max_pending=20000):
+        super().__init__(daemon=True)
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.written = 0
+        self.error = None
+        self._rows_lost = False
+        self._frontier = {}
+        self._archives = []
+    def put(self, file_path, file_hash, extension, fingerprint=None, session_id=None, digests=None, member=None):
+        # Blocks when the queue is full, which throttles the hash workers to the disk's write speed.
+        # Rows put with a session_id are hits of that search; digests ({algorithm: hex}) go to file_digests.
+        # member names a file inside the archive file_path ("dir/inner.tar!file").
+        row = (file_path, file_hash, extension) + tuple(fingerprint or (None, None, None, None))
+        if digests or member:
+            row += (digests, member)
+        self.queue.put((session_id, row))
+    def frontier(self, session_id, reached=(), done=()):
+        # Walk checkpoint; committed after the rows queued before it, so a directory is never recorded
+        # as done before its files are
+        self.queue.put((self._FRONTIER, (session_id, reached, done)))
+    def archive(self, path, fingerprint, depth, members, first=False, complete=False, algorithms=("sha256",)):
+        self.queue.put((self._ARCHIVE, (path, fingerprint, depth, members, first, complete, algorithms)))
+    def flush(self):
+        # Wait until everything queued so far has been committed
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+    def close(self):
+        # Flush whatever is still queued and stop the writer; used on finish, stop() and cancel
+        self.queue.put(None)
+        self.join()
+    def _commit(self, pending):
+        for session_id, rows in pending.items():
+            if not rows:
+                continue
+            try:
+                self.db.save_records(rows, session_id, matched=session_id is not None)
+                self.written += len(rows)
+            except Exception as e:
+                self.error = str(e)
+                self._rows_lost = True
+        pending.clear()
+        for session_id, (reached, done) in self._frontier.items():
+            try:
+                # Once rows are lost, any directory finished since may be missing some of them: those
+                # directories stay pending so that a resumed scan hashes them again
+                self.db.save_frontier(session_id, reached, () if self._rows_lost else done)
+            except Exception as e:
+                self.error = str(e)
+        self._frontier.clear()
+        for args in self._archives:
+            try:
+                self.db.save_archive(*args)
+            except Exception as e:
+                self.error = str(e)
+        self._archives = []
+    def run(self):
+        pending = {}
+        count = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = False
+            if item is None or isinstance(item, threading.Event):
+                self._commit(pending)
+                count = 0
+                if item is None:
+                    break
+                item.set()
+                continue
+            if item and item[0] is self._FRONTIER:
+                session_id, reached, done = item[1]
+                checkpoint = self._frontier.setdefault(session_id, ([], []))
+                checkpoint[0].extend(reached)
+                checkpoint[1].extend(done)
+                count += 1
+            elif item and item[0] is self._ARCHIVE:
+                self._archives.append(item[1])
+                count += len(item[1][3])
+            elif item:
+                session_id, row = item
+                pending.setdefault(session_id, []).append(row)
+                count += 1
+            if count >= self.batch_size or time.monotonic() >= deadline:
+                self._commit(pending)
+                count = 0
+                deadline = time.monotonic() + self.flush_interval
 
 # ---------------- Thread Classes for File Search ----------------
 class BaseSearchThread(QThread):
@@ -445,111 +2464,913 @@ class BaseSearchThread(QThread):
         self.resume()
 
 class LocalSearchThread(BaseSearchThread):
+    scan_summary = pyqtSignal(dict)
+    LARGE_FILE = 64 << 20
+    SCHEDULE_BATCH = 4096
+    LARGE_WORKERS = 1
+    ARCHIVE_BATCH = 1000
+    FRONTIER_REPORT = 5
     def __init__(self, paths, target_hash, extensions, excluded_paths, min_size=0, data_filter=None,
-                 digital_signature=None):
+                 digital_signature=None, target_sizes=None, io_mode="normal", max_bytes_per_sec=None,
+                 max_iops=None, io_order="scandir", per_device=2, use_fiemap=False, workers=None, resume=False,
+                 follow_symlinks=False, archive_depth=0, algorithms=(), max_hits=None, time_budget=None,
+                 byte_budget=None):
         super().__init__()
         self.paths = paths
         self.target_hash = target_hash
+        # One hash or a whole IOC list; every digest is checked against the set in O(1)
+        self.targets = frozenset([target_hash] if isinstance(target_hash, str) else target_hash)
+        # Targets may be MD5, SHA-1, SHA-256 or BLAKE2b (told apart by length); every algorithm needed by a
+        # target or configured in algorithms is computed from the same read and stored with the file
+        wanted = {digest_algorithm(value) for value in self.targets} | set(algorithms)
+        self.extra_algorithms = tuple(sorted(wanted - {None, "sha256"}))
         self.extensions = [ext for ext in extensions if ext != "all"]
-        self.excluded_paths = [os.path.normpath(p) for p in excluded_paths]
+        self.excluded_paths = list(excluded_paths)
+        self.exclusions = ExclusionMatcher(self.excluded_paths, paths)
         self.db = DatabaseManager()
         self._pause_event = threading.Event()
         self._pause_event.set()
         self.min_size = min_size
         self.data_filter = data_filter
         self.digital_signature = digital_signature
-    def _should_exclude(self, current_path):
-        current = os.path.normpath(current_path)
-        return any(os.path.commonpath([current, excluded]) == excluded for excluded in self.excluded_paths)
+        # Sizes of the target files when every one is known: other sizes are rejected from the
+        # stat() alone, without opening the file (and without indexing it)
+        self.target_sizes = frozenset(target_sizes) if target_sizes else None
+        # The filters that decide which files a scan reads and what it stores for them. A stopped scan is
+        # only resumed with the same ones: its finished directories are not walked again.
+        self.scan_key = hashlib.sha256(json.dumps([
+            sorted(ext.lower() for ext in self.extensions), sorted(self.excluded_paths), self.min_size,
+            sorted(self.target_sizes or ()), follow_symlinks, archive_depth, self.extra_algorithms,
+        ]).encode()).hexdigest()
+        self.stats = {"files": 0, "hashed": 0, "reused": 0, "bytes_hashed": 0, "hits": 0,
+                      "dirs": 0, "walk_seconds": 0.0, "size_skipped": 0, "inode_shared": 0, "bytes_avoided": 0,
+                      "archives": 0, "members": 0}
+        self.session_id = None
+        # Directory listing is latency-bound (NFS, millions of small directories), not CPU-bound
+        self.walk_threads = min(16, (os.cpu_count() or 4) * 2)
+        self.walker = None
+        # Early termination: after max_hits new hits, time_budget seconds or byte_budget bytes read the search
+        # ends as if stopped (walk stopped, queued files dropped, reads in flight abandoned). Its frontier
+        # is kept, so the same search continues from where it stopped with resume=True.
+        self.max_hits = max_hits
+        self.time_budget = time_budget
+        self.byte_budget = byte_budget
+        self.stop_reason = None  # "hits", "time" or "bytes" once a limit has ended the search
+        self._run_hits = 0
+        self._bytes_read = 0
+        self._deadline = None
+        self._budget_lock = threading.Lock()
+        limited = bool(max_hits or time_budget or byte_budget)
+        # io_mode "cache_friendly" keeps hashed files out of the page cache; the limits pace every read
+        if io_mode == "normal" and not (max_bytes_per_sec or max_iops) and not self.extra_algorithms and not limited:
+            self.hasher = FileHasher.default()
+        else:
+            limiter = RateLimiter(max_bytes_per_sec, max_iops) if (max_bytes_per_sec or max_iops) else None
+            self.hasher = FileHasher(cache_friendly=io_mode == "cache_friendly", limiter=limiter,
+                                     algorithms=("sha256",) + self.extra_algorithms,
+                                     cancel=self._budget_spent if limited else None)
+        # walk -> hash workers -> RecordWriter; every stage is bounded, so memory does not grow with the tree.
+        # workers=None tunes the number of concurrent reads per device (DeviceGate) below max_workers
+        # threads; an int fixes it for every device, a {mount point: n} dict only for those devices.
+        self.pinned_workers = {mount_point(mount): n for mount, n in workers.items()} \
+            if isinstance(workers, dict) else {}
+        self.fixed_workers = None if isinstance(workers, dict) else workers
+        self.max_workers = self.fixed_workers or max([16, (os.cpu_count() or 4) * 2]
+                                                     + list(self.pinned_workers.values()))
+        self.work_queue = queue.Queue(maxsize=self.max_workers * 64)
+        self._worker_error = None
+        # io_order "physical" (spinning disks, evidence images) inserts a scheduler stage: files are
+        # batched and sorted by (device, FIEMAP offset or inode), at most per_device files are read
+        # per device at once, and files >= LARGE_FILE go to their own lane so that one huge image
+        # never holds up thousands of small files
+        self.io_order = io_order
+        self.per_device = max(1, per_device)
+        self.use_fiemap = use_fiemap
+        self.large_queue = queue.Queue(maxsize=64)
+        self._batch = []
+        self._device_slots = {}
+        self._device_lock = threading.Lock()
+        self._tuning = None
+        # Walk checkpoint (scan_frontier): with resume=True a stopped scan of the same paths for the same
+        # targets continues from the directories it had not finished, and known ones are not walked again
+        self.resume_scan = resume
+        self.resumed = False
+        self.walk_roots = list(paths)
+        self._known_dirs = None
+        self._resumed_hits = set()
+        self._checkpoint = False
+        self._dir_files = {}  # directory -> files walked but not processed yet (negative until listed)
+        self._listed_dirs = {}  # directory -> files listed in it, once listed
+        self._frontier_lock = threading.Lock()
+        # Every inode is hashed once per scan: hardlinks share the digest of the first path read. Directories
+        # are tracked by (st_dev, st_ino) when links are followed, so a linked directory (or a link back up
+        # the tree) is walked only once and the files in it are not reached through a second path.
+        self.follow_symlinks = follow_symlinks
+        self._inodes = {}  # (st_dev, st_ino) of hardlinked files -> [Event set once hashed, digest, links not seen yet]
+        self._inode_lock = threading.Lock()
+        self._visited_dirs = set()
+        # archive_depth > 0 also searches the members of zip/tar files, nested archives down to that level;
+        # hits are reported as "container!member"
+        self.archives = ArchiveReader(self.hasher, archive_depth) if archive_depth else None
+    def stop(self):
+        super().stop()
+        if self.walker:
+            self.walker.stop()
+        # Files already walked but not yet hashed are dropped instead of drained
+        self._drop_queued()
+    def _end_early(self, reason):
+        with self._budget_lock:
+            if self.stop_reason or self._is_stopped:
+                return
+            self.stop_reason = reason
+        self.stop()
+    def _budget_spent(self, nbytes=0):
+        # FileHasher's cancel hook (after every chunk), also checked before every file and walked entry:
+        # ends the search once the time or byte budget has run out, and is true when a read in flight
+        # should be abandoned. Reads are not abandoned when the byte budget ended the search: they
+        # complete, so that a resumed run is never stuck in front of a file larger than its budget.
+        if not self._is_stopped:
+            if self.byte_budget:
+                with self._budget_lock:
+                    self._bytes_read += nbytes
+                    spent = self._bytes_read >= self.byte_budget
+                if spent:
+                    self._end_early("bytes")
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                self._end_early("time")
+        return self._is_stopped and self.stop_reason != "bytes"
+    def _drop_queued(self):
+        # The end-of-work sentinels may already be queued when stop() comes late; they are put back
+        self._batch = []
+        for pending in (self.work_queue, self.large_queue):
+            sentinels = 0
+            try:
+                while True:
+                    if pending.get_nowait() is None:
+                        sentinels += 1
+            except queue.Empty:
+                pass
+            for _ in range(sentinels):
+                pending.put(None)
+    def _enqueue(self, entry, lane=None):
+        # Blocks while the hash workers are behind (backpressure on the walk), but never past stop()
+        lane = self.work_queue if lane is None else lane
+        while not self._is_stopped:
+            try:
+                lane.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    def _schedule(self, entry):
+        if self.io_order != "physical":
+            self._enqueue(entry)
+            return
+        self._batch.append(entry)
+        if len(self._batch) >= self.SCHEDULE_BATCH:
+            self._flush_schedule()
+    def _physical_key(self, entry):
+        try:
+            st = entry.stat()
+        except OSError:
+            return (0, 1, 0)
+        offset = file_physical_offset(entry.path) if self.use_fiemap else None
+        return (st.st_dev, 0, offset) if offset is not None else (st.st_dev, 1, st.st_ino)
+    def _flush_schedule(self):
+        batch, self._batch = self._batch, []
+        batch.sort(key=self._physical_key)
+        for entry in batch:
+            try:
+                large = entry.stat().st_size >= self.LARGE_FILE
+            except OSError:
+                large = False
+            self._enqueue(entry, self.large_queue if large else None)
+    def _initial_workers(self, mount):
+        if self._tuning is None:
+            try:
+                self._tuning = self.db.load_device_tuning()
+            except Exception:
+                self._tuning = {}
+        if mount in self._tuning:
+            return self._tuning[mount]
+        return self.per_device if self.io_order == "physical" else os.cpu_count() or 4
+    def _device_slot(self, entry):
+        try:
+            device = entry.stat().st_dev
+        except OSError:
+            device = None
+        return self._device_gate(entry.path, device)
+    def _device_gate(self, path, device):
+        with self._device_lock:
+            slot = self._device_slots.get(device)
+            if slot is None:
+                mount = mount_point(path) if device is not None else ""
+                pinned = self.fixed_workers or self.pinned_workers.get(mount)
+                if pinned:
+                    slot = DeviceGate(mount, pinned, high=pinned, tune=False)
+                else:
+                    slot = DeviceGate(mount, self._initial_workers(mount), high=self.max_workers)
+                self._device_slots[device] = slot
+        return slot
+    def _hash_worker(self, lane=None):
+        lane = self.work_queue if lane is None else lane
+        while True:
+            entry = lane.get()
+            if entry is None:
+                return
+            try:
+                gate = self._device_slot(entry)
+                with gate:
+                    gate.record(self.process_file(entry))
+                if self._checkpoint and not self._is_stopped:
+                    self._file_done(entry.path)
+            except Exception as e:
+                self._worker_error = e
+                self.stop()
+    def _should_exclude(self, current_path, is_dir=True):
+        return self.exclusions.excluded(current_path, is_dir)
+    def _wanted_dir(self, entry):
+        if self._known_dirs is not None and os.path.normpath(entry.path) in self._known_dirs:
+            return False  # finished, or already on the frontier being resumed
+        if entry.is_symlink() and not self.follow_symlinks:
+            return False
+        if self._should_exclude(entry.path):
+            return False
+        return not self.follow_symlinks or self._first_visit(entry.stat())
+    def _first_visit(self, st):
+        key = (st.st_dev, st.st_ino)
+        with self._inode_lock:
+            if key in self._visited_dirs:
+                return False
+            self._visited_dirs.add(key)
+        return True
+    def _directory_listed(self, directory, subdirs, files):
+        if not self._checkpoint:
+            return
+        directory = os.path.normpath(directory)
+        with self._frontier_lock:
+            remaining = self._dir_files.pop(directory, 0) + files
+            if remaining:
+                self._dir_files[directory] = remaining
+                self._listed_dirs[directory] = files
+        self.writer.frontier(self.session_id, [os.path.normpath(path) for path in subdirs],
+                             () if remaining else ((directory, files),))
+    def _file_done(self, path):
+        # Frontier paths are normalised so that every walk of the same tree names a directory alike
+        directory = os.path.normpath(os.path.dirname(path))
+        with self._frontier_lock:
+            remaining = self._dir_files.pop(directory, 0) - 1
+            if remaining or directory not in self._listed_dirs:
+                self._dir_files[directory] = remaining
+                return
+            files = self._listed_dirs.pop(directory)
+        self.writer.frontier(self.session_id, (), ((directory, files),))
+    def _wanted_file(self, entry):
+        if not entry.is_file():
+            return False
+        if self.archives and ArchiveReader.is_archive(entry.name):
+            # Opened whatever its own extension and size: the filters apply to its members
+            return not (self.exclusions.rules and self._should_exclude(entry.path, is_dir=False))
+        if self.extensions and not any(entry.name.lower().endswith(ext.lower()) for ext in self.extensions):
+            return False
+        if self.exclusions.rules and self._should_exclude(entry.path, is_dir=False):
+            return False
+        if self.target_sizes is not None and entry.stat().st_size not in self.target_sizes:
+            self.mutex.lock()
+            self.stats["size_skipped"] += 1
+            self.mutex.unlock()
+            return False
+        return not (self.min_size > 0 and entry.stat().st_size < self.min_size)
     def scan_directory(self, folder):
+        # Yields os.DirEntry objects so the workers can reuse their cached stat()
+        subdirs = []
+        files = 0
         try:
-            for root, dirs, files in os.walk(folder):
-                if self._is_stopped:
-                    break
-                dirs[:] = [d for d in dirs if not self._should_exclude(os.path.join(root, d))]
-                for file in files:
+            with os.scandir(folder) as it:
+                for entry in it:
                     if self._is_stopped:
-                        break
-                    file_path = os.path.join(root, file)
-                    if self.extensions and not any(file.lower().endswith(ext.lower()) for ext in self.extensions):
-                        continue
+                        return
                     try:
-                        if self.min_size > 0 and os.path.getsize(file_path) < self.min_size:
+                        if entry.is_dir():
+                            if self._wanted_dir(entry):
+                                subdirs.append(entry.path)
+                                yield from self.scan_directory(entry.path)
                             continue
-                    except Exception:
+                        if not self._wanted_file(entry):
+                            continue
+                    except OSError:
                         continue
-                    yield file_path
+                    files += 1
+                    yield entry
         except Exception:
+            pass
+        if not self._is_stopped:
+            self._directory_listed(folder, subdirs, files)
+    def walk_entries(self):
+        # Same files as scan_directory() over every path, listed by walk_threads threads at once
+        if self.follow_symlinks:
+            for root in self.walk_roots:
+                try:
+                    self._first_visit(os.stat(root))
+                except OSError:
+                    pass
+        if self.walk_threads <= 1:
+            for base_path in self.walk_roots:
+                yield from self.scan_directory(base_path)
             return
-    def process_file(self, file_path):
-        if self._is_stopped:
-            return
-        self._pause_event.wait()
+        self.walker = DirectoryWalker(self.walk_roots, self._wanted_dir, self._wanted_file, self.walk_threads,
+                                      on_listed=self._directory_listed)
         try:
-            with open(file_path, 'rb') as f:
-                hasher = hashlib.sha256()
-                while True:
-                    chunk = f.read(131072)
-                    if not chunk:
-                        break
-                    hasher.update(chunk)
-                file_hash = hasher.hexdigest()
+            yield from self.walker.walk()
+        finally:
+            self.stats["dirs"] = self.walker.dirs
+            self.stats["walk_seconds"] = self.walker.elapsed
+    def _file_digest(self, entry):
+        st = entry.stat()
+        # Only hardlinked files go through the inode table, so that it holds no more than the links not
+        # seen yet; a symlink to a file is read as a file of its own
+        links = st.st_nlink if st.st_nlink > 1 else 0
+        return self._path_digest(entry.path, (st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev), links)
+    def _cached_digests(self, path, fingerprint):
+        # {algorithm: hex} stored for the path while they still match the fingerprint, else None
+        try:
+            if self.extra_algorithms:
+                return self.db.cached_digests(path, fingerprint, self.extra_algorithms)
+            cached = self.db.cached_hash(path, fingerprint)
+            return {"sha256": cached} if cached else None
         except Exception:
-            return
-        if self.digital_signature and self.digital_signature != "All":
-            if self.digital_signature not in os.path.basename(file_path):
-                pass
-        if file_hash == self.target_hash:
-            self.result_found.emit(file_path, file_hash)
-            self.mutex.lock()
+            return None
+    def _path_digest(self, path, fingerprint, links=0):
+        # links: st_nlink of a hardlinked file, else 0
+        # Returns (digests, fingerprint, reused, shared) with digests {algorithm: hex}: reused when the stored
+        # digests still match the fingerprint, shared when another path to the same inode was hashed
+        # earlier in this scan
+        cached = self._cached_digests(path, fingerprint)
+        if cached:
+            return cached, fingerprint, True, False
+        if not links or not fingerprint[2]:
+            return self.hasher.hash_digests(path, fingerprint[0]), fingerprint, False, False
+        key = (fingerprint[3], fingerprint[2])
+        with self._inode_lock:
+            slot = self._inodes.get(key)
+            first = slot is None
+            if first:
+                # Every other path to the inode is one of its hardlinks: the entry goes after the last one
+                slot = self._inodes[key] = [threading.Event(), None, links - 1]
+        if first:
             try:
-                self.db.save_record('search_history', file_path, file_hash, os.path.splitext(file_path)[1])
+                slot[1] = self.hasher.hash_digests(path, fingerprint[0])
             finally:
-                self.mutex.unlock()
-        else:
+                slot[0].set()
+            return slot[1], fingerprint, False, False
+        slot[0].wait()
+        with self._inode_lock:
+            slot[2] -= 1
+            if slot[2] == 0:
+                del self._inodes[key]
+        if slot[1] is None:
+            # The first read failed; this path gets its own attempt
+            return self.hasher.hash_digests(path, fingerprint[0]), fingerprint, False, False
+        return slot[1], fingerprint, False, True
+    def process_file(self, entry):
+        # Returns the number of bytes read from disk (0 for a reused digest), fed to the device gate
+        if self._budget_spent() or self._is_stopped:
+            return 0
+        self._pause_event.wait()
+        file_path = entry.path
+        try:
+            if self.archives and ArchiveReader.is_archive(entry.name):
+                digests, fingerprint, reused, shared = self._archive_digest(entry)
+            else:
+                digests, fingerprint, reused, shared = self._file_digest(entry)
+        except Exception:
+            return 0
+        file_hash = digests["sha256"]
+        # The target this file matches, in whichever algorithm it was given
+        matched = next((value for value in digests.values() if value in self.targets), None)
+        # Hits of the interrupted run are already reported; a directory left pending is hashed again
+        repeated = matched and file_path in self._resumed_hits
+        self.mutex.lock()
+        try:
+            self.stats["files"] += 1
+            if matched and not repeated:
+                self.stats["hits"] += 1
+                self._run_hits += 1
+            if reused:
+                self.stats["reused"] += 1
+            elif shared:
+                self.stats["inode_shared"] += 1
+                self.stats["bytes_avoided"] += fingerprint[0]
+            else:
+                self.stats["hashed"] += 1
+                self.stats["bytes_hashed"] += fingerprint[0]
+        finally:
+            self.mutex.unlock()
+        extra = digests if self.extra_algorithms else None
+        if matched:
+            if not repeated:
+                self.result_found.emit(file_path, matched)
+            self.writer.put(file_path, file_hash, os.path.splitext(file_path)[1], fingerprint, self.session_id,
+                            None if reused else extra)
+            self._hit_limit()
+        elif not reused:
+            self.writer.put(file_path, file_hash, os.path.splitext(file_path)[1], fingerprint, digests=extra)
+        return 0 if reused or shared else fingerprint[0]
+    def _hit_limit(self):
+        # Hits of reads already in flight when the limit is reached are still reported
+        if self.max_hits and self._run_hits >= self.max_hits:
+            self._end_early("hits")
+    def _wanted_member(self, member, size):
+        if self.extensions and not any(member.lower().endswith(ext.lower()) for ext in self.extensions):
+            return False
+        return not (self.min_size > 0 and size < self.min_size)
+    def _archive_digest(self, entry):
+        # _path_digest() for an archive: the container and its members are hashed in the same read, and
+        # neither is read again while both are cached for its fingerprint
+        st = entry.stat()
+        fingerprint = (st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+        cached = self._cached_digests(entry.path, fingerprint)
+        if cached:
+            try:
+                members = self.db.cached_archive(entry.path, fingerprint, self.archives.max_depth,
+                                                 self.hasher.algorithms)
+            except Exception:
+                members = None
+            if members is not None:
+                self._search_members(entry.path, fingerprint, members)
+                return cached, fingerprint, True, False
+        digests = {}
+        self._search_members(entry.path, fingerprint, self._read_archive(entry.path, fingerprint, digests))
+        if not digests:
+            raise InterruptedError("Archive search stopped")
+        return digests, fingerprint, False, False
+    def _search_members(self, path, fingerprint, members):
+        count = 0
+        for member, size, digests in members:
+            if self._is_stopped:
+                break
+            count += 1
+            matched = next((value for value in digests.values() if value in self.targets), None)
+            if matched and self._wanted_member(member, size):
+                self._member_hit(path, fingerprint, member, size, digests, matched)
+        self.mutex.lock()
+        self.stats["archives"] += 1
+        self.stats["members"] += count
+        self.mutex.unlock()
+    def _member_hit(self, path, fingerprint, member, size, digests, matched):
+        # Stored like any hit, as "container!member" next to the container, so that a resumed search
+        # and the index keep it; the member's size and the container's mtime are its fingerprint
+        member_path = path + ArchiveReader.SEPARATOR + member
+        if member_path not in self._resumed_hits:
             self.mutex.lock()
+            self.stats["hits"] += 1
+            self._run_hits += 1
+            self.mutex.unlock()
+            self.result_found.emit(member_path, matched)
+        self.writer.put(path, digests["sha256"], os.path.splitext(member)[1], (size, fingerprint[1], None, None),
+                        self.session_id, digests if self.extra_algorithms else None, member=member)
+        self._hit_limit()
+    def _read_archive(self, path, fingerprint, digests):
+        # Members streamed from the container and stored in batches, the container's own digests filled
+        # in once it has been read; the cache entry is complete only when the container was read to the
+        # end (a damaged one ends early, the same way every time)
+        batch = []
+        first = True
+        complete = False
+        algorithms = self.hasher.algorithms
+        try:
+            for member in self.archives.members(path, digests):
+                batch.append(member)
+                if len(batch) >= self.ARCHIVE_BATCH:
+                    self.writer.archive(path, fingerprint, self.archives.max_depth, batch, first,
+                                        algorithms=algorithms)
+                    batch, first = [], False
+                yield member
+            # A search that ended while the container was being read leaves it uncached
+            complete = not self._is_stopped
+        finally:
+            self.writer.archive(path, fingerprint, self.archives.max_depth, batch, first, complete, algorithms)
+    def device_workers(self):
+        # {mount: (workers, bytes_per_sec)}: the limit of the fastest tuning window, or the current limit
+        # and the average read rate when the scan was too short to measure one
+        return {gate.name: gate.best if gate.best[1] else (gate.limit, gate.rate())
+                for gate in list(self._device_slots.values()) if gate.name}
+    def save_device_workers(self):
+        if self.fixed_workers:
+            return
+        tuned = {gate.name: gate.best for gate in list(self._device_slots.values())
+                 if gate.name and gate.best[1] and gate.name not in self.pinned_workers}
+        if tuned:
             try:
-                self.db.save_record('non_matching_hashes', file_path, file_hash, os.path.splitext(file_path)[1])
-            finally:
-                self.mutex.unlock()
+                self.db.save_device_tuning(tuned)
+            except Exception as e:
+                self.error_occurred.emit(str(e))
+    def _start_session(self):
+        # A resumed scan keeps its session, hit list and the file count of its finished directories;
+        # only its frontier is walked, and the files of the pending directories are counted again
+        previous = self.db.resumable_session(self.targets, self.paths, self.scan_key) if self.resume_scan else None
+        if previous:
+            self.session_id, self.stats["files"] = previous
+            self.walk_roots, self._known_dirs = self.db.load_frontier(self.session_id)
+            self.resumed = True
+            for path, file_hash in self.db.session_hits(self.session_id):
+                self._resumed_hits.add(path)
+                self.stats["hits"] += 1
+                self.result_found.emit(path, file_hash)
+        else:
+            self.session_id = self.db.start_session(self.targets, self.paths, self.scan_key)
+        self._checkpoint = True
     def run(self):
+        started = time.monotonic()
+        self._deadline = started + self.time_budget if self.time_budget else None
+        try:
+            self._start_session()
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+        self.writer = RecordWriter(self.db)
+        self.writer.start()
+        if self._checkpoint and not self.resumed:
+            self.writer.frontier(self.session_id, [os.path.normpath(path) for path in self.walk_roots])
         try:
-            processed_count = 0
-            self.progress_updated.emit(-1)
-            max_workers = os.cpu_count() or 4
-            futures = []
-            # تحسين السرعة: تحديث الأحداث كل 10 عملية بدلاً من 25
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                for base_path in self.paths:
-                    for file_path in self.scan_directory(base_path):
-                        if self._is_stopped:
+            try:
+                processed_count = 0
+                self.progress_updated.emit(-1)
+                lanes = [self.work_queue] * self.max_workers
+                if self.io_order == "physical":
+                    lanes += [self.large_queue] * self.LARGE_WORKERS
+                workers = [threading.Thread(target=self._hash_worker, args=(lane,), daemon=True) for lane in lanes]
+                for worker in workers:
+                    worker.start()
+                try:
+                    # تحسين السرعة: تحديث الأحداث كل 10 عملية بدلاً من 25
+                    for entry in self.walk_entries():
+                        if self._budget_spent() or self._is_stopped:
                             break
-                        futures.append(executor.submit(self.process_file, file_path))
+                        self._schedule(entry)
                         processed_count += 1
                         if processed_count % 10 == 0:
                             QCoreApplication.processEvents()
-                for future in futures:
+                    if self._batch and not self._is_stopped:
+                        self._flush_schedule()
+                finally:
+                    if self._is_stopped:
+                        self._drop_queued()
+                    for lane in lanes:
+                        lane.put(None)
+                    for worker in workers:
+                        worker.join()
+                if self._worker_error is not None:
+                    raise self._worker_error
+            finally:
+                # Files hashed before stop()/cancel are still committed
+                self.writer.close()
+                if self.session_id is not None:
+                    try:
+                        self.db.finish_session(self.session_id, self.stats["files"], self.stats["hits"])
+                    except Exception as e:
+                        self.error_occurred.emit(str(e))
+                if self._checkpoint and not self._is_stopped and not self.writer.error:
+                    # Completed: nothing left to resume (after a failed write the frontier is kept)
+                    try:
+                        self.db.discard_frontier(self.session_id)
+                    except Exception as e:
+                        self.error_occurred.emit(str(e))
+                try:
+                    self.db.refresh_digest_index()
+                except Exception as e:
+                    self.error_occurred.emit(str(e))
+                self.save_device_workers()
+            if self.writer.error:
+                self.error_occurred.emit(f"Database error: {self.writer.error}")
+            # Where an early-ended search stopped: the directories a resumed run will start from
+            frontier = []
+            if self.stop_reason and self._checkpoint:
+                try:
+                    frontier = sorted(self.db.load_frontier(self.session_id)[0])
+                except Exception as e:
+                    self.error_occurred.emit(str(e))
+            self.scan_summary.emit(dict(self.stats, elapsed=time.monotonic() - started,
+                                        workers=self.device_workers(), resumed=self.resumed,
+                                        stop_reason=self.stop_reason, frontier=len(frontier),
+                                        frontier_dirs=frontier[:self.FRONTIER_REPORT]))
+            self.finished.emit()
+        except Exception as e:
+            self.error_occurred.emit(f"Critical error: {str(e)}")
+
+# ---------------- Duplicate Finder Thread ----------------
+class DuplicateFinderThread(LocalSearchThread):
+    # Same walk, filters and digest cache as a disk search, staged so that most files are never read:
+    # size -> SHA-256 of the first and last 64 KB -> full SHA-256 (reused from the DB when unchanged).
+    # Files up to 128 KB are read whole in the middle stage, so their partial digest is the full one.
+    clusters_ready = pyqtSignal(list)
+    progress_text = pyqtSignal(str)
+    EDGE = 65536
+    # The disk-search settings that apply to a duplicate search
+    SETTINGS = ("io_mode", "max_bytes_per_sec", "max_iops", "io_order", "workers", "follow_symlinks")
+    def __init__(self, paths, extensions, excluded_paths, min_size=1, io_mode="normal", max_bytes_per_sec=None,
+                 max_iops=None, io_order="scandir", workers=None, follow_symlinks=False):
+        # Empty files are all identical and waste nothing, so they are skipped by default
+        super().__init__(paths, (), extensions, excluded_paths, max(min_size, 1), io_mode=io_mode,
+                         max_bytes_per_sec=max_bytes_per_sec, max_iops=max_iops, io_order=io_order,
+                         workers=workers, follow_symlinks=follow_symlinks)
+        self.stats.update({"size_groups": 0, "partial_hashed": 0, "full_hashed": 0, "clusters": 0, "wasted": 0})
+    def _partial_digest(self, item):
+        path, fingerprint = item
+        if self._is_stopped:
+            return item, None
+        try:
+            cached = self.db.cached_hash(path, fingerprint)
+        except Exception:
+            cached = None
+        if cached:
+            return item, ("full", cached, True)
+        size = fingerprint[0]
+        gate = self._device_gate(path, fingerprint[3])
+        try:
+            with gate:
+                hasher = self.hasher.hash_edges(path, size, self.EDGE)
+        except OSError:
+            return item, None
+        gate.record(min(size, 2 * self.EDGE))
+        if size <= 2 * self.EDGE:
+            self.writer.put(path, hasher.hexdigest(), os.path.splitext(path)[1], fingerprint)
+            return item, ("full", hasher.hexdigest(), False)
+        return item, ("partial", hasher.digest(), False)
+    def _full_digest(self, item):
+        path, fingerprint = item
+        if self._is_stopped:
+            return item, None
+        gate = self._device_gate(path, fingerprint[3])
+        try:
+            with gate:
+                digests, _, reused, _ = self._path_digest(path, fingerprint)
+        except OSError:
+            return item, None
+        digest = digests["sha256"]
+        gate.record(0 if reused else fingerprint[0])
+        if not reused:
+            self.writer.put(path, digest, os.path.splitext(path)[1], fingerprint)
+        return item, digest
+    def _record_links(self, item, digest, links):
+        path, fingerprint = item
+        for name in links.get((fingerprint[3], fingerprint[2]), ())[1:]:
+            self.writer.put(name, digest, os.path.splitext(name)[1], fingerprint)
+    def _staged(self, executor, func, items):
+        # Bounded chunks, like the scan pipeline, so millions of candidates never become millions of futures.
+        # In physical order the candidates are read in (device, inode) order.
+        if self.io_order == "physical":
+            items = sorted(items, key=lambda item: (item[1][3], item[1][2]))
+        items = iter(items)
+        while not self._is_stopped:
+            chunk = list(itertools.islice(items, self.max_workers * 64))
+            if not chunk:
+                return
+            yield from executor.map(func, chunk)
+    def run(self):
+        started = time.monotonic()
+        self.writer = RecordWriter(self.db)
+        self.writer.start()
+        try:
+            try:
+                self.progress_text.emit("Grouping files by size...")
+                by_size = {}
+                for entry in self.walk_entries():
                     if self._is_stopped:
                         break
-                    future.result()
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    by_size.setdefault(st.st_size, []).append(
+                        (entry.path, (st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)))
+                    self.stats["files"] += 1
+                candidates = [item for items in by_size.values() if len(items) > 1 for item in items]
+                self.stats["size_groups"] = sum(1 for items in by_size.values() if len(items) > 1)
+                by_size = None
+                # Hardlinks are one file: a single name per inode is read, the others share its result
+                links = {}
+                unique = []
+                for item in candidates:
+                    path, fingerprint = item
+                    key = (fingerprint[3], fingerprint[2])
+                    if fingerprint[2] and key in links:
+                        links[key].append(path)
+                        self.stats["inode_shared"] += 1
+                        self.stats["bytes_avoided"] += fingerprint[0]
+                        continue
+                    if fingerprint[2]:
+                        links[key] = [path]
+                    unique.append(item)
+                candidates = unique
+                self.progress_text.emit(f"{len(candidates)} files share a size; comparing first/last 64 KB...")
+                # Full digests (cached or small files) are final; partial ones still need a full read
+                # when another file of the same size has the same partial digest or a full digest
+                known = {}
+                partial = {}
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for item, result in self._staged(executor, self._partial_digest, candidates):
+                        if result is None:
+                            continue
+                        kind, digest, reused = result
+                        size = item[1][0]
+                        self.stats["reused" if reused else "partial_hashed"] += 1
+                        if kind == "full":
+                            known.setdefault((size, digest), []).append(item)
+                            if not reused:
+                                self._record_links(item, digest, links)
+                        else:
+                            partial.setdefault((size, digest), []).append(item)
+                    sizes_with_known = {size for size, _ in known}
+                    ambiguous = [item for (size, _), items in partial.items()
+                                 if len(items) > 1 or size in sizes_with_known for item in items]
+                    partial = None
+                    self.progress_text.emit(f"Fully hashing {len(ambiguous)} ambiguous files...")
+                    for item, digest in self._staged(executor, self._full_digest, ambiguous):
+                        if digest is None:
+                            continue
+                        known.setdefault((item[1][0], digest), []).append(item)
+                        self._record_links(item, digest, links)
+                        self.stats["full_hashed"] += 1
+                        self.stats["bytes_hashed"] += item[1][0]
+                # Only distinct inodes take up space; extra hardlinks of one are listed but not counted
+                clusters = []
+                for (size, digest), items in known.items():
+                    paths = [path for item in items for path in links.get((item[1][3], item[1][2]), [item[0]])]
+                    if len(paths) > 1:
+                        clusters.append({"hash": digest, "size": size, "paths": sorted(paths),
+                                         "wasted": size * (len(items) - 1)})
+                clusters.sort(key=lambda c: c["wasted"], reverse=True)
+                self.stats["clusters"] = len(clusters)
+                self.stats["wasted"] = sum(c["wasted"] for c in clusters)
+            finally:
+                self.writer.close()
+                self.save_device_workers()
+            if self.writer.error:
+                self.error_occurred.emit(f"Database error: {self.writer.error}")
+            self.clusters_ready.emit(clusters)
+            self.scan_summary.emit(dict(self.stats, elapsed=time.monotonic() - started,
+                                        workers=self.device_workers()))
             self.finished.emit()
         except Exception as e:
             self.error_occurred.emit(f"Critical error: {str(e)}")
 
-# ---------------- Smart Check Thread (Non-Matching DB) ----------------
+# ---------------- Smart Check Thread (File Index) ----------------
 class SmartCheckThread(QThread):
     result_ready = pyqtSignal(list)
-    def __init__(self, db, target_hash):
+    # With validate=True every hit is stat()ed by a worker pool and compared with the recorded
+    # size/mtime; rows (path, hash, status, size, ctime, mtime) arrive in batches before result_ready
+    hits_validated = pyqtSignal(list)
+    VERIFIED, CHANGED, DELETED = "Verified", "Changed", "Deleted"
+    def __init__(self, db, target_hash, validate=False, batch_size=500):
         super().__init__()
         self.db = db
         self.target_hash = target_hash
+        self.validate = validate
+        self.batch_size = batch_size
+    def _validate_hit(self, hit):
+        path, hash_val, size, mtime_ns = hit
+        # An archive member is vouched for by its container, whose mtime the row keeps
+        container = ArchiveReader.container(path)
+        try:
+            st = os.stat(container or path)
+        except FileNotFoundError:
+            return (path, hash_val, self.DELETED, None, None, None)
+        except OSError:
+            return (path, hash_val, self.CHANGED, None, None, None)
+        # No recorded fingerprint (e.g. moved to History by hand) means the content cannot be vouched for
+        unchanged = (size is not None and (container is not None or st.st_size == size)
+                     and st.st_mtime_ns == mtime_ns)
+        return (path, hash_val, self.VERIFIED if unchanged else self.CHANGED,
+                st.st_size, st.st_ctime, st.st_mtime)
     def run(self):
         try:
-            results = self.db.search_non_matching(self.target_hash)
+            if isinstance(self.target_hash, str):
+                results = self.db.search_hash(self.target_hash, fingerprint=self.validate)
+            else:
+                results = self.db.search_hashes(self.target_hash, fingerprint=self.validate)
+            if self.validate and results:
+                batch = []
+                # stat() mostly waits on the disk, so the pool is larger than the CPU count
+                with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 4)) as executor:
+                    for row in executor.map(self._validate_hit, results):
+                        batch.append(row)
+                        if len(batch) >= self.batch_size:
+                            self.hits_validated.emit(batch)
+                            batch = []
+                if batch:
+                    self.hits_validated.emit(batch)
+                results = [hit[:2] for hit in results]
             self.result_ready.emit(results)
         except Exception as e:
             self.result_ready.emit([])
 
+# ---------------- Database Maintenance Thread ----------------
+class MaintenanceThread(QThread):
+    progress = pyqtSignal(str)
+    report_ready = pyqtSignal(dict)
+    error_occurred = pyqtSignal(str)
+    # Only one maintenance job at a time, whichever window started it
+    _slots = threading.Semaphore(1)
+    def __init__(self, db, max_workers=None, prune_batch=20000, archive=True):
+        super().__init__()
+        self.db = db
+        self.max_workers = max_workers or min(16, (os.cpu_count() or 4) * 2)
+        self.prune_batch = prune_batch
+        self.archive = archive
+    @staticmethod
+    def _ancestor_device(path):
+        # st_dev of the nearest existing ancestor of path, None when nothing up to the root exists
+        while True:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+            try:
+                return os.stat(path).st_dev
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            except OSError:
+                return None
+    @staticmethod
+    def _dead_rows(entry):
+        # One listdir per directory instead of one stat per file
+        directory, rows = entry
+        # st_dev recorded at hash time (0 on Windows, where DirEntry.stat() leaves it unset)
+        devices = {device for _, _, device in rows if device}
+        path = os.path.abspath(directory or os.curdir)
+        try:
+            present = set(os.listdir(path))
+            device = os.stat(path).st_dev
+        except (FileNotFoundError, NotADirectoryError):
+            # An unmounted volume (USB disk, evidence image, network share) is not proof that the
+            # files are gone: only prune when the nearest surviving ancestor is the recorded device
+            device = MaintenanceThread._ancestor_device(path)
+            if device is None:
+                return []
+            if devices:
+                if device not in devices:
+                    return []
+            else:
+                drive = os.path.splitdrive(path)[0]
+                if not drive:
+                    return []
+            return [file_id for file_id, _, _ in rows]
+        except OSError:
+            return []
+        if devices and device not in devices:
+            # The empty mount point directory of a volume that is not mounted
+            return []
+        # An archive member ("outer.zip!file") lives as long as its container
+        return [file_id for file_id, name, _ in rows
+                if name not in present and ArchiveReader.container(name) not in present]
+    def run(self):
+        if not self._slots.acquire(blocking=False):
+            self.error_occurred.emit("Database maintenance is already running")
+            return
+        try:
+            started = time.time()
+            bytes_before = self.db.file_size()
+            checked = pruned = 0
+            dead = []
+            self.progress.emit("Checking indexed paths...")
+            directories = self.db.iter_directories()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while True:
+                    # Bounded chunks keep memory flat on very large indexes
+                    chunk = list(itertools.islice(directories, self.max_workers * 64))
+                    if not chunk:
+                        break
+                    checked += sum(len(rows) for _, rows in chunk)
+                    for ids in executor.map(self._dead_rows, chunk):
+                        dead.extend(ids)
+                    while len(dead) >= self.prune_batch:
+                        self.db.prune_files(dead[:self.prune_batch], archive=self.archive)
+                        pruned += self.prune_batch
+                        del dead[:self.prune_batch]
+                    self.progress.emit(f"Checked {checked} paths, pruned {pruned + len(dead)}")
+            if dead:
+                self.db.prune_files(dead, archive=self.archive)
+                pruned += len(dead)
+            self.progress.emit("Refreshing digest index and statistics...")
+            self.db.refresh_digest_index()
+            self.db.analyze()
+            self.progress.emit("Compacting database...")
+            self.db.compact()
+            bytes_after = self.db.file_size()
+            report = {
+                "checked": checked,
+                "pruned": pruned,
+                "bytes_before": bytes_before,
+                "bytes_after": bytes_after,
+                "reclaimed": max(0, bytes_before - bytes_after),
+                "seconds": round(time.time() - started, 2),
+            }
+            self.db.record_maintenance(report)
+            self.report_ready.emit(report)
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+        finally:
+            self._slots.release()
+
 # ---------------- Dialog: Non-Matching Hash Database ----------------
 class NonMatchingDBDialog(QDialog):
     def __init__(self, db):
@@ -601,13 +3422,7 @@ class NonMatchingDBDialog(QDialog):
         """)
     def load_data(self):
         try:
-            query = '''
-                SELECT file_path, file_hash FROM non_matching_hashes
-                ORDER BY search_date DESC
-            '''
-            with self.db.conn:
-                cursor = self.db.conn.execute(query)
-                data = cursor.fetchall()
+            data = [(path, hash_val) for _, _, hash_val, path in self.db.fetch_records(DatabaseManager.STATUS_INDEXED)]
             self.table.setRowCount(len(data))
             for row, (path, hash_val) in enumerate(data):
                 name = os.path.basename(path)
@@ -642,6 +3457,44 @@ class NonMatchingDBDialog(QDialog):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error loading data: {str(e)}")
 
+# ---------------- Dialog: Duplicate Files ----------------
+class DuplicatesDialog(QDialog):
+    MAX_GROUPS = 5000
+    def __init__(self, clusters):
+        super().__init__()
+        self.clusters = clusters
+        self.setWindowTitle("Duplicate Files")
+        self.setGeometry(200, 200, 1000, 600)
+        self.init_ui()
+    @staticmethod
+    def format_size(size):
+        for unit in ("B", "KB", "MB", "GB"):
+            if size < 1024:
+                return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+            size /= 1024
+        return f"{size:.1f} TB"
+    def init_ui(self):
+        layout = QVBoxLayout()
+        wasted = sum(c["wasted"] for c in self.clusters)
+        files = sum(len(c["paths"]) for c in self.clusters)
+        summary = f"{len(self.clusters)} groups, {files} files, {self.format_size(wasted)} wasted"
+        if len(self.clusters) > self.MAX_GROUPS:
+            summary += f" (largest {self.MAX_GROUPS} groups shown)"
+        layout.addWidget(QLabel(summary))
+        self.tree = QTreeWidget()
+        self.tree.setColumnCount(3)
+        self.tree.setHeaderLabels(["File", "Size", "Wasted"])
+        self.tree.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        # Clusters arrive sorted by wasted space, largest first
+        for cluster in self.clusters[:self.MAX_GROUPS]:
+            group = QTreeWidgetItem([f"{cluster['hash']} ({len(cluster['paths'])} copies)",
+                                     self.format_size(cluster["size"]), self.format_size(cluster["wasted"])])
+            for path in cluster["paths"]:
+                group.addChild(QTreeWidgetItem([path, "", ""]))
+            self.tree.addTopLevelItem(group)
+        layout.addWidget(self.tree)
+        self.setLayout(layout)
+
 # ---------------- Dialog: Exclude Paths Management ----------------
 class ExcludePathsDialog(QDialog):
     def __init__(self, excluded_paths):
@@ -658,10 +3511,12 @@ class ExcludePathsDialog(QDialog):
         layout.addWidget(self.list_widget)
         btn_layout = QHBoxLayout()
         self.btn_add = HoverButton("Add Path", icon_name="folder")
+        self.btn_add_pattern = HoverButton("Add Pattern", icon_name="exclude")
         self.btn_remove = HoverButton("Remove Selected", icon_name="clear")
         self.btn_save = HoverButton("Save", icon_name="save")
         self.btn_close = HoverButton("Close", icon_name="exit")
         btn_layout.addWidget(self.btn_add)
+        btn_layout.addWidget(self.btn_add_pattern)
         btn_layout.addWidget(self.btn_remove)
         btn_layout.addWidget(self.btn_save)
         btn_layout.addStretch()
@@ -669,6 +3524,7 @@ class ExcludePathsDialog(QDialog):
         layout.addLayout(btn_layout)
         self.setLayout(layout)
         self.btn_add.clicked.connect(self.add_path)
+        self.btn_add_pattern.clicked.connect(self.add_pattern)
         self.btn_remove.clicked.connect(self.remove_selected)
         self.btn_save.clicked.connect(self.save_exclusions)
         self.btn_close.clicked.connect(self.accept)
@@ -700,6 +3556,22 @@ class ExcludePathsDialog(QDialog):
         if folder and folder not in self.excluded_paths:
             self.excluded_paths.append(folder)
             self.list_widget.addItem(folder)
+    def add_pattern(self):
+        pattern, ok = QInputDialog.getText(
+            self, "Add Pattern",
+            "Glob or regex to exclude, e.g. **/node_modules, *.tmp, re:\\.cache/\n"
+            "Prefix with + to include instead, e.g. +*.log")
+        pattern = pattern.strip()
+        if not ok or not pattern or pattern in self.excluded_paths:
+            return
+        if pattern.lstrip('+').strip().startswith('re:'):
+            try:
+                re.compile(pattern.lstrip('+').strip()[3:])
+            except re.error as e:
+                QMessageBox.warning(self, "Error", f"Invalid regular expression: {str(e)}")
+                return
+        self.excluded_paths.append(pattern)
+        self.list_widget.addItem(pattern)
     def remove_selected(self):
         selected_items = self.list_widget.selectedItems()
         for item in selected_items:
@@ -712,12 +3584,13 @@ class ExcludePathsDialog(QDialog):
 
 # ---------------- Dialog: Settings (Theme, Language, Performance) ----------------
 class SettingsDialog(QDialog):
-    def __init__(self, current_theme="light", current_language="English"):
+    def __init__(self, current_theme="light", current_language="English", scan_settings=None):
         super().__init__()
         self.setWindowTitle("Settings")
         self.setGeometry(400, 400, 400, 300)
         self.current_theme = current_theme
         self.current_language = current_language
+        self.scan_settings = dict(scan_settings or {})
         self.init_ui()
         self.apply_dialog_style()
         self.update_language_ui()
@@ -743,6 +3616,72 @@ class SettingsDialog(QDialog):
         self.perf_input.setPlaceholderText("مثال: تاريخ الإنشاء أو آخر تعديل")
         layout.addWidget(self.lbl_perf)
         layout.addWidget(self.perf_input)
+        # Disk search I/O; 0 workers = tuned per device from the measured read throughput
+        self.lbl_workers = QLabel("Hash Workers per Device (0 = auto, or mount=n; mount=n):")
+        self.workers_input = QLineEdit(format_device_workers(self.scan_settings.get("workers")))
+        layout.addWidget(self.lbl_workers)
+        layout.addWidget(self.workers_input)
+        self.lbl_io_order = QLabel("Read Order:")
+        self.io_order_combo = QComboBox()
+        self.io_order_combo.addItems(["scandir", "physical"])
+        self.io_order_combo.setCurrentText(self.scan_settings.get("io_order", "scandir"))
+        layout.addWidget(self.lbl_io_order)
+        layout.addWidget(self.io_order_combo)
+        self.fiemap_check = QCheckBox("Use File Extents for Physical Order (Linux)")
+        self.fiemap_check.setChecked(bool(self.scan_settings.get("use_fiemap")))
+        layout.addWidget(self.fiemap_check)
+        self.lbl_io_mode = QLabel("I/O Mode:")
+        self.io_mode_combo = QComboBox()
+        self.io_mode_combo.addItems(["normal", "cache_friendly"])
+        self.io_mode_combo.setCurrentText(self.scan_settings.get("io_mode", "normal"))
+        layout.addWidget(self.lbl_io_mode)
+        layout.addWidget(self.io_mode_combo)
+        self.lbl_rate = QLabel("Max Read MB/s (0 = unlimited):")
+        self.rate_input = QLineEdit(str((self.scan_settings.get("max_bytes_per_sec") or 0) >> 20))
+        self.rate_input.setValidator(QIntValidator(0, 100000))
+        layout.addWidget(self.lbl_rate)
+        layout.addWidget(self.rate_input)
+        # Reads per second, for storage that is bound by operations rather than bytes (NFS, cloud disks)
+        self.lbl_iops = QLabel("Max Reads per Second (0 = unlimited):")
+        self.iops_input = QLineEdit(str(self.scan_settings.get("max_iops") or 0))
+        self.iops_input.setValidator(QIntValidator(0, 1000000))
+        layout.addWidget(self.lbl_iops)
+        layout.addWidget(self.iops_input)
+        self.lbl_archives = QLabel("Search Inside Archives, Nesting Levels (0 = off):")
+        self.archives_input = QLineEdit(str(self.scan_settings.get("archive_depth") or 0))
+        self.archives_input.setValidator(QIntValidator(0, 8))
+        layout.addWidget(self.lbl_archives)
+        layout.addWidget(self.archives_input)
+        self.follow_links_check = QCheckBox("Follow Symbolic Links")
+        self.follow_links_check.setChecked(bool(self.scan_settings.get("follow_symlinks")))
+        layout.addWidget(self.follow_links_check)
+        # Digests computed next to SHA-256 in the same read and stored in the index
+        self.lbl_algorithms = QLabel("Also Store Digests:")
+        algorithms_layout = QHBoxLayout()
+        self.algorithm_checks = {}
+        for algorithm, label in (("md5", "MD5"), ("sha1", "SHA-1"), ("blake2b", "BLAKE2b"), ("ctph", "Similarity (CTPH)")):
+            check = QCheckBox(label)
+            check.setChecked(algorithm in self.scan_settings.get("algorithms", ()))
+            algorithms_layout.addWidget(check)
+            self.algorithm_checks[algorithm] = check
+        layout.addWidget(self.lbl_algorithms)
+        layout.addLayout(algorithms_layout)
+        # Early termination of disk searches; a search that ends early can be resumed
+        self.lbl_max_hits = QLabel("Stop After Hits (0 = find all):")
+        self.max_hits_input = QLineEdit(str(self.scan_settings.get("max_hits") or 0))
+        self.max_hits_input.setValidator(QIntValidator(0, 1000000))
+        layout.addWidget(self.lbl_max_hits)
+        layout.addWidget(self.max_hits_input)
+        self.lbl_time_budget = QLabel("Time Budget in Seconds (0 = none):")
+        self.time_budget_input = QLineEdit(str(self.scan_settings.get("time_budget") or 0))
+        self.time_budget_input.setValidator(QIntValidator(0, 10000000))
+        layout.addWidget(self.lbl_time_budget)
+        layout.addWidget(self.time_budget_input)
+        self.lbl_byte_budget = QLabel("Read Budget in MB (0 = none):")
+        self.byte_budget_input = QLineEdit(str((self.scan_settings.get("byte_budget") or 0) >> 20))
+        self.byte_budget_input.setValidator(QIntValidator(0, 100000000))
+        layout.addWidget(self.lbl_byte_budget)
+        layout.addWidget(self.byte_budget_input)
         btn_layout = QHBoxLayout()
         self.btn_ok = HoverButton("OK", icon_name="save")
         self.btn_cancel = HoverButton("Cancel", icon_name="exit")
@@ -785,36 +3724,92 @@ class SettingsDialog(QDialog):
             self.lbl_theme.setText("اختر المظهر:")
             self.lbl_language.setText("اختر اللغة:")
             self.lbl_perf.setText("عمر الملف:")
+            self.lbl_workers.setText("عدد عمال التجزئة لكل جهاز (0 = تلقائي، أو نقطة_التركيب=n; ...):")
+            self.lbl_io_order.setText("ترتيب القراءة:")
+            self.fiemap_check.setText("استخدام مواقع الملفات على القرص للترتيب الفعلي (Linux)")
+            self.lbl_io_mode.setText("وضع الإدخال/الإخراج:")
+            self.lbl_rate.setText("أقصى سرعة قراءة MB/s (0 = بلا حد):")
+            self.lbl_iops.setText("أقصى عدد عمليات قراءة في الثانية (0 = بلا حد):")
+            self.follow_links_check.setText("تتبع الروابط الرمزية")
+            self.lbl_archives.setText("البحث داخل الأرشيفات، مستويات التداخل (0 = إيقاف):")
+            self.lbl_algorithms.setText("تخزين بصمات إضافية:")
+            self.lbl_max_hits.setText("التوقف بعد عدد نتائج (0 = الكل):")
+            self.lbl_time_budget.setText("المهلة الزمنية بالثواني (0 = بلا حد):")
+            self.lbl_byte_budget.setText("حد القراءة MB (0 = بلا حد):")
             self.btn_ok.setText("موافق")
             self.btn_cancel.setText("إلغاء")
         else:
             self.lbl_theme.setText("Select Theme:")
             self.lbl_language.setText("Select Language:")
             self.lbl_perf.setText("File Age:")
+            self.lbl_workers.setText("Hash Workers per Device (0 = auto, or mount=n; mount=n):")
+            self.lbl_io_order.setText("Read Order:")
+            self.fiemap_check.setText("Use File Extents for Physical Order (Linux)")
+            self.lbl_io_mode.setText("I/O Mode:")
+            self.lbl_rate.setText("Max Read MB/s (0 = unlimited):")
+            self.lbl_iops.setText("Max Reads per Second (0 = unlimited):")
+            self.follow_links_check.setText("Follow Symbolic Links")
+            self.lbl_archives.setText("Search Inside Archives, Nesting Levels (0 = off):")
+            self.lbl_algorithms.setText("Also Store Digests:")
+            self.lbl_max_hits.setText("Stop After Hits (0 = find all):")
+            self.lbl_time_budget.setText("Time Budget in Seconds (0 = none):")
+            self.lbl_byte_budget.setText("Read Budget in MB (0 = none):")
             self.btn_ok.setText("OK")
             self.btn_cancel.setText("Cancel")
     def get_settings(self):
         return {
             "theme": self.theme_combo.currentText(),
             "language": self.lang_combo.currentText(),
-            "performance": self.perf_input.text()
+            "performance": self.perf_input.text(),
+            "workers": parse_device_workers(self.workers_input.text()),
+            "io_order": self.io_order_combo.currentText(),
+            "use_fiemap": self.fiemap_check.isChecked(),
+            "io_mode": self.io_mode_combo.currentText(),
+            "max_bytes_per_sec": (int(self.rate_input.text() or 0) << 20) or None,
+            "max_iops": int(self.iops_input.text() or 0) or None,
+            "follow_symlinks": self.follow_links_check.isChecked(),
+            "archive_depth": int(self.archives_input.text() or 0),
+            "algorithms": tuple(algorithm for algorithm, check in self.algorithm_checks.items() if check.isChecked()),
+            "max_hits": int(self.max_hits_input.text() or 0) or None,
+            "time_budget": int(self.time_budget_input.text() or 0) or None,
+            "byte_budget": (int(self.byte_budget_input.text() or 0) << 20) or None
         }
 
 # ---------------- Main Window with Enhanced UI, Dashboard Removed and Logs Integrated in Statistics ----------------
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.db = DatabaseManager()
+        # Smart lookups go through the mmap'd digest index (built on the first lookup)
+        self.db = DatabaseManager(digest_index=True)
         self.current_thread = None
-        self.excluded_paths = []
+        try:
+            self.excluded_paths = self.db.load_exclusions()
+        except Exception:
+            self.excluded_paths = []
         self.dark_mode = False
         self.disk_count = 0
         self.smart_count = 0
         # لا يتم مسح النتائج تلقائياً عند بدء بحث جديد
         self.results_data = []  # تخزين النتائج من جميع عمليات البحث
         self.log_messages = []  # سجل الأحداث
+        self.smart_status_counts = {}  # Verified / Changed / Deleted counts of the last smart search
+        self.ioc_targets = {}  # IOC list loaded from a file: {sha256: label}
+        self.active_targets = {}  # targets of the running search, used to label hits
+        self.known_sizes = {}  # {sha256: size} of files hashed with "Calculate Hash"
+        self.reference_fuzzy = None  # similarity hash of the last file hashed with "Calculate Hash"
+        # Disk search I/O options from the settings dialog (workers=None: tuned per device)
+        self.scan_settings = {"workers": None, "io_order": "scandir", "use_fiemap": False, "io_mode": "normal",
+                              "max_bytes_per_sec": None, "max_iops": None, "follow_symlinks": False, "archive_depth": 0,
+                              "algorithms": (), "max_hits": None, "time_budget": None, "byte_budget": None}
+        self.maintenance_thread = None
+        self.smart_thread = None
         self.init_ui()
         self.setup_connections()
+        # صيانة قاعدة البيانات أسبوعياً: فحص عند التشغيل ثم كل ساعة
+        self.maintenance_timer = QTimer(self)
+        self.maintenance_timer.timeout.connect(self.run_scheduled_maintenance)
+        self.maintenance_timer.start(60 * 60 * 1000)
+        QTimer.singleShot(60 * 1000, self.run_scheduled_maintenance)
         # تعيين الثيم الافتراضي بناءً على إعدادات المستخدم
         self.apply_theme("light")
         self.update_language_ui()  # تحديث النصوص بناءً على اللغة
@@ -857,12 +3852,14 @@ class MainWindow(QMainWindow):
         self.search_settings_card.setObjectName("searchSettingsCard")
         ss_layout = QGridLayout()
         ss_layout.setSpacing(10)
-        ss_layout.addWidget(QLabel("SHA-256:"), 0, 0)
+        ss_layout.addWidget(QLabel("Hash:"), 0, 0)
         self.input_hash = QLineEdit()
-        self.input_hash.setPlaceholderText("Enter SHA-256 hash")
+        self.input_hash.setPlaceholderText("Enter MD5 / SHA-1 / SHA-256 / BLAKE2b hash")
         ss_layout.addWidget(self.input_hash, 0, 1)
         self.btn_calculate = HoverButton("Calculate Hash", icon_name="hash")
         ss_layout.addWidget(self.btn_calculate, 0, 2)
+        self.btn_load_iocs = HoverButton("Load IOC List", icon_name="folder")
+        ss_layout.addWidget(self.btn_load_iocs, 0, 3)
         ss_layout.addWidget(QLabel("Search Folder:"), 1, 0)
         self.input_folder = QLineEdit()
         self.input_folder.setPlaceholderText("Select folder to scan")
@@ -895,10 +3892,14 @@ class MainWindow(QMainWindow):
         qa_layout = QHBoxLayout()
         self.btn_normal_search = HoverButton("Normal Search", icon_name="search")
         self.btn_smart_search = HoverButton("Smart Search", icon_name="search")
+        self.btn_duplicates = HoverButton("Find Duplicates", icon_name="file")
+        self.btn_similar = HoverButton("Find Similar", icon_name="file")
         # زر Pause متبقي، زر Resume محذوف
         self.btn_pause = HoverButton("Stop", icon_name="stop")
         qa_layout.addWidget(self.btn_normal_search)
         qa_layout.addWidget(self.btn_smart_search)
+        qa_layout.addWidget(self.btn_duplicates)
+        qa_layout.addWidget(self.btn_similar)
         qa_layout.addWidget(self.btn_pause)
         self.quick_actions_card.setLayout(qa_layout)
         ctrl_layout.addWidget(self.quick_actions_card)
@@ -912,8 +3913,10 @@ class MainWindow(QMainWindow):
         btns_layout = QHBoxLayout()
         self.btn_exclude_paths = HoverButton("Manage Excluded Paths", icon_name="exclude")
         self.btn_non_matching_db = HoverButton("Non-Matching Database", icon_name="database")
+        self.btn_maintenance = HoverButton("DB Maintenance", icon_name="refresh")
         btns_layout.addWidget(self.btn_exclude_paths)
         btns_layout.addWidget(self.btn_non_matching_db)
+        btns_layout.addWidget(self.btn_maintenance)
         ctrl_layout.addLayout(btns_layout)
         # Card 3: Statistics with integrated Log area (الملاحظات الصغيرة)
         self.statistics_card = QGroupBox("Statistics")
@@ -1000,12 +4003,16 @@ class MainWindow(QMainWindow):
     def setup_connections(self):
         self.btn_browse_folder.clicked.connect(self.browse_folder)
         self.btn_calculate.clicked.connect(self.calculate_hash)
+        self.btn_load_iocs.clicked.connect(self.load_ioc_list)
         self.btn_normal_search.clicked.connect(self.start_normal_search)
         self.btn_smart_search.clicked.connect(self.start_smart_search)
+        self.btn_duplicates.clicked.connect(self.start_duplicate_search)
+        self.btn_similar.clicked.connect(self.find_similar_files)
         self.btn_pause.clicked.connect(self.stop_search)
         self.btn_clear_results.clicked.connect(self.clear_results)
         self.btn_exclude_paths.clicked.connect(self.manage_excluded_paths)
         self.btn_non_matching_db.clicked.connect(self.open_non_matching_db)
+        self.btn_maintenance.clicked.connect(self.start_maintenance)
         self.btn_settings.clicked.connect(self.open_settings)
         self.btn_exit_top.clicked.connect(self.exit_program)
         self.btn_refresh_top.clicked.connect(self.refresh_all)
@@ -1107,26 +4114,57 @@ class MainWindow(QMainWindow):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select a File")
         if file_path:
             try:
-                hasher = hashlib.sha256()
-                with open(file_path, 'rb') as f:
-                    while True:
-                        chunk = f.read(131072)
-                        if not chunk:
-                            break
-                        hasher.update(chunk)
-                hash_val = hasher.hexdigest()
+                digests = FileHasher(algorithms=("ctph",)).hash_digests(file_path)
+                hash_val = digests["sha256"]
+                self.known_sizes[hash_val] = os.path.getsize(file_path)
+                self.reference_fuzzy = digests["ctph"]
                 self.input_hash.setText(hash_val)
-                QMessageBox.information(self, "Success", f"File Hash:\n{hash_val}")
+                QMessageBox.information(self, "Success", f"File Hash:\n{hash_val}\n\nSimilarity Hash:\n{digests['ctph']}")
                 self.log_event("Calculated hash for file: " + file_path)
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Unable to read file: {str(e)}")
+    def load_ioc_list(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Load IOC List", "", "IOC Lists (*.txt *.csv);;All Files (*)")
+        if not file_path:
+            return
+        try:
+            self.ioc_targets = load_ioc_file(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Unable to read IOC list: {str(e)}")
+            return
+        self.input_hash.setPlaceholderText(f"{len(self.ioc_targets)} IOCs loaded from {os.path.basename(file_path)}"
+                                           if self.ioc_targets else "Enter MD5 / SHA-1 / SHA-256 / BLAKE2b hash")
+        self.log_event(f"Loaded {len(self.ioc_targets)} IOCs from {file_path}")
+    def collect_targets(self):
+        # Hashes typed or pasted into the SHA-256 field plus the loaded IOC list
+        targets = dict(self.ioc_targets)
+        targets.update(parse_iocs(self.input_hash.text()))
+        return targets
+    def target_size_filter(self, targets):
+        # The sizes to look for when every target's size is known (hashed here or already indexed)
+        sizes = {t: self.known_sizes[t] for t in targets if t in self.known_sizes}
+        missing = [t for t in targets if t not in sizes]
+        if missing:
+            try:
+                sizes.update(self.db.target_sizes(missing))
+            except Exception:
+                return None
+        if len(sizes) < len(targets):
+            return None
+        return set(sizes.values())
+    def ioc_source(self, source, hash_val):
+        label = self.active_targets.get(hash_val)
+        return f"{source} (IOC: {label})" if label else source
     def start_normal_search(self):
+        if self.maintenance_thread and self.maintenance_thread.isRunning():
+            QMessageBox.warning(self, "Busy", "Database maintenance is running, try again when it finishes.")
+            return
         self.status_text.setText("Working")
         self.status_indicator.setStyleSheet("color: orange; font-size:16px;")
-        target_hash = self.input_hash.text().strip().lower()
+        targets = self.collect_targets()
         folder = self.input_folder.text()
-        if len(target_hash) != 64:
-            QMessageBox.warning(self, "Error", "Hash must be 64 characters long")
+        if not targets:
+            QMessageBox.warning(self, "Error", "Enter an MD5, SHA-1, SHA-256 or BLAKE2b hash (32, 40, 64 or 128 characters) or load an IOC list")
             return
         if not os.path.isdir(folder):
             QMessageBox.warning(self, "Error", "Invalid search folder")
@@ -1139,58 +4177,91 @@ class MainWindow(QMainWindow):
         data_filter = int(self.input_data_filter.text()) if self.input_data_filter.text() else None
         digital_signature = self.combo_signature.currentText()
         extensions = [self.combo_extensions.currentText()]
+        target_hash = next(iter(targets)) if len(targets) == 1 else frozenset(targets)
+        target_sizes = self.target_size_filter(targets)
+        self.current_thread = LocalSearchThread([folder], target_hash, extensions, self.excluded_paths, min_size,
+                                                data_filter, digital_signature, target_sizes, **self.scan_settings)
+        self.current_thread.resume_scan = self.ask_resume(self.current_thread)
         self.progress_bar.setRange(0, 0)
         self.status_progress.setRange(0, 0)
         # لا يتم مسح النتائج القديمة، لذا لا نقوم بتهيئة self.results_data أو استدعاء clear_results()
-        self.log_event("Starting normal search")
-        self.current_thread = LocalSearchThread([folder], target_hash, extensions, self.excluded_paths, min_size,
-                                                data_filter, digital_signature)
+        self.log_event(f"{'Resuming' if self.current_thread.resume_scan else 'Starting'} normal search "
+                       f"for {len(targets)} hash(es)")
+        self.active_targets = targets
+        if target_sizes:
+            self.log_event(f"Target size known: only files of {len(target_sizes)} size(s) will be hashed")
         self.current_thread.result_found.connect(self.handle_result_found)
         self.current_thread.error_occurred.connect(lambda e: QMessageBox.critical(self, "Error", e))
+        self.current_thread.scan_summary.connect(self.handle_scan_summary)
         self.current_thread.finished.connect(self.search_finished)
         self.current_thread.start()
         self.progress_label.setText("Search Progress: Scanning...")
     def start_smart_search(self):
+        # Maintenance rewrites the digest index and prunes file_index under the lookups
+        if self.maintenance_thread and self.maintenance_thread.isRunning():
+            QMessageBox.warning(self, "Busy", "Database maintenance is running, try again when it finishes.")
+            return
         self.status_text.setText("Working (Smart)")
         self.status_indicator.setStyleSheet("color: orange; font-size:16px;")
-        target_hash = self.input_hash.text().strip().lower()
+        targets = self.collect_targets()
         folder = self.input_folder.text()
-        if len(target_hash) != 64:
-            QMessageBox.warning(self, "Error", "Hash must be 64 characters long")
+        if not targets:
+            QMessageBox.warning(self, "Error", "Enter an MD5, SHA-1, SHA-256 or BLAKE2b hash (32, 40, 64 or 128 characters) or load an IOC list")
             return
         if not os.path.isdir(folder):
             QMessageBox.warning(self, "Error", "Invalid search folder")
             return
-        self.log_event("Starting smart search")
+        self.log_event(f"Starting smart search for {len(targets)} hash(es)")
+        self.active_targets = targets
+        target_hash = next(iter(targets)) if len(targets) == 1 else frozenset(targets)
         self.current_thread = None
-        self.smart_thread = SmartCheckThread(self.db, target_hash)
+        self.smart_count = 0
+        self.smart_status_counts = {}
+        self.smart_thread = SmartCheckThread(self.db, target_hash, validate=True)
+        self.smart_thread.hits_validated.connect(self.handle_smart_batch)
         self.smart_thread.result_ready.connect(lambda results: self.handle_smart_results(results, target_hash, folder))
         self.smart_thread.start()
         self.progress_label.setText("Search Progress: Smart scanning...")
+    def handle_smart_batch(self, batch):
+        # Smart hits stat()ed and classified by SmartCheckThread's worker pool
+        now = time.time()
+        self.results_table.setUpdatesEnabled(False)
+        for path, hash_val, status, size, ctime, mtime in batch:
+            row_data = {
+                "name": os.path.basename(path),
+                "path": path,
+                "signature": hash_val,
+                "status": status,
+                "size": str(size) if size is not None else "N/A",
+                "type": os.path.splitext(path)[1],
+                "created": time.ctime(ctime) if ctime is not None else "N/A",
+                "modified": time.ctime(mtime) if mtime is not None else "N/A",
+                "age": f"{((now - ctime) / 86400.0):.1f} days" if ctime is not None else "N/A",
+                "extra": self.ioc_source("Smart", hash_val)
+            }
+            self.results_data.append(row_data)
+            self.add_result_row(path, hash_val, row_data["extra"], is_match=True, row_data=row_data)
+            self.smart_status_counts[status] = self.smart_status_counts.get(status, 0) + 1
+        self.results_table.setUpdatesEnabled(True)
+        self.smart_count += len(batch)
+        self.chart_widget.update_chart(self.disk_count, self.smart_count)
+        self.progress_label.setText(f"Search Progress: Smart scanning... {self.smart_count} hits checked")
     def handle_smart_results(self, results, target_hash, folder):
         if results:
-            self.smart_count = len(results)
-            for path, hash_val in results:
-                row_data = {
-                    "name": os.path.basename(path),
-                    "path": path,
-                    "signature": hash_val,
-                    "status": "Available" if os.path.exists(path) else "Deleted",
-                    "size": str(os.path.getsize(path)) if os.path.exists(path) else "N/A",
-                    "type": os.path.splitext(path)[1],
-                    "created": time.ctime(os.path.getctime(path)) if os.path.exists(path) else "N/A",
-                    "modified": time.ctime(os.path.getmtime(path)) if os.path.exists(path) else "N/A",
-                    "age": f"{((time.time() - os.path.getctime(path)) / 86400.0):.1f} days" if os.path.exists(path) else "N/A",
-                    "extra": "Smart"
-                }
-                self.results_data.append(row_data)
-                self.add_result_row(path, hash_val, "Smart", is_match=True)
-            self.chart_widget.update_chart(self.disk_count, self.smart_count)
+            counts = self.smart_status_counts
             self.progress_label.setText("Search Progress: Smart search successful.")
             self.status_text.setText("Success")
             self.status_indicator.setStyleSheet("color: green; font-size:16px;")
-            self.log_event("Smart search completed successfully")
+            self.log_event(f"Smart search completed: {counts.get(SmartCheckThread.VERIFIED, 0)} verified, "
+                           f"{counts.get(SmartCheckThread.CHANGED, 0)} changed (need rehash), "
+                           f"{counts.get(SmartCheckThread.DELETED, 0)} deleted")
         else:
+            try:
+                superseded = self.db.search_superseded(target_hash) if isinstance(target_hash, str) else []
+            except Exception:
+                superseded = []
+            if superseded:
+                self.log_event(f"Hash was recorded earlier at {len(superseded)} path(s) whose content has since changed")
             reply = QMessageBox.question(self, "No Result",
                                          "No matching record found in DB. Do you want to start a normal search?",
                                          QMessageBox.Yes | QMessageBox.No)
@@ -1209,45 +4280,56 @@ class MainWindow(QMainWindow):
             "name": os.path.basename(path),
             "path": path,
             "signature": hash_val,
-            "status": "Available" if os.path.exists(path) else "Deleted",
+            "status": self.file_status(path),
             "size": str(os.path.getsize(path)) if os.path.exists(path) else "N/A",
             "type": os.path.splitext(path)[1],
             "created": time.ctime(os.path.getctime(path)) if os.path.exists(path) else "N/A",
             "modified": time.ctime(os.path.getmtime(path)) if os.path.exists(path) else "N/A",
             "age": f"{((time.time() - os.path.getctime(path)) / 86400.0):.1f} days" if os.path.exists(path) else "N/A",
-            "extra": "Normal"
+            "extra": self.ioc_source("Normal", hash_val)
         }
         self.results_data.append(row_data)
-        self.add_result_row(path, hash_val, "Normal", is_match=True)
+        self.add_result_row(path, hash_val, row_data["extra"], is_match=True)
         total_files = self.disk_count + self.smart_count
         self.label_total_files.setText(f"Total Files: {total_files}")
         self.label_matches.setText(f"Matches: {self.disk_count}")
         self.label_speed.setText("Scan Speed: Calculating...")
         self.chart_widget.update_chart(self.disk_count, self.smart_count)
-    def add_result_row(self, path, hash_val, source, is_match=False):
+    def file_status(self, path):
+        if os.path.exists(path):
+            return "Available"
+        # Archive members are reported as "container!member"
+        container = path.split(ArchiveReader.SEPARATOR, 1)[0]
+        return "In Archive" if container != path and os.path.isfile(container) else "Deleted"
+    def add_result_row(self, path, hash_val, source, is_match=False, row_data=None):
         row_pos = self.results_table.rowCount()
         self.results_table.insertRow(row_pos)
-        name = os.path.basename(path)
-        try:
-            size = str(os.path.getsize(path))
-        except Exception:
-            size = "N/A"
-        try:
-            created = time.ctime(os.path.getctime(path))
-        except Exception:
-            created = "N/A"
-        try:
-            modified = time.ctime(os.path.getmtime(path))
-        except Exception:
-            modified = "N/A"
-        try:
-            age = f"{((time.time() - os.path.getctime(path)) / 86400.0):.1f} days"
-        except Exception:
-            age = "N/A"
-        extra = source
-        status = "Available" if os.path.exists(path) else "Deleted"
-        items = [name, path, hash_val, status, size,
-                 os.path.splitext(path)[1], created, modified, age, extra]
+        if row_data is not None:
+            # Metadata already collected off the GUI thread (validated smart hits, refresh)
+            items = [row_data["name"], path, hash_val, row_data["status"], row_data["size"],
+                     row_data["type"], row_data["created"], row_data["modified"], row_data["age"], source]
+        else:
+            name = os.path.basename(path)
+            try:
+                size = str(os.path.getsize(path))
+            except Exception:
+                size = "N/A"
+            try:
+                created = time.ctime(os.path.getctime(path))
+            except Exception:
+                created = "N/A"
+            try:
+                modified = time.ctime(os.path.getmtime(path))
+            except Exception:
+                modified = "N/A"
+            try:
+                age = f"{((time.time() - os.path.getctime(path)) / 86400.0):.1f} days"
+            except Exception:
+                age = "N/A"
+            extra = source
+            status = self.file_status(path)
+            items = [name, path, hash_val, status, size,
+                     os.path.splitext(path)[1], created, modified, age, extra]
         for col, val in enumerate(items):
             item = QTableWidgetItem(val)
             if col == 0:
@@ -1257,7 +4339,7 @@ class MainWindow(QMainWindow):
                 item.setForeground(QColor("#333333"))
             self.results_table.setItem(row_pos, col, item)
         # إظهار تنبيه عند وصول عدد المطابقات إلى مضاعفات معينة
-        if is_match and source == "Normal" and self.disk_count % 5 == 0:
+        if is_match and (source or "").startswith("Normal") and self.disk_count % 5 == 0:
             QMessageBox.information(self, "Important", "A significant number of matches have been found!")
     def show_result_details(self, row, column):
         if row < len(self.results_data):
@@ -1273,6 +4355,102 @@ class MainWindow(QMainWindow):
             details += f"<b>Age:</b> {data.get('age', '')}<br>"
             details += f"<b>Extra:</b> {data.get('extra', '')}<br>"
             QMessageBox.information(self, "Result Details", details)
+    def start_duplicate_search(self):
+        if self.current_thread and self.current_thread.isRunning():
+            QMessageBox.warning(self, "Busy", "Wait for the current search to finish first.")
+            return
+        if self.maintenance_thread and self.maintenance_thread.isRunning():
+            QMessageBox.warning(self, "Busy", "Database maintenance is running, try again when it finishes.")
+            return
+        folder = self.input_folder.text()
+        if not os.path.isdir(folder):
+            QMessageBox.warning(self, "Error", "Invalid search folder")
+            return
+        try:
+            min_size = int(self.input_min_size.text()) if self.input_min_size.text() else 1
+        except ValueError:
+            QMessageBox.warning(self, "Error", "Minimum file size must be a number")
+            return
+        self.status_text.setText("Working (Duplicates)")
+        self.status_indicator.setStyleSheet("color: orange; font-size:16px;")
+        self.progress_bar.setRange(0, 0)
+        self.status_progress.setRange(0, 0)
+        self.log_event("Starting duplicate search in: " + folder)
+        self.current_thread = DuplicateFinderThread([folder], [self.combo_extensions.currentText()],
+                                                    self.excluded_paths, min_size,
+                                                    **{key: value for key, value in self.scan_settings.items()
+                                                       if key in DuplicateFinderThread.SETTINGS})
+        self.current_thread.progress_text.connect(self.log_event)
+        self.current_thread.clusters_ready.connect(self.show_duplicates)
+        self.current_thread.error_occurred.connect(lambda e: QMessageBox.critical(self, "Error", e))
+        self.current_thread.scan_summary.connect(self.handle_duplicate_summary)
+        self.current_thread.finished.connect(self.search_finished)
+        self.current_thread.start()
+        self.progress_label.setText("Search Progress: Finding duplicates...")
+    def ask_resume(self, thread):
+        # An interrupted scan of the thread's folder for the same hashes with the same filters continues
+        # where it stopped, if wanted
+        try:
+            previous = self.db.resumable_session(thread.targets, thread.paths, thread.scan_key)
+        except Exception:
+            return False
+        if not previous:
+            return False
+        reply = QMessageBox.question(self, "Resume Search",
+                                     "A search of this folder for the same hash(es) and filters did not finish. "
+                                     "Resume it instead of starting over?",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            return True
+        try:
+            self.db.discard_frontier(previous[0])
+        except Exception as e:
+            self.log_event(str(e))
+        return False
+    def handle_duplicate_summary(self, summary):
+        self.log_event(f"Duplicates: {summary['files']} files, {summary['size_groups']} size groups, "
+                       f"{summary['partial_hashed']} partial / {summary['full_hashed']} full hashes, "
+                       f"{summary['reused']} cached; {summary['clusters']} clusters, "
+                       f"{summary['wasted'] / 1048576:.1f} MB wasted in {summary['elapsed']:.1f}s")
+        self.log_io_summary(summary)
+    def find_similar_files(self):
+        # Indexed files ranked by similarity to the reference file of "Calculate Hash"
+        if not self.reference_fuzzy:
+            self.calculate_hash()
+            if not self.reference_fuzzy:
+                return
+        try:
+            similar = self.db.similar_files(self.reference_fuzzy)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
+            return
+        if not similar:
+            QMessageBox.information(self, "Similar Files", "No similar files in the index. Similarity hashes are "
+                                    "stored by disk searches with \"Similarity (CTPH)\" enabled in Settings.")
+            return
+        self.log_event(f"{len(similar)} file(s) similar to {self.reference_fuzzy}")
+        self.results_table.setUpdatesEnabled(False)
+        for path, hash_val, _, score in similar:
+            row_data = {
+                "name": os.path.basename(path),
+                "path": path,
+                "signature": hash_val,
+                "status": self.file_status(path),
+                "size": str(os.path.getsize(path)) if os.path.exists(path) else "N/A",
+                "type": os.path.splitext(path)[1],
+                "created": time.ctime(os.path.getctime(path)) if os.path.exists(path) else "N/A",
+                "modified": time.ctime(os.path.getmtime(path)) if os.path.exists(path) else "N/A",
+                "age": f"{((time.time() - os.path.getctime(path)) / 86400.0):.1f} days" if os.path.exists(path) else "N/A",
+                "extra": f"Similar ({score}%)"
+            }
+            self.results_data.append(row_data)
+            self.add_result_row(path, hash_val, row_data["extra"], row_data=row_data)
+        self.results_table.setUpdatesEnabled(True)
+    def show_duplicates(self, clusters):
+        if not clusters:
+            QMessageBox.information(self, "Duplicates", "No duplicate files found.")
+            return
+        DuplicatesDialog(clusters).exec_()
     def search_finished(self):
         self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(100)
@@ -1282,6 +4460,36 @@ class MainWindow(QMainWindow):
         self.status_text.setText("Success")
         self.status_indicator.setStyleSheet("color: green; font-size:16px;")
         self.log_event("Search finished successfully")
+    def handle_scan_summary(self, summary):
+        elapsed = max(summary["elapsed"], 0.001)
+        self.label_speed.setText(f"Scan Speed: {summary['files'] / elapsed:.0f} files/s")
+        self.log_event(f"Scanned {summary['files']} files in {elapsed:.1f}s: {summary['hashed']} hashed "
+                       f"({summary['bytes_hashed'] / 1048576:.1f} MB read), {summary['reused']} unchanged (cached)")
+        if summary.get("resumed"):
+            self.log_event("Resumed an interrupted search: only its unfinished directories were walked")
+        if summary.get("stop_reason"):
+            reason = {"hits": "the hit limit was reached", "time": "the time budget ran out",
+                      "bytes": "the read budget ran out"}[summary["stop_reason"]]
+            self.log_event(f"Search ended early because {reason}; {summary['frontier']} director(ies) left "
+                           f"unfinished. Run the same search again to continue from there.")
+            for directory in summary["frontier_dirs"]:
+                self.log_event(f"  not finished: {directory}")
+        if summary.get("size_skipped"):
+            self.log_event(f"Skipped {summary['size_skipped']} files of a different size without reading them")
+        if summary.get("dirs"):
+            walk = max(summary["walk_seconds"], 0.001)
+            self.log_event(f"Walked {summary['dirs']} directories in {walk:.1f}s "
+                           f"({summary['dirs'] / walk:.0f} dirs/s)")
+        self.log_io_summary(summary)
+    def log_io_summary(self, summary):
+        if summary.get("archives"):
+            self.log_event(f"Searched {summary['members']} members inside {summary['archives']} archive(s)")
+        if summary.get("inode_shared"):
+            self.log_event(f"{summary['inode_shared']} hardlinked/linked paths reused the digest of their inode: "
+                           f"{summary['bytes_avoided'] / 1048576:.1f} MB of reads avoided")
+        for mount, (workers, rate) in summary.get("workers", {}).items():
+            speed = f" at {rate / 1048576:.1f} MB/s" if rate else ""
+            self.log_event(f"Hash workers on {mount}: {workers}{speed}")
     def stop_search(self):
         if self.current_thread:
             self.current_thread.stop()
@@ -1309,7 +4517,36 @@ class MainWindow(QMainWindow):
         dialog = ExcludePathsDialog(self.excluded_paths)
         if dialog.exec_():
             self.excluded_paths = dialog.get_excluded_paths()
+            try:
+                self.db.save_exclusions(self.excluded_paths)
+            except Exception as e:
+                self.log_event("Failed to save excluded paths: " + str(e))
             self.log_event("Updated excluded paths")
+    def start_maintenance(self, scheduled=False):
+        if self.maintenance_thread and self.maintenance_thread.isRunning():
+            return
+        if any(thread and thread.isRunning() for thread in (self.current_thread, self.smart_thread)):
+            if not scheduled:
+                QMessageBox.warning(self, "Busy", "Wait for the current search to finish before running maintenance.")
+            return
+        self.maintenance_thread = MaintenanceThread(self.db)
+        self.maintenance_thread.progress.connect(self.log_event)
+        self.maintenance_thread.report_ready.connect(self.handle_maintenance_report)
+        self.maintenance_thread.error_occurred.connect(
+            lambda msg: self.log_event("Database maintenance failed: " + msg))
+        self.btn_maintenance.setEnabled(False)
+        self.maintenance_thread.finished.connect(lambda: self.btn_maintenance.setEnabled(True))
+        self.maintenance_thread.start()
+        self.log_event("Database maintenance started" + (" (scheduled)" if scheduled else ""))
+    def run_scheduled_maintenance(self):
+        try:
+            if self.db.maintenance_due(7):
+                self.start_maintenance(scheduled=True)
+        except Exception as e:
+            self.log_event("Maintenance check failed: " + str(e))
+    def handle_maintenance_report(self, report):
+        self.log_event(f"Database maintenance: {report['checked']} paths checked, {report['pruned']} pruned, "
+                       f"{report['reclaimed'] / (1024 * 1024):.2f} MB reclaimed in {report['seconds']}s")
     def open_non_matching_db(self):
         try:
             dialog = NonMatchingDBDialog(self.db)
@@ -1318,10 +4555,12 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to open Non-Matching Database:\n{str(e)}")
     def open_settings(self):
-        dialog = SettingsDialog("dark" if self.dark_mode else "light", self.get_current_language())
+        dialog = SettingsDialog("dark" if self.dark_mode else "light", self.get_current_language(),
+                                self.scan_settings)
         if dialog.exec_():
             settings = dialog.get_settings()
             self.apply_theme(settings["theme"])
+            self.scan_settings = {key: settings[key] for key in self.scan_settings}
             self.update_language_ui()
             self.log_event("Settings updated")
     def get_current_language(self):
@@ -1433,12 +4672,15 @@ class MainWindow(QMainWindow):
         if self.current_thread and self.current_thread.isRunning():
             self.current_thread.stop()
             self.current_thread.wait()
+        if self.maintenance_thread and self.maintenance_thread.isRunning():
+            self.maintenance_thread.wait()
         self.log_event("Exiting application")
         QApplication.quit()
     def refresh_results(self):
         self.results_table.setRowCount(0)
         for entry in self.results_data:
-            self.add_result_row(entry.get("path"), entry.get("signature"), entry.get("extra"), is_match=True)
+            self.add_result_row(entry.get("path"), entry.get("signature"), entry.get("extra"), is_match=True,
+                                row_data=entry)
         QMessageBox.information(self, "Refresh", "Results refreshed!")
         self.log_event("Refreshed results table")
     def check_infinite_scroll(self, value):
@@ -1450,6 +4692,8 @@ class MainWindow(QMainWindow):
         if self.current_thread and self.current_thread.isRunning():
             self.current_thread.stop()
             self.current_thread.wait()
+        if self.maintenance_thread and self.maintenance_thread.isRunning():
+            self.maintenance_thread.wait()
         event.accept()
 
 # ---------------- Main Execution ----------------
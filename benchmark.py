@@ -0,0 +1,658 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark harness for the search engine used by ForensicX / Smart search file.
+
+Usage:
+    python benchmark.py lookup [--sizes 10000,100000,1000000] [--queries 200]
+    python benchmark.py schema [--rows 200000] [--queries 200]
+    python benchmark.py digests [--rows 1000000] [--queries 20000]
+    python benchmark.py similarity [--sizes 10000,100000,1000000] [--queries 100] [--edits 3]
+    python benchmark.py ioc [--rows 1000000] [--iocs 5000]
+    python benchmark.py scan [--files 10000,100000,1000000]
+    python benchmark.py walk [--root DIR] [--threads 1,2,4,8,16]
+    python benchmark.py exclude [--rules 10,100,300,1000] [--paths 2000]
+    python benchmark.py hashing [--sizes-kb 16,1024,262144] [--total-mb 1024]
+    python benchmark.py algorithms [--file-mb 64] [--total-mb 1024]
+    python benchmark.py pagecache [--total-mb 512] [--limit-mb 50]
+
+Every scenario works on temporary databases and files, never on file_search.db.
+"""
+
+import os
+import sys
+import time
+import shutil
+import mmap
+import random
+import argparse
+import tempfile
+import sqlite3
+import threading
+import subprocess
+import statistics
+
+from ForensicX import (DatabaseManager, DirectoryWalker, ExclusionMatcher, FileHasher, FuzzyHash,
+                       LocalSearchThread, RateLimiter)
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def _fill_index(db, count, batch=50000):
+    hashes = []
+    for offset in range(0, count, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, count)):
+            file_hash = os.urandom(32).hex()
+            rows.append((f"/bench/dir{i % 1000}/file{i}.bin", file_hash, ".bin", i, i, i, 1))
+            if i % max(count // 100, 1) == 0:
+                hashes.append(file_hash)
+        db.save_records(rows)
+    return hashes
+
+
+def _median_ms(db, hashes, queries):
+    samples = [_timed(db.search_hash, hashes[i % len(hashes)]) for i in range(queries)]
+    return statistics.median(samples) * 1000.0
+
+
+def bench_lookup(args):
+    # Lookup latency vs table size, with and without the file_hash index
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    try:
+        print(f"{'rows':>12} {'hit (idx)':>12} {'miss (idx)':>12} {'hit (scan)':>12} {'miss (scan)':>12}")
+        for size in args.sizes:
+            db = DatabaseManager(os.path.join(workdir, f"lookup_{size}.db"))
+            present = _fill_index(db, size)
+            missing = [os.urandom(32).hex() for _ in range(len(present))]
+            hit_idx = _median_ms(db, present, args.queries)
+            miss_idx = _median_ms(db, missing, args.queries)
+            with db.conn:
+                db.conn.execute("DROP INDEX idx_file_index_file_hash")
+            scan_queries = max(args.queries // 20, 3)
+            hit_scan = _median_ms(db, present, scan_queries)
+            miss_scan = _median_ms(db, missing, scan_queries)
+            db.conn.close()
+            print(f"{size:>12} {hit_idx:>10.3f}ms {miss_idx:>10.3f}ms {hit_scan:>10.3f}ms {miss_scan:>10.3f}ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# Result-table layout used up to schema v3 (hex TEXT digests, full path per row)
+LEGACY_TABLE = """
+    CREATE TABLE non_matching_hashes (
+        id INTEGER PRIMARY KEY, file_path TEXT UNIQUE, file_hash TEXT, extension TEXT,
+        search_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        file_size INTEGER, mtime_ns INTEGER, inode INTEGER, device INTEGER)
+"""
+LEGACY_INSERT = """
+    INSERT INTO non_matching_hashes (file_path, file_hash, extension, file_size, mtime_ns, inode, device)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _drop_page_cache(path):
+    # Evict the file (and its WAL) from the OS page cache; clean pages only, so no root needed
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for name in (path, path + "-wal"):
+        try:
+            fd = os.open(name, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def _db_size(conn, path):
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def _sample_records(count):
+    exts = [".txt", ".pdf", ".docx", ".jpg", ".exe", ".dll", ".log", ".xml"]
+    for i in range(count):
+        d = i // 40
+        directory = (f"/srv/fileserver/shares/department{d % 13}/projects/project{d % 97:02d}"
+                     f"/archive/{2015 + d % 9}/folder{d}")
+        ext = exts[i % len(exts)]
+        yield (f"{directory}/document_{i:08d}{ext}", os.urandom(32).hex(), ext,
+               1000 + i, 1700000000000000000 + i, 100000 + i, 2049)
+
+
+def bench_schema(args):
+    # DB size, insert throughput and cold page-cache lookups: legacy text layout vs compact layout
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    cold = True
+    try:
+        records = list(_sample_records(args.rows))
+        probes = [records[i][1] for i in range(0, len(records), max(len(records) // args.queries, 1))]
+
+        legacy_path = os.path.join(workdir, "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(LEGACY_TABLE)
+        conn.execute("CREATE INDEX idx_non_matching_hashes_file_hash ON non_matching_hashes(file_hash)")
+        conn.execute("CREATE INDEX idx_non_matching_hashes_extension ON non_matching_hashes(extension)")
+        conn.execute("CREATE INDEX idx_non_matching_hashes_search_date ON non_matching_hashes(search_date)")
+        start = time.perf_counter()
+        for offset in range(0, len(records), 2000):
+            with conn:
+                conn.executemany(LEGACY_INSERT, records[offset:offset + 2000])
+        legacy_insert = len(records) / (time.perf_counter() - start)
+        legacy_size = _db_size(conn, legacy_path)
+        conn.close()
+        samples = []
+        for digest in probes:
+            cold = _drop_page_cache(legacy_path) and cold
+            probe = sqlite3.connect(legacy_path)
+            start = time.perf_counter()
+            probe.execute("SELECT file_path, file_hash FROM non_matching_hashes WHERE file_hash = ?",
+                          (digest,)).fetchall()
+            samples.append(time.perf_counter() - start)
+            probe.close()
+        legacy_lookup = statistics.median(samples) * 1000.0
+
+        compact_path = os.path.join(workdir, "compact.db")
+        db = DatabaseManager(compact_path)
+        start = time.perf_counter()
+        for offset in range(0, len(records), 2000):
+            db.save_records(records[offset:offset + 2000])
+        compact_insert = len(records) / (time.perf_counter() - start)
+        compact_size = _db_size(db.conn, compact_path)
+        samples = []
+        for digest in probes:
+            cold = _drop_page_cache(compact_path) and cold
+            db._local = threading.local()
+            db._reader()
+            start = time.perf_counter()
+            db.search_hash(digest)
+            samples.append(time.perf_counter() - start)
+        compact_lookup = statistics.median(samples) * 1000.0
+        db.conn.close()
+
+        # In-place migration of the legacy file (user_version 3 -> current)
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA user_version = 3")
+        conn.execute("CREATE TABLE search_history AS SELECT * FROM non_matching_hashes WHERE 0")
+        conn.execute("CREATE TABLE hash_audit (id INTEGER PRIMARY KEY, source_table TEXT, file_path TEXT, "
+                     "file_hash TEXT, extension TEXT, file_size INTEGER, mtime_ns INTEGER, inode INTEGER, "
+                     "device INTEGER, search_date TIMESTAMP, superseded_at TIMESTAMP)")
+        conn.commit()
+        conn.close()
+        start = time.perf_counter()
+        migrated = DatabaseManager(legacy_path)
+        migrate_time = time.perf_counter() - start
+        migrated_size = _db_size(migrated.conn, legacy_path)
+        migrated.conn.close()
+
+        print(f"rows: {len(records)}   lookups: {len(probes)}   cold page cache: {'yes' if cold else 'no (no posix_fadvise)'}")
+        print(f"{'layout':>10} {'db size':>12} {'insert rows/s':>15} {'cold lookup':>13}")
+        print(f"{'legacy':>10} {legacy_size / 1048576:>10.1f}MB {legacy_insert:>15.0f} {legacy_lookup:>11.3f}ms")
+        print(f"{'compact':>10} {compact_size / 1048576:>10.1f}MB {compact_insert:>15.0f} {compact_lookup:>11.3f}ms")
+        print(f"migration of the legacy file: {migrate_time:.1f}s, {legacy_size / 1048576:.1f}MB -> {migrated_size / 1048576:.1f}MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _lookup_us(func, hashes):
+    start = time.perf_counter()
+    for digest in hashes:
+        func(digest)
+    return (time.perf_counter() - start) / len(hashes) * 1e6
+
+
+def _cold_lookup_us(db, hashes, files):
+    # A long-running process whose pages were evicted: SQLite's and the OS page cache are dropped
+    # before every probe and the side file is unmapped, since mapped pages cannot be evicted
+    samples = []
+    for digest in hashes:
+        db._reader().execute("PRAGMA shrink_memory")
+        db.digests.close()
+        for name in files:
+            _drop_page_cache(name)
+        start = time.perf_counter()
+        db.search_hash(digest)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def bench_digests(args):
+    # Smart lookups through SQLite vs the mmap'd digest index, plus build and incremental refresh cost
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    try:
+        path = os.path.join(workdir, "digests.db")
+        writer = DatabaseManager(path, digest_index=False)
+        present = _fill_index(writer, args.rows)
+        present = [present[i % len(present)] for i in range(args.queries)]
+        missing = [os.urandom(32).hex() for _ in range(args.queries)]
+        sql = DatabaseManager(path, digest_index=False)
+        sql_hit, sql_miss = _lookup_us(sql.search_hash, present), _lookup_us(sql.search_hash, missing)
+
+        mapped = DatabaseManager(path, digest_index=True)
+        build = _timed(mapped.refresh_digest_index)
+        side_size = os.path.getsize(path + ".digests")
+        idx_hit, idx_miss = _lookup_us(mapped.search_hash, present), _lookup_us(mapped.search_hash, missing)
+        cold = present[:200], missing[:200]
+        files = (path, path + ".digests")
+        sql_cold = [_cold_lookup_us(sql, probes, files) for probes in cold]
+        idx_cold = [_cold_lookup_us(mapped, probes, files) for probes in cold]
+
+        # 1% of the files change before the next refresh
+        changed = max(args.rows // 100, 1)
+        writer.save_records([(f"/bench/dir{i % 1000}/file{i}.bin", os.urandom(32).hex(), ".bin", i, i + 1, i, 1)
+                             for i in range(changed)])
+        pending_hit = _lookup_us(mapped.search_hash, present)
+        pending_miss = _lookup_us(mapped.search_hash, missing)
+        refresh = _timed(mapped.refresh_digest_index)
+
+        print(f"rows: {args.rows}   lookups: {args.queries}   side file: {side_size / 1048576:.1f}MB")
+        print(f"{'lookup':>28} {'hit':>10} {'miss':>10} {'cold hit':>10} {'cold miss':>10}")
+        print(f"{'sqlite index':>28} {sql_hit:>8.1f}us {sql_miss:>8.1f}us {sql_cold[0]:>8.1f}us {sql_cold[1]:>8.1f}us")
+        print(f"{'digest index':>28} {idx_hit:>8.1f}us {idx_miss:>8.1f}us {idx_cold[0]:>8.1f}us {idx_cold[1]:>8.1f}us")
+        print(f"{'digest index, 1% pending':>28} {pending_hit:>8.1f}us {pending_miss:>8.1f}us")
+        print(f"full build: {build:.2f}s   incremental refresh ({changed} changed rows): {refresh:.2f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+_B64_TABLE = bytes(FuzzyHash.B64[b & 63].encode()[0] for b in range(256))
+
+
+def _random_fuzzy(block_size):
+    first, second = os.urandom(60).translate(_B64_TABLE), os.urandom(30).translate(_B64_TABLE)
+    return f"{block_size}:{first.decode()}:{second.decode()}"
+
+
+def _mutated_fuzzy(value, edits):
+    block_size, first, second = value.split(":")
+    first = list(first)
+    for _ in range(edits):
+        first[random.randrange(len(first))] = random.choice(FuzzyHash.B64)
+    return f"{block_size}:{''.join(first)}:{second}"
+
+
+def bench_similarity(args):
+    # Similar-file queries through the LSH buckets vs scoring every stored hash, as the index grows
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    random.seed(1)
+    try:
+        print(f"{'rows':>10} {'LSH query':>12} {'recall':>8} {'pairwise':>12}")
+        for size in args.sizes:
+            db = DatabaseManager(os.path.join(workdir, f"similar_{size}.db"))
+            samples = []
+            for offset in range(0, size, 20000):
+                rows = []
+                for i in range(offset, min(offset + 20000, size)):
+                    value = _random_fuzzy(random.choice((1024, 2048, 4096, 8192)))
+                    path = f"/bench/dir{i % 1000}/file{i}.bin"
+                    rows.append((path, os.urandom(32).hex(), ".bin", i, i, i, 1, {"ctph": value}))
+                    if i % max(size // 100, 1) == 0:
+                        samples.append((path, value))
+                db.save_records(rows)
+            queries = [(path, _mutated_fuzzy(value, args.edits))
+                       for path, value in (samples[i % len(samples)] for i in range(args.queries))]
+            found, times = 0, []
+            for path, query in queries:
+                start = time.perf_counter()
+                results = db.similar_files(query)
+                times.append(time.perf_counter() - start)
+                found += any(row[0] == path for row in results)
+            pairwise = "-"
+            if size <= args.pairwise_max:
+                stored = [value for value, in db.conn.execute("SELECT digest FROM file_digests WHERE algorithm = 'ctph'")]
+                start = time.perf_counter()
+                for _, query in queries[:3]:
+                    [FuzzyHash.compare(query, value) for value in stored]
+                pairwise = f"{(time.perf_counter() - start) / 3 * 1000:>10.1f}ms"
+            db.conn.close()
+            print(f"{size:>10} {statistics.median(times) * 1000:>10.2f}ms {found / len(queries):>8.0%} {pairwise:>12}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_ioc(args):
+    # Resolving an IOC list against the index: one search_hash per IOC vs one set-based search_hashes
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    try:
+        db = DatabaseManager(os.path.join(workdir, "ioc.db"), digest_index=False)
+        present = _fill_index(db, args.rows)
+        iocs = [os.urandom(32).hex() for _ in range(args.iocs - len(present))] + present
+        start = time.perf_counter()
+        single = sum(len(db.search_hash(ioc)) for ioc in iocs)
+        per_ioc = time.perf_counter() - start
+        start = time.perf_counter()
+        batch = len(db.search_hashes(iocs))
+        set_based = time.perf_counter() - start
+        print(f"rows: {args.rows}   iocs: {len(iocs)}   hits: {single} / {batch}")
+        print(f"one query per IOC: {per_ioc * 1000:.1f}ms   one set-based query: {set_based * 1000:.1f}ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _make_tree(root, count, per_dir=1000):
+    for i in range(count):
+        directory = os.path.join(root, f"dir{i // per_dir}")
+        if i % per_dir == 0:
+            os.makedirs(directory)
+        with open(os.path.join(directory, f"file{i}.bin"), "wb") as f:
+            f.write(i.to_bytes(8, "little"))
+
+
+def _scan_once(files):
+    # Runs in a child process so that ru_maxrss is the peak of this scan alone
+    import resource
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    try:
+        tree = os.path.join(workdir, "tree")
+        _make_tree(tree, files)
+        os.chdir(workdir)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        thread = LocalSearchThread([tree], os.urandom(32).hex(), ["all"], [])
+        start = time.perf_counter()
+        thread.run()
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        print(f"{files:>12} {peak / scale:>10.1f}MB {(peak - baseline) / scale:>10.1f}MB "
+              f"{files / elapsed:>10.0f}/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_scan(args):
+    # Peak RSS of a full disk scan vs file count; each size is scanned in a fresh process
+    if args.single:
+        _scan_once(args.single)
+        return
+    print(f"{'files':>12} {'peak RSS':>12} {'scan growth':>12} {'rate':>12}")
+    sys.stdout.flush()
+    for files in args.files:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "scan", "--single", str(files)], check=True)
+
+
+def bench_walk(args):
+    # Walk-only rate (no hashing) vs walker thread count; every count must list the same files
+    workdir = None
+    root = args.root
+    if not root:
+        workdir = tempfile.mkdtemp(prefix="fsbench_")
+        root = os.path.join(workdir, "tree")
+        _make_tree(root, args.files, per_dir=args.per_dir)
+    try:
+        print(f"{'threads':>8} {'dirs':>10} {'entries':>10} {'dirs/s':>12} {'entries/s':>12}")
+        expected = None
+        for threads in args.threads:
+            walker = DirectoryWalker([root], lambda e: not e.is_symlink(), lambda e: e.is_file(), threads)
+            found = sorted(entry.path for entry in walker.walk())
+            if expected is None:
+                expected = found
+            elif found != expected:
+                print(f"{threads:>8} walked a different set of files ({len(found)} vs {len(expected)})")
+            elapsed = max(walker.elapsed, 1e-9)
+            print(f"{threads:>8} {walker.dirs:>10} {walker.entries:>10} {walker.dirs / elapsed:>12.0f} "
+                  f"{walker.entries / elapsed:>12.0f}")
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_exclude(args):
+    # Per-directory exclusion check: commonpath against every rule vs the compiled matcher
+    paths = [f"/srv/share{i % 7}/dept{i % 13}/project{i % 97}/src/module{i}" for i in range(args.paths)]
+    print(f"{'rules':>8} {'commonpath':>12} {'matcher':>12}")
+    for count in args.rules:
+        rules = [f"/srv/share{i % 7}/excluded{i}" for i in range(count * 8 // 10)]
+        rules += [f"**/vendor{i}" for i in range(count // 10)] + [f"*.tmp{i}" for i in range(count - len(rules) - count // 10)]
+        legacy = [os.path.normpath(r) for r in rules if r.startswith("/")]
+        start = time.perf_counter()
+        for path in paths:
+            current = os.path.normpath(path)
+            any(os.path.commonpath([current, excluded]) == excluded for excluded in legacy)
+        before = (time.perf_counter() - start) / len(paths) * 1e6
+        matcher = ExclusionMatcher(rules)
+        start = time.perf_counter()
+        for path in paths:
+            matcher.excluded(path)
+        after = (time.perf_counter() - start) / len(paths) * 1e6
+        print(f"{count:>8} {before:>10.1f}us {after:>10.1f}us")
+
+
+def bench_hashing(args):
+    # Warm-cache hashing throughput and buffer allocations per GB for every FileHasher strategy
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    strategies = [s for s in FileHasher.STRATEGIES if s != "auto"] + ["auto"]
+    try:
+        print(f"{'file size':>10} {'strategy':>12} {'MB/s':>10} {'allocs/GB':>10}")
+        for size_kb in args.sizes_kb:
+            size = size_kb * 1024
+            count = max(1, args.total_mb * 1024 * 1024 // size)
+            paths = []
+            block = os.urandom(min(size, 1 << 20))
+            for i in range(count):
+                path = os.path.join(workdir, f"f{size_kb}_{i}.bin")
+                with open(path, "wb") as f:
+                    for _ in range(size // len(block)):
+                        f.write(block)
+                    f.write(block[:size % len(block)])
+                paths.append(path)
+            total = size * count
+            for strategy in strategies:
+                hasher = FileHasher(strategy)
+                hasher.hash_file(paths[0])
+                hasher.allocations = 0
+                start = time.perf_counter()
+                for path in paths:
+                    hasher.hash_file(path)
+                elapsed = time.perf_counter() - start
+                label = strategy if hasher.strategy == strategy else f"{strategy}*"
+                print(f"{size_kb:>8}KB {label:>12} {total / elapsed / 1048576:>10.0f} "
+                      f"{hasher.allocations * (1 << 30) / total:>10.0f}")
+            for path in paths:
+                os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _read_only(path, buf):
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while f.readinto(view):
+            pass
+
+
+def bench_algorithms(args):
+    # Warm-cache cost of each extra digest on top of plain reads and SHA-256, all computed from one read
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    sets = [("sha256",), ("sha256", "md5"), ("sha256", "sha1"), ("sha256", "blake2b"),
+            ("sha256", "md5", "sha1", "blake2b"), ("sha256", "ctph")]
+    try:
+        size = args.file_mb << 20
+        count = max(1, args.total_mb // args.file_mb)
+        paths = []
+        block = os.urandom(1 << 20)
+        for i in range(count):
+            path = os.path.join(workdir, f"f{i}.bin")
+            with open(path, "wb") as f:
+                for _ in range(args.file_mb):
+                    f.write(block)
+            paths.append(path)
+        total = size * count
+        buf = bytearray(FileHasher.CHUNK)
+        _read_only(paths[0], buf)
+        start = time.perf_counter()
+        for path in paths:
+            _read_only(path, buf)
+        io_seconds = time.perf_counter() - start
+        print(f"{'digests':>28} {'MB/s':>10} {'s/GB':>8} {'over I/O':>10}")
+        print(f"{'read only':>28} {total / io_seconds / 1048576:>10.0f} {io_seconds * (1 << 30) / total:>8.2f} "
+              f"{'':>10}")
+        for algorithms in sets:
+            hasher = FileHasher(algorithms=algorithms)
+            hasher.hash_digests(paths[0])
+            start = time.perf_counter()
+            for path in paths:
+                hasher.hash_digests(path)
+            elapsed = time.perf_counter() - start
+            print(f"{'+'.join(algorithms):>28} {total / elapsed / 1048576:>10.0f} "
+                  f"{elapsed * (1 << 30) / total:>8.2f} {(elapsed - io_seconds) * (1 << 30) / total:>9.2f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _resident_pages(path):
+    # (resident, total) pages of a file in the page cache, via mincore(2); None where unsupported
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if not hasattr(libc, "mincore"):
+        return None
+    libc.mmap.restype = ctypes.c_void_p
+    libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+    libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+    libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+    size = os.path.getsize(path)
+    pages = (size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+    if not pages:
+        return 0, 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        addr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+        if addr is None or addr == ctypes.c_void_p(-1).value:
+            return None
+        try:
+            vec = (ctypes.c_ubyte * pages)()
+            if libc.mincore(addr, size, vec) != 0:
+                return None
+            return sum(v & 1 for v in vec), pages
+        finally:
+            libc.munmap(addr, size)
+    finally:
+        os.close(fd)
+
+
+def _residency(paths):
+    resident = total = 0
+    for path in paths:
+        counts = _resident_pages(path)
+        if counts is None:
+            return float("nan")
+        resident += counts[0]
+        total += counts[1]
+    return 100.0 * resident / max(total, 1)
+
+
+def bench_pagecache(args):
+    # Page-cache footprint of hashing a corpus: normal reads vs cache_friendly (fadvise), plus the
+    # throughput actually reached under a RateLimiter
+    if not hasattr(os, "posix_fadvise"):
+        print("posix_fadvise is not available on this platform")
+        return
+    workdir = tempfile.mkdtemp(prefix="fsbench_")
+    try:
+        block = os.urandom(1 << 20)
+        corpus = []
+        for i in range(max(1, args.total_mb // 4)):
+            path = os.path.join(workdir, f"corpus{i}.bin")
+            with open(path, "wb") as f:
+                for _ in range(4):
+                    f.write(block)
+                # Dirty pages cannot be dropped, so the corpus is flushed before every run evicts it
+                f.flush()
+                os.fsync(f.fileno())
+            corpus.append(path)
+        total = 4 * len(corpus) * 1048576
+        print(f"{'mode':>16} {'MB/s':>8} {'corpus cached after':>20}")
+        for mode in ("normal", "cache_friendly"):
+            for path in corpus:
+                _drop_page_cache(path)
+            before = _residency(corpus)
+            hasher = FileHasher(cache_friendly=mode == "cache_friendly")
+            start = time.perf_counter()
+            for path in corpus:
+                hasher.hash_file(path)
+            elapsed = time.perf_counter() - start
+            print(f"{mode:>16} {total / elapsed / 1048576:>8.0f} {_residency(corpus):>19.1f}%"
+                  f"   (before: {before:.1f}%)")
+        if args.limit_mb:
+            limited = corpus[:max(1, min(len(corpus), args.limit_mb // 2))]
+            hasher = FileHasher(limiter=RateLimiter(args.limit_mb * 1048576))
+            start = time.perf_counter()
+            for path in limited:
+                hasher.hash_file(path)
+            elapsed = time.perf_counter() - start
+            print(f"rate limit {args.limit_mb} MB/s: reached {4 * len(limited) / elapsed:.1f} MB/s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search engine benchmarks")
+    sub = parser.add_subparsers(dest="scenario", required=True)
+    p_lookup = sub.add_parser("lookup", help="DB hash lookup latency vs table size")
+    p_lookup.add_argument("--sizes", type=_int_list, default=[10000, 100000, 1000000])
+    p_lookup.add_argument("--queries", type=int, default=200)
+    p_lookup.set_defaults(func=bench_lookup)
+    p_schema = sub.add_parser("schema", help="DB size, insert rate and cold lookups: legacy vs compact layout")
+    p_schema.add_argument("--rows", type=int, default=200000)
+    p_schema.add_argument("--queries", type=int, default=200)
+    p_schema.set_defaults(func=bench_schema)
+    p_digests = sub.add_parser("digests", help="Smart lookups: SQLite index vs mmap'd digest index")
+    p_digests.add_argument("--rows", type=int, default=1000000)
+    p_digests.add_argument("--queries", type=int, default=20000)
+    p_digests.set_defaults(func=bench_digests)
+    p_similarity = sub.add_parser("similarity", help="Similar-file query time and recall: LSH buckets vs pairwise")
+    p_similarity.add_argument("--sizes", type=_int_list, default=[10000, 100000, 1000000])
+    p_similarity.add_argument("--queries", type=int, default=100)
+    p_similarity.add_argument("--edits", type=int, default=3, help="Pieces changed in each query's signature")
+    p_similarity.add_argument("--pairwise-max", type=int, default=100000)
+    p_similarity.set_defaults(func=bench_similarity)
+    p_ioc = sub.add_parser("ioc", help="IOC list resolution: per-hash queries vs one set-based query")
+    p_ioc.add_argument("--rows", type=int, default=1000000)
+    p_ioc.add_argument("--iocs", type=int, default=5000)
+    p_ioc.set_defaults(func=bench_ioc)
+    p_scan = sub.add_parser("scan", help="Peak RSS of a disk scan vs file count (POSIX only)")
+    p_scan.add_argument("--files", type=_int_list, default=[10000, 100000, 1000000])
+    p_scan.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    p_scan.set_defaults(func=bench_scan)
+    p_walk = sub.add_parser("walk", help="Directory walk rate (dirs/s, entries/s) vs walker threads")
+    p_walk.add_argument("--root", help="Existing tree to walk (read-only); a synthetic tree by default")
+    p_walk.add_argument("--files", type=int, default=200000)
+    p_walk.add_argument("--per-dir", type=int, default=20)
+    p_walk.add_argument("--threads", type=_int_list, default=[1, 2, 4, 8, 16])
+    p_walk.set_defaults(func=bench_walk)
+    p_exclude = sub.add_parser("exclude", help="Exclusion check cost per directory vs number of rules")
+    p_exclude.add_argument("--rules", type=_int_list, default=[10, 100, 300, 1000])
+    p_exclude.add_argument("--paths", type=int, default=2000)
+    p_exclude.set_defaults(func=bench_exclude)
+    p_hashing = sub.add_parser("hashing", help="FileHasher strategies: MB/s and buffer allocations per GB")
+    p_hashing.add_argument("--sizes-kb", type=_int_list, default=[16, 1024, 262144])
+    p_hashing.add_argument("--total-mb", type=int, default=1024)
+    p_hashing.set_defaults(func=bench_hashing)
+    p_algorithms = sub.add_parser("algorithms", help="Single-pass multi-digest cost (MD5, SHA-1, BLAKE2b) over I/O")
+    p_algorithms.add_argument("--file-mb", type=int, default=64)
+    p_algorithms.add_argument("--total-mb", type=int, default=1024)
+    p_algorithms.set_defaults(func=bench_algorithms)
+    p_pagecache = sub.add_parser("pagecache", help="Page-cache residency after hashing: normal vs cache_friendly")
+    p_pagecache.add_argument("--total-mb", type=int, default=512)
+    p_pagecache.add_argument("--limit-mb", type=int, default=50, help="Rate limit to check (0 skips)")
+    p_pagecache.set_defaults(func=bench_pagecache)
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
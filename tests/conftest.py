@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def connect():
+    # Searches emit from their hash workers (or from run() on a plain thread); with no event loop
+    # in the tests a queued delivery would never arrive, so slots are called directly
+    QtCore = pytest.importorskip("PyQt5.QtCore")
+
+    def direct(signal, slot):
+        signal.connect(slot, QtCore.Qt.DirectConnection)
+
+    return direct
+
+
+@pytest.fixture
+def search(tmp_path, monkeypatch, connect):
+    # run(root, target, **options) -> (thread, sorted hit paths, scan summary); the index lives in tmp_path
+    ForensicX = pytest.importorskip("ForensicX")
+    monkeypatch.chdir(tmp_path)
+
+    def run(root, target, extensions=("all",), excluded=(), **kwargs):
+        hits = []
+        summaries = []
+        errors = []
+        worker = ForensicX.LocalSearchThread([str(root)], target, list(extensions), list(excluded), **kwargs)
+        connect(worker.result_found, lambda path, digest: hits.append(path))
+        connect(worker.scan_summary, summaries.append)
+        connect(worker.error_occurred, errors.append)
+        worker.run()
+        assert not errors
+        return worker, sorted(hits), summaries[0]
+
+    return run
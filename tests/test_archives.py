@@ -0,0 +1,53 @@
+import hashlib
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+ForensicX = pytest.importorskip("ForensicX")
+
+
+def test_members_of_nested_archives_are_searched(tmp_path, monkeypatch, search):
+    root = tmp_path / "evidence"
+    root.mkdir()
+    secret = b"exfiltrated payload" * 1000
+    inner = io.BytesIO()
+    with tarfile.open(fileobj=inner, mode="w:gz") as tar:
+        info = tarfile.TarInfo("docs/secret.bin")
+        info.size = len(secret)
+        tar.addfile(info, io.BytesIO(secret))
+    with zipfile.ZipFile(root / "outer.zip", "w") as archive:
+        archive.writestr("inner.tar.gz", inner.getvalue())
+        archive.writestr("readme.txt", b"nothing here")
+    target = hashlib.sha256(secret).hexdigest()
+    expected = [str(root / "outer.zip") + "!inner.tar.gz!docs/secret.bin"]
+
+    assert search(root, target)[1] == []
+    assert search(root, target, archive_depth=1)[1] == []
+    _, hits, summary = search(root, target, archive_depth=2)
+    assert hits == expected
+    assert summary["archives"] == 1
+    # The container is unchanged: its member digests come from the cache, nothing is read
+    monkeypatch.setattr(ForensicX.LocalSearchThread, "_read_archive", lambda *args: pytest.fail("archive read"))
+    _, hits, summary = search(root, target, archive_depth=2)
+    assert hits == expected
+    assert summary["members"] == 3
+
+
+def test_members_are_hashed_with_the_container_and_kept_as_hits(tmp_path, monkeypatch, search):
+    root = tmp_path / "evidence"
+    root.mkdir()
+    secret = b"staged for upload" * 500
+    with zipfile.ZipFile(root / "loot.zip", "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("notes.txt", b"nothing here")
+        archive.writestr("stage/secret.bin", secret)
+    # The container's own digests come from the read of its members, never from a second read
+    monkeypatch.setattr(ForensicX.FileHasher, "hash_digests", lambda *args: pytest.fail("second read"))
+    worker, hits, summary = search(root, hashlib.md5(secret).hexdigest(), archive_depth=1)
+    member = str(root / "loot.zip") + "!stage/secret.bin"
+    assert hits == [member]
+    assert summary["members"] == 2
+    assert [path for path, _ in worker.db.session_hits(worker.session_id)] == [member]
+    container = hashlib.sha256((root / "loot.zip").read_bytes()).hexdigest()
+    assert [path for path, _ in worker.db.search_hash(container)] == [str(root / "loot.zip")]
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+ForensicX = pytest.importorskip("ForensicX")
+
+
+def _find(root, **kwargs):
+    clusters = []
+    summaries = []
+    finder = ForensicX.DuplicateFinderThread([str(root)], ["all"], [], **kwargs)
+    finder.clusters_ready.connect(clusters.extend)
+    finder.scan_summary.connect(summaries.append)
+    finder.error_occurred.connect(pytest.fail)
+    finder.run()
+    return clusters, summaries[0]
+
+
+def test_clusters_by_size_edges_and_full_hash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "share"
+    (root / "a").mkdir(parents=True)
+    (root / "b").mkdir()
+    big = os.urandom(300 * 1024)
+    # Same size, first and last 64 KB equal: only the full hash tells them apart
+    twin = bytearray(big)
+    twin[150 * 1024] ^= 0xFF
+    small = os.urandom(1000)
+    for path, data in (("a/big1", big), ("b/big2", big), ("a/big3", big), ("a/twin", bytes(twin)),
+                       ("a/small1", small), ("b/small2", small), ("a/unique", os.urandom(1000)),
+                       ("a/empty1", b""), ("b/empty2", b"")):
+        (root / path).write_bytes(data)
+
+    clusters, summary = _find(root)
+    groups = sorted(sorted(os.path.relpath(p, root) for p in c["paths"]) for c in clusters)
+    assert groups == [[os.path.join("a", "big1"), os.path.join("a", "big3"), os.path.join("b", "big2")],
+                      [os.path.join("a", "small1"), os.path.join("b", "small2")]]
+    wasted = {len(c["paths"]): c["wasted"] for c in clusters}
+    assert wasted == {3: 2 * len(big), 2: len(small)}
+    assert summary["full_hashed"] == 4
+
+    # Unchanged files: the full digests come from the index
+    clusters, summary = _find(root)
+    assert len(clusters) == 2
+    assert summary["full_hashed"] == 0
@@ -0,0 +1,35 @@
+import hashlib
+import os
+
+
+def test_hit_limit_stops_and_resume_finds_the_rest(tmp_path, search):
+    root = tmp_path / "share"
+    payload = b"known bad" * 512
+    for d in range(10):
+        folder = root / f"d{d}"
+        folder.mkdir(parents=True)
+        (folder / "copy.bin").write_bytes(payload)
+        for i in range(20):
+            (folder / f"f{i}.bin").write_bytes(os.urandom(2048))
+    target = hashlib.sha256(payload).hexdigest()
+
+    _, hits, summary = search(root, target, workers=1, max_hits=1, resume=True)
+    assert len(hits) == 1
+    assert summary["stop_reason"] == "hits"
+    assert summary["frontier"] > 0
+    assert summary["frontier_dirs"]
+
+    _, hits, summary = search(root, target, workers=1, resume=True)
+    assert summary["resumed"]
+    assert summary["stop_reason"] is None
+    assert hits == sorted(str(root / f"d{d}" / "copy.bin") for d in range(10))
+
+
+def test_byte_budget_ends_the_search(tmp_path, search):
+    root = tmp_path / "share"
+    root.mkdir()
+    for i in range(50):
+        (root / f"f{i}.bin").write_bytes(os.urandom(8192))
+    _, _, summary = search(root, hashlib.sha256(b"absent").hexdigest(), workers=1, byte_budget=8192 * 5)
+    assert summary["stop_reason"] == "bytes"
+    assert summary["files"] < 50
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+ForensicX = pytest.importorskip("ForensicX")
+
+
+def test_root_rule_excludes_every_path():
+    matcher = ForensicX.ExclusionMatcher([os.sep])
+    assert matcher.excluded(os.path.join(os.sep, "a"))
+    assert matcher.excluded(os.path.join(os.sep, "a", "b.txt"), is_dir=False)
+
+
+def test_include_wins_over_root_rule():
+    included = os.path.join(os.sep, "cases", "open")
+    matcher = ForensicX.ExclusionMatcher([os.sep, "+" + included])
+    assert not matcher.excluded(os.path.join(os.sep, "cases"))
+    assert not matcher.excluded(os.path.join(included, "report.pdf"), is_dir=False)
+    assert matcher.excluded(os.path.join(os.sep, "home"))
+
+
+def test_path_name_and_glob_rules():
+    matcher = ForensicX.ExclusionMatcher([os.path.join(os.sep, "srv", "cache"), "node_modules", "*.tmp"])
+    assert matcher.excluded(os.path.join(os.sep, "srv", "cache", "x"))
+    assert not matcher.excluded(os.path.join(os.sep, "srv", "cached"))
+    assert matcher.excluded(os.path.join(os.sep, "app", "node_modules", "lib"))
+    assert matcher.excluded(os.path.join(os.sep, "tmp", "a.tmp"), is_dir=False)
+    assert not matcher.excluded(os.path.join(os.sep, "tmp", "a.txt"), is_dir=False)
+
+
+def test_name_rules_only_match_below_the_walk_root():
+    root = os.path.join(os.sep, "work", "build", "case")
+    matcher = ForensicX.ExclusionMatcher(["build", "case/**/out", "*.tmp"], [root])
+    assert not matcher.excluded(os.path.join(root, "docs"))
+    assert not matcher.excluded(os.path.join(root, "out"))
+    assert matcher.excluded(os.path.join(root, "src", "build"))
+    assert matcher.excluded(os.path.join(root, "case", "a", "out"))
+    assert matcher.excluded(os.path.join(root, "a.tmp"), is_dir=False)
@@ -0,0 +1,80 @@
+import os
+import threading
+
+import pytest
+
+ForensicX = pytest.importorskip("ForensicX")
+
+
+def _index(db, path, device):
+    st = os.stat(path) if os.path.exists(path) else None
+    db.save_records([(path, "ab" * 32, ".txt", st.st_size if st else 3, st.st_mtime_ns if st else 1,
+                      st.st_ino if st else 1, device)])
+
+
+def _count(db):
+    return db.conn.execute("SELECT COUNT(*) FROM file_index").fetchone()[0]
+
+
+def _prune(db):
+    reports = []
+    worker = ForensicX.MaintenanceThread(db, max_workers=2)
+    worker.report_ready.connect(reports.append)
+    worker.error_occurred.connect(pytest.fail)
+    worker.run()
+    return reports[0]
+
+
+def test_prune_keeps_rows_of_missing_mount(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = ForensicX.DatabaseManager()
+    device = os.stat(tmp_path).st_dev
+    # An unmounted volume: neither the mount point nor anything under it exists any more, and the
+    # nearest surviving ancestor lives on another device than the one recorded for the rows
+    mount = tmp_path / "media" / "evidence"
+    for name in ("a.txt", "b.txt"):
+        _index(db, str(mount / "case" / name), device + 1)
+    _prune(db)
+    assert _count(db) == 2
+
+
+def test_prune_removes_rows_of_deleted_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = ForensicX.DatabaseManager()
+    folder = tmp_path / "data"
+    folder.mkdir()
+    kept = folder / "kept.txt"
+    kept.write_text("abc")
+    _index(db, str(kept), os.stat(kept).st_dev)
+    # Same device as its surviving parent: the directory really was deleted
+    for name in ("a.txt", "b.txt"):
+        _index(db, str(tmp_path / "gone" / name), os.stat(tmp_path).st_dev)
+    _index(db, str(folder / "removed.txt"), os.stat(folder).st_dev)
+    _prune(db)
+    assert _count(db) == 1
+
+
+def test_digest_index_lookups_survive_a_rewrite(tmp_path):
+    index = ForensicX.DigestIndex(str(tmp_path / "file_search.db.digests"))
+    entries = sorted((os.urandom(32), file_id) for file_id in range(2000))
+    index.write(iter(entries), len(entries))
+    digest, file_id = entries[1000]
+    errors = []
+    done = threading.Event()
+
+    def probe():
+        try:
+            while not done.is_set():
+                assert index.lookup(digest) == [file_id]
+        except Exception as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=probe)
+    reader.start()
+    try:
+        for _ in range(20):
+            index.write(iter(entries), len(entries))
+    finally:
+        done.set()
+        reader.join()
+    assert not errors
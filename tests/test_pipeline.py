@@ -0,0 +1,41 @@
+import hashlib
+import threading
+import time
+
+import pytest
+
+ForensicX = pytest.importorskip("ForensicX")
+
+
+def test_queues_stay_bounded_and_cancel_drops_queued_work(tmp_path, monkeypatch, connect):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "tree"
+    for d in range(20):
+        folder = root / f"d{d}"
+        folder.mkdir(parents=True)
+        for i in range(100):
+            (folder / f"f{i}.bin").write_bytes(b"%d-%d" % (d, i))
+    summaries = []
+    errors = []
+    search = ForensicX.LocalSearchThread([str(root)], hashlib.sha256(b"absent").hexdigest(), ["all"], [],
+                                         workers=2)
+    connect(search.scan_summary, summaries.append)
+    connect(search.error_occurred, errors.append)
+    # Hold the hash workers so that the walk runs into the bounded queue
+    search._pause_event.clear()
+    runner = threading.Thread(target=search.run)
+    runner.start()
+    deadline = time.monotonic() + 10
+    while not search.work_queue.full() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert search.work_queue.full()
+    time.sleep(0.1)
+    assert search.work_queue.qsize() <= search.work_queue.maxsize
+    search.stop()
+    assert search.work_queue.qsize() <= search.max_workers
+    search._pause_event.set()
+    runner.join(10)
+    assert not runner.is_alive()
+    assert not errors
+    # Only the files already in the workers' hands were hashed
+    assert summaries[0]["files"] <= search.max_workers
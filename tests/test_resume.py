@@ -0,0 +1,65 @@
+import hashlib
+import os
+
+import pytest
+
+ForensicX = pytest.importorskip("ForensicX")
+
+
+def _tree(root, dirs=6, files=20):
+    for d in range(dirs):
+        for sub in ("", "sub"):
+            folder = root / f"d{d}" / sub
+            folder.mkdir(parents=True, exist_ok=True)
+            for i in range(files):
+                (folder / f"f{i}.bin").write_bytes(os.urandom(4096))
+    return dirs * 2 * files
+
+
+def _scan(root, target, **kwargs):
+    summaries = []
+    worker = ForensicX.LocalSearchThread([str(root)], target, ["all"], [], **kwargs)
+    worker.scan_summary.connect(summaries.append)
+    worker.error_occurred.connect(pytest.fail)
+    worker.run()
+    return worker, summaries[0]
+
+
+def test_resumed_scan_counts_every_file_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "tree"
+    total = _tree(root)
+    target = hashlib.sha256(b"not in the tree").hexdigest()
+    worker, summary = _scan(root, target, resume=True, byte_budget=100_000)
+    assert summary["stop_reason"] == "bytes"
+    assert summary["frontier"]
+    for _ in range(total):
+        worker, summary = _scan(root, target, resume=True, byte_budget=100_000)
+        assert summary["resumed"]
+        if not summary["stop_reason"]:
+            break
+    assert not summary["stop_reason"]
+    assert summary["files"] == total
+    db = worker.db
+    files_scanned, = db.conn.execute("SELECT files_scanned FROM search_sessions WHERE id = ?",
+                                     (worker.session_id,)).fetchone()
+    assert files_scanned == total
+    assert db.conn.execute("SELECT COUNT(*) FROM file_index").fetchone()[0] == total
+    assert db.resumable_session(target, [str(root)], worker.scan_key) is None
+
+
+def test_changed_filters_start_a_new_scan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "tree"
+    _tree(root)
+    target = hashlib.sha256(b"not in the tree").hexdigest()
+    worker, summary = _scan(root, target, resume=True, byte_budget=100_000)
+    assert summary["stop_reason"] == "bytes"
+    stopped = worker.session_id
+    # Directories finished under the old filters may hold files the new ones select
+    worker, summary = _scan(root, target, resume=True, archive_depth=1)
+    assert not summary["resumed"]
+    assert worker.session_id != stopped
+    worker, summary = _scan(root, target, resume=True, byte_budget=100_000)
+    assert summary["resumed"]
+    assert worker.session_id == stopped
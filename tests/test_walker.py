@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+ForensicX = pytest.importorskip("ForensicX")
+
+
+def _tree(root):
+    for d in range(8):
+        for sub in ("", "inner", "skip", os.path.join("inner", "node_modules")):
+            folder = root / f"d{d}" / sub
+            folder.mkdir(parents=True, exist_ok=True)
+            for i in range(5):
+                (folder / f"f{i}.txt").write_text("x")
+                (folder / f"f{i}.log").write_text("x")
+
+
+def _expected(root):
+    found = []
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in ("skip", "node_modules")]
+        found.extend(os.path.join(directory, name) for name in files if name.endswith(".txt"))
+    return sorted(found)
+
+
+def _listing_order(directory):
+    files = []
+    subdirs = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir():
+                if entry.name not in ("skip", "node_modules"):
+                    subdirs.append(entry.path)
+            elif entry.name.endswith(".txt"):
+                files.append(entry.path)
+    yield from files
+    for subdir in subdirs:
+        yield from _listing_order(subdir)
+
+
+def _search(root):
+    excluded = [str(root / f"d{d}" / "skip") for d in range(8)] + ["node_modules"]
+    return ForensicX.LocalSearchThread([str(root)], "ab" * 32, [".txt"], excluded)
+
+
+def test_parallel_walk_keeps_the_filters(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "tree"
+    _tree(root)
+    search = _search(root)
+    walker = ForensicX.DirectoryWalker([str(root)], search._wanted_dir, search._wanted_file, threads=8)
+    paths = [entry.path for entry in walker.walk()]
+    assert sorted(paths) == _expected(root)
+    assert len(paths) == len(set(paths))
+    assert walker.dirs == 1 + 8 * 2
+
+
+def test_single_thread_walk_is_deterministic(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "tree"
+    _tree(root)
+    expected = list(_listing_order(str(root)))
+    for _ in range(3):
+        search = _search(root)
+        walker = ForensicX.DirectoryWalker([str(root)], search._wanted_dir, search._wanted_file, threads=1)
+        assert [entry.path for entry in walker.walk()] == expected
+    assert sorted(expected) == _expected(root)
+
+
+def test_followed_links_keep_only_pending_hardlinks(tmp_path, search):
+    root = tmp_path / "tree"
+    (root / "data").mkdir(parents=True)
+    for i in range(10):
+        (root / "data" / f"f{i}.bin").write_bytes(os.urandom(64))
+    os.link(root / "data" / "f0.bin", root / "data" / "copy.bin")
+    # A link back up the tree and a second path to the same directory are walked once
+    os.symlink(root, root / "data" / "loop")
+    os.symlink(root / "data", root / "alias")
+    worker, _, summary = search(root, "ab" * 32, follow_symlinks=True, workers=1)
+    assert summary["files"] == 11
+    assert summary["inode_shared"] == 1
+    assert worker._inodes == {}
+
+
+def test_workers_pinned_per_mount(tmp_path, search):
+    root = tmp_path / "tree"
+    root.mkdir()
+    (root / "a.bin").write_bytes(b"a" * 64)
+    assert ForensicX.parse_device_workers("") is None
+    assert ForensicX.parse_device_workers("4") == 4
+    assert ForensicX.parse_device_workers(f"{root}=2; bad; /other=0") == {str(root): 2}
+    worker, _, summary = search(root, "ab" * 32, workers=ForensicX.parse_device_workers(f"{root}=2"))
+    gate, = worker._device_slots.values()
+    assert gate.name == ForensicX.mount_point(str(root))
+    assert (gate.limit, gate.tune) == (2, False)
+    assert summary["workers"][gate.name][0] == 2
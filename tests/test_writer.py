@@ -0,0 +1,44 @@
+import pytest
+
+ForensicX = pytest.importorskip("ForensicX")
+
+
+def _writer(db):
+    # Nothing is committed on its own during the test: only close() flushes
+    writer = ForensicX.RecordWriter(db, batch_size=10 ** 6, flush_interval=3600)
+    writer.start()
+    return writer
+
+
+def test_close_flushes_queued_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = ForensicX.DatabaseManager()
+    session_id = db.start_session("ab" * 32, [str(tmp_path)])
+    writer = _writer(db)
+    for i in range(50):
+        writer.put(str(tmp_path / f"f{i}.txt"), f"{i:064x}", ".txt", (i, 1, i + 1, 1))
+    writer.put(str(tmp_path / "hit.txt"), "ab" * 32, ".txt", (3, 1, 99, 1), session_id=session_id)
+    writer.frontier(session_id, [str(tmp_path)], [(str(tmp_path), 51)])
+    writer.close()
+    assert writer.error is None
+    assert writer.written == 51
+    assert db.conn.execute("SELECT COUNT(*) FROM file_index").fetchone()[0] == 51
+    assert [path for path, _ in db.session_hits(session_id)] == [str(tmp_path / "hit.txt")]
+    assert db.load_frontier(session_id) == ([], {str(tmp_path)})
+
+
+def test_failed_write_keeps_directory_pending(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = ForensicX.DatabaseManager()
+    session_id = db.start_session("ab" * 32, [str(tmp_path)])
+
+    def fail(*args, **kwargs):
+        raise Exception("Database error: disk I/O error")
+
+    monkeypatch.setattr(db, "save_records", fail)
+    writer = _writer(db)
+    writer.put(str(tmp_path / "a.txt"), "cd" * 32, ".txt", (1, 1, 1, 1))
+    writer.frontier(session_id, [str(tmp_path)], [(str(tmp_path), 1)])
+    writer.close()
+    assert writer.error
+    assert db.load_frontier(session_id) == ([str(tmp_path)], {str(tmp_path)})